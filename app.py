@@ -1,26 +1,69 @@
 import os
+import json
+import uuid
+import atexit
 from flask import (
-    Flask, render_template, request, jsonify, url_for,
-    redirect, flash, send_from_directory
+    Flask, Response, render_template, request, jsonify, url_for,
+    redirect, flash, send_file, send_from_directory, session
+)
+from werkzeug.exceptions import RequestEntityTooLarge
+from progress import progress_store, FINAL_PHASES
+from jobs import (
+    start_job_workers,
+    stop_job_workers,
+    submit_job,
+    get_job,
+    cancel_job,
+    COMPLETED
 )
-from progress import progress_data
 from methods import (
-    clear_folder,
-    reset_database,
     validate_questions,
-    generate_questions,
     handle_file_upload,
     handle_youtube_upload,
+    start_rag_clients,
+    stop_rag_clients,
+    run_quiz_job,
+    report_quiz_job_cancelled,
+    job_output_dir,
+    export_quiz,
+    get_cache_stats,
+    estimate_quiz_seconds,
+    export_transcript_pdf,
+    get_tenant_corpus,
+    create_corpus,
+    list_corpora,
+    activate_corpus,
 )
 from constants import (
     CHROMA_FOLDER_PATH,
-    DOWNLOAD_FOLDER_PATH,
     UPLOAD_FOLDER_PATH,
+    JOBS_DB_PATH,
+    JOB_WORKERS,
+    MAX_CONTENT_LENGTH,
+    PROGRESS_HEARTBEAT_SECONDS,
     question_types
 )
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'
+# Request bodies over the upload limit are refused before they are read
+app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+
+# Shared RAG clients live for the whole process. PDF extraction workers are
+# spawned and import this module as __mp_main__, where nothing is started
+if __name__ != '__mp_main__':
+    start_rag_clients()
+    atexit.register(stop_rag_clients)
+    atexit.register(stop_job_workers)
+
+@app.before_request
+def ensure_job_workers():
+    """
+    Start the quiz job workers in the process that serves requests.
+
+    Starting them lazily keeps the reloader's parent process from running jobs.
+    """
+    start_job_workers(JOBS_DB_PATH, run_quiz_job, max_workers=JOB_WORKERS, on_cancelled=report_quiz_job_cancelled)
 
 @app.route('/')
 def index():
@@ -29,79 +72,204 @@ def index():
     """
     return render_template('index.html')
 
+def session_progress_key():
+    """
+    Return the progress key of the current browser session, creating it if needed.
+    """
+    if 'progress_key' not in session:
+        session['progress_key'] = uuid.uuid4().hex
+    return session['progress_key']
+
+def session_tenant_id():
+    """
+    Return the tenant ID of the current browser session, creating it if needed.
+    """
+    if 'tenant_id' not in session:
+        session['tenant_id'] = uuid.uuid4().hex
+    return session['tenant_id']
+
+def session_corpus(create=False):
+    """
+    Return the corpus of the current browser session, or None if it has none.
+
+    Corpora are only created by uploads, so requests that merely look at the
+    session do not leave empty corpora behind.
+
+    Args:
+        create (bool): Start a new corpus if the session has none.
+    """
+    corpus = get_tenant_corpus(session_tenant_id(), session.get('corpus_id'))
+    if corpus is None and create:
+        corpus = create_corpus(session_tenant_id())
+    if corpus is None:
+        session.pop('corpus_id', None)
+    else:
+        session['corpus_id'] = corpus['id']
+    return corpus
+
+@app.errorhandler(413)
+def upload_too_large(error):
+    """
+    Reject request bodies over the upload limit with a JSON error.
+    """
+    return jsonify({'error': f"Files are limited to {MAX_CONTENT_LENGTH // (1024 * 1024)} MB."}), 413
+
 @app.route('/progress')
 def progress():
     """
-    Provide real-time progress updates as JSON.
+    Provide the current session's progress as JSON.
+    """
+    return jsonify(progress_store.get(session_progress_key()))
+
+@app.route('/progress/<key>')
+def progress_stream(key):
+    """
+    Push progress updates for a job or session as server-sent events.
+
+    An event is sent only when the progress changes, and every generated
+    question is sent as a 'question' event as soon as it is published. The
+    stream ends once a job reaches a final phase.
+    """
+    def stream():
+        version = -1
+        sent_items = 0
+        while True:
+            snapshot = progress_store.wait_for_change(key, version, timeout=PROGRESS_HEARTBEAT_SECONDS)
+            if snapshot is None:
+                yield ": keep-alive\n\n"
+                continue
+            version = snapshot["version"]
+            for item in progress_store.items(key, sent_items):
+                sent_items += 1
+                yield f"event: question\ndata: {json.dumps(item)}\n\n"
+            yield f"data: {json.dumps(snapshot)}\n\n"
+            if snapshot["phase"] in FINAL_PHASES:
+                return
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/cache/stats')
+def cache_stats():
+    """
+    Provide hit and miss counters of the LLM output and embedding caches as JSON.
     """
-    return jsonify(progress_data)
+    return jsonify(get_cache_stats())
 
 @app.route('/upload', methods=['GET', 'POST'])
 def upload_file():
     """
     Handle file or YouTube URL uploads.
 
-    - GET: Clear upload folder, reset database, and render upload form.
-    - POST: Process file uploads or YouTube URLs.
+    - GET: Render the upload form for the session's current corpus.
+    - POST: Add a file or YouTube transcript to the session's current corpus,
+      starting one if the session has none.
     """
+    progress_key = session_progress_key()
+
     if request.method == 'GET':
-        clear_folder(UPLOAD_FOLDER_PATH)
-        reset_database()
-        progress_data["status"] = "idle"
-        return render_template('upload.html')
+        progress_store.update(progress_key, status="idle", phase="idle")
+        return render_template(
+            'upload.html',
+            progress_url=url_for('progress_stream', key=progress_key),
+            max_upload_bytes=MAX_CONTENT_LENGTH,
+            corpus=session_corpus(),
+            corpora=list_corpora(session_tenant_id())
+        )
 
     if request.method == 'POST':
         try:
             resource_type = request.form.get('resourceType')
 
             if resource_type == 'file':
-                progress_data["status"] = "Processing file..."
-                response = handle_file_upload(request.files.get('file'))
-                progress_data["status"] = "File processing completed."
+                progress_store.update(progress_key, status="Processing file...", phase="upload")
+                response = handle_file_upload(request.files.get('file'), session_corpus(create=True)['id'])
+                progress_store.update(progress_key, status="File processing completed.", phase="idle")
                 return response
 
             elif resource_type == 'youtube':
-                progress_data["status"] = "Extracting text from YouTube video..."
-                response = handle_youtube_upload(request.form.get('youtubeUrl'))
-                progress_data["status"] = "Text extraction from YouTube video completed."
+                progress_store.update(progress_key, status="Extracting text from YouTube video...", phase="upload")
+                response = handle_youtube_upload(request.form.get('youtubeUrl'), session_corpus(create=True)['id'])
+                progress_store.update(progress_key, status="Text extraction from YouTube video completed.", phase="idle")
                 return response
 
             return jsonify({'error': 'Invalid resource type. Supported types: file, youtube.'}), 400
+        except RequestEntityTooLarge as e:
+            progress_store.update(progress_key, status="idle", phase="idle")
+            return upload_too_large(e)
         except Exception as e:
-            progress_data["status"] = "Error occurred during processing."
+            progress_store.update(progress_key, status="Error occurred during processing.", phase="idle")
             print(f"Error in /upload route: {str(e)}")
             return jsonify({'error': 'An unexpected server error occurred.'}), 500
 
+@app.route('/corpora', methods=['GET', 'POST'])
+def corpora():
+    """
+    Handle the session's corpora.
+
+    - GET: List the session's corpora as JSON.
+    - POST: Start a new collection, created by the next upload, and return to the upload form.
+    """
+    tenant_id = session_tenant_id()
+    if request.method == 'POST':
+        session.pop('corpus_id', None)
+        return redirect(url_for('upload_file'))
+
+    corpus = session_corpus()
+    return jsonify({
+        'current': corpus['id'] if corpus else None,
+        'corpora': [
+            {key: corpus[key] for key in ('id', 'created_at', 'last_used', 'chunks', 'documents')}
+            for corpus in list_corpora(tenant_id)
+        ]
+    })
+
+@app.route('/corpora/activate', methods=['POST'])
+def activate_corpus_route():
+    """
+    Switch the session to one of its earlier corpora.
+    """
+    corpus = activate_corpus(session_tenant_id(), request.form.get('corpus_id', ''))
+    if corpus is None:
+        flash("This collection is no longer available.")
+    else:
+        session['corpus_id'] = corpus['id']
+    return redirect(url_for('upload_file'))
+
 @app.route('/questions', methods=['GET', 'POST'])
 def questions():
     """
     Handle question generation based on user input.
 
     - GET: Render the question input form.
-    - POST: Validate input, generate questions, and return JSON response.
+    - POST: Validate input, queue a quiz generation job, and return its ID.
     """
     if request.method == 'GET':
         return render_template('questions.html', question_types=question_types)
 
     if request.method == 'POST':
         try:
-            progress_data["status"] = "Validating input..."
             question_data, errors = validate_questions(request.form)
             if errors:
-                progress_data["status"] = "Validation errors."
                 return jsonify({"success": False, "errors": errors}), 400
 
-            progress_data["status"] = "Generating questions..."
-            filename = generate_questions(question_data)
-            progress_data["status"] = "Questions generated successfully."
+            corpus = session_corpus()
+            if corpus is None or not corpus['documents']:
+                return jsonify({"success": False, "error": "Upload a resource before generating questions."}), 400
+
+            # The queued progress is published before a worker can report its own
+            status = f"Waiting for the quiz to start (about {round(estimate_quiz_seconds(question_data))}s to generate)..."
+            job_id = submit_job(
+                {"question_data": question_data, "corpus_id": corpus['id']},
+                on_submitted=lambda job_id: progress_store.update(job_id, status=status, phase="queued")
+            )
 
             return jsonify({
                 "success": True,
-                "redirect_url": url_for('results', filename=filename)
+                "job_id": job_id,
+                "redirect_url": url_for('results', job_id=job_id)
             })
 
         except Exception as e:
-            progress_data["status"] = "Error during question generation."
             print(f"Error in /questions route: {str(e)}")
             return jsonify({
                 "success": False,
@@ -111,23 +279,82 @@ def questions():
 @app.route('/results', methods=['GET'])
 def results():
     """
-    Render the results page with a download link for the generated file.
-    Redirect to the questions page if no file is found.
+    Render the results page of a quiz generation job.
+    Redirect to the questions page if the job is unknown.
     """
-    filename = request.args.get('filename')
-    if not filename:
-        flash("No file found to download.")
+    job = get_job(request.args.get('job_id', ''))
+    if not job:
+        flash("No quiz found for this job.")
         return redirect(url_for('questions'))
-    return render_template('results.html', filename=filename)
+    return render_template(
+        'results.html',
+        job=job,
+        progress_url=url_for('progress_stream', key=job['id'])
+    )
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """
+    Provide the status of a quiz generation job as JSON.
+    """
+    job = get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found.'}), 404
+    return jsonify({
+        'id': job['id'],
+        'status': job['status'],
+        'error': job['error'],
+        'download_url': url_for('download_file', job_id=job_id) if job['status'] == COMPLETED else None
+    })
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job_route(job_id):
+    """
+    Cancel a queued or running quiz generation job.
+    """
+    if not cancel_job(job_id):
+        return jsonify({'success': False, 'error': 'Job cannot be cancelled.'}), 409
+    return jsonify({'success': True})
+
+@app.route('/jobs/<job_id>/download')
+def download_file(job_id):
+    """
+    Allow users to download the quiz generated by a job.
+
+    The 'format' query parameter picks docx (the default), pdf, moodle, gift
+    or json, and 'version' picks the answer key ('key', the default) or the
+    student version ('student'). Files are rendered from the saved quiz, so
+    any format can be downloaded again without generating the quiz again.
+    """
+    job = get_job(job_id)
+    if not job or job['status'] != COMPLETED:
+        return jsonify({'error': 'No file available for this job.'}), 404
+    result = export_quiz(
+        job_output_dir(job_id),
+        job['result'],
+        export_format=request.args.get('format', 'docx'),
+        version=request.args.get('version', 'key')
+    )
+    if result.get('error'):
+        return jsonify(result), 400
+    return send_file(
+        os.path.abspath(result['path']),
+        mimetype=result['mimetype'],
+        as_attachment=True,
+        download_name=result['download_name']
+    )
 
-@app.route('/download/<filename>')
-def download_file(filename):
+@app.route('/transcripts/<video_id>/pdf')
+def export_transcript(video_id):
     """
-    Allow users to download the generated .docx file.
+    Export the transcript of an uploaded YouTube video as a PDF download.
     """
+    result = export_transcript_pdf(video_id)
+    if result.get('error'):
+        return jsonify(result), 404
     return send_from_directory(
-        DOWNLOAD_FOLDER_PATH,
-        filename,
+        os.path.abspath(os.path.dirname(result['path'])),
+        os.path.basename(result['path']),
         as_attachment=True
     )
 
@@ -0,0 +1,64 @@
+"""
+Upload admission: the sampled text estimate versus extracting every page of
+a PDF, as character counting did before.
+
+Synthetic PDFs of growing page counts have pages of uneven length. Reports
+the time of the full extraction and of the estimate, and the relative error
+of the estimated characters and tokens.
+
+Usage:
+    python benchmarks/bench_admission.py --pages 10,100,500
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'rag-system')))
+from pypdf import PdfReader
+from reportlab.pdfgen import canvas
+from admission import estimate_document
+from chunker import estimate_token_count
+
+WORDS = ("photosynthesis", "chlorophyll", "energy", "light", "glucose", "carbon", "dioxide", "oxygen", "stroma", "cell")
+
+
+def make_pdf(path, pages, rng):
+    c = canvas.Canvas(path)
+    for _ in range(pages):
+        for line in range(rng.randint(10, 45)):
+            c.drawString(50, 780 - line * 16, " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 10))))
+        c.showPage()
+    c.save()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", default="10,100,500", help="Comma-separated page counts.")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        for pages in [int(value) for value in args.pages.split(",")]:
+            path = os.path.join(directory, f"{pages}.pdf")
+            make_pdf(path, pages, rng)
+
+            start = time.perf_counter()
+            text = "\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+            full_seconds = time.perf_counter() - start
+            tokens = estimate_token_count(text)
+
+            start = time.perf_counter()
+            estimate = estimate_document(path, "pdf", estimate_token_count)
+            estimate_seconds = time.perf_counter() - start
+
+            print(f"{pages:4d} pages: full extraction {full_seconds * 1000:8.1f} ms, "
+                  f"estimate {estimate_seconds * 1000:6.1f} ms  "
+                  f"characters {estimate['characters'] / len(text) - 1:+6.1%}  "
+                  f"tokens {estimate['tokens'] / tokens - 1:+6.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Chunking: the former character splitter (1,500 characters, 200 overlap,
+page:index IDs) versus the token-aware chunker, on a synthetic corpus with
+headings and sentences of varying length.
+
+Reports the chunk count, the tokens of the prompts built from RETRIEVAL_K
+retrieved chunks, and the share of chunks that must be re-embedded after a
+one-sentence edit, both for PDF-like pages and for a text file loaded in blocks.
+
+Usage:
+    python benchmarks/bench_chunking.py --pages 300 --num-ctx 2048 4096
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'rag-system')))
+from langchain.schema.document import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from chunker import TokenChunker, chunk_token_target, estimate_token_count
+from ingestion import calculate_chunk_ids
+from loaders import load_text
+
+RETRIEVAL_K = 5
+RESERVED_TOKENS = 1024
+PROMPT_SAMPLES = 2000
+WORDS = ("the of and a to in is photosynthesis chlorophyll mitochondria enzyme membrane protein "
+         "glucose energy respiration nucleus ribosome osmosis diffusion catalyst molecule 1987 42 "
+         "concentration gradient transport cellular").split()
+
+
+def build_pages(pages, rng):
+    """Pages of about 2,500 characters with a numbered heading every third page."""
+    texts = []
+    for page in range(pages):
+        lines = []
+        if page % 3 == 0:
+            lines.append(f"{page // 3 + 1}. Topic {page // 3 + 1}")
+        size = 0
+        while size < 2500:
+            sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 35))).capitalize() + "."
+            lines.append(sentence)
+            size += len(sentence) + 1
+        texts.append("\n".join(lines))
+    return texts
+
+
+def edit(text, rng):
+    """Insert a sentence after a random sentence of the text."""
+    positions = [i for i, c in enumerate(text) if c == "."]
+    position = positions[rng.randrange(len(positions))] + 1
+    return text[:position] + " An inserted sentence about membrane transport." + text[position:]
+
+
+def legacy_split(documents):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=200, length_function=len)
+    chunks = splitter.split_documents(documents)
+    last_page_id, index = None, 0
+    for chunk in chunks:
+        page_id = f"{chunk.metadata['source']}:{chunk.metadata['page']}"
+        index = index + 1 if page_id == last_page_id else 0
+        chunk.metadata["id"] = f"{page_id}:{index}"
+        last_page_id = page_id
+    return chunks
+
+
+def token_split(chunker):
+    return lambda documents: list(calculate_chunk_ids(chunker.split_documents(documents)))
+
+
+def legacy_blocks(file_path, block_size=4000):
+    """The former text loader: blocks cut as soon as they reach `block_size` characters."""
+    with open(file_path, "r", encoding="utf-8") as f:
+        block, size, page = [], 0, 0
+        for line in f:
+            block.append(line.rstrip("\n"))
+            size += len(line)
+            if size >= block_size:
+                yield Document(page_content="\n".join(block), metadata={"source": file_path, "page": page})
+                block, size, page = [], 0, page + 1
+        if block:
+            yield Document(page_content="\n".join(block), metadata={"source": file_path, "page": page})
+
+
+def reembedded(before, after):
+    """Share of chunks after an edit whose ID is new or now holds other text."""
+    known = {(chunk.metadata["id"], chunk.page_content) for chunk in before}
+    return sum((chunk.metadata["id"], chunk.page_content) not in known for chunk in after) / len(after)
+
+
+def prompt_tokens(chunk_tokens, rng):
+    """Tokens of retrieved context in prompts of RETRIEVAL_K random chunks."""
+    samples = [sum(rng.sample(chunk_tokens, RETRIEVAL_K)) for _ in range(PROMPT_SAMPLES)]
+    return statistics.mean(samples), max(samples)
+
+
+def report(label, split, documents, edited_documents, file_documents, rng):
+    start = time.perf_counter()
+    chunks = split(documents)
+    seconds = time.perf_counter() - start
+    tokens = [estimate_token_count(chunk.page_content) for chunk in chunks]
+    mean_prompt, max_prompt = prompt_tokens(tokens, rng)
+    page_churn = reembedded(chunks, split(edited_documents))
+    file_churn = reembedded(split(file_documents[0]), split(file_documents[1]))
+    print(
+        f"{label:<28} {len(chunks):6d} chunks  {sum(tokens):8d} tokens  "
+        f"chunk {statistics.mean(tokens):6.1f}/{max(tokens):4d} mean/max  "
+        f"prompt {mean_prompt:7.1f}/{max_prompt:5d}  "
+        f"re-embedded after edit: pages {page_churn:6.1%}, text file {file_churn:6.1%}  {seconds:6.2f} s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=300, help="Pages in the synthetic corpus.")
+    parser.add_argument("--num-ctx", type=int, nargs="+", default=[2048, 4096], help="Context windows to size chunks for.")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    pages = build_pages(args.pages, rng)
+    edited_pages = list(pages)
+    edited_pages[args.pages // 10] = edit(pages[args.pages // 10], rng)
+    corpus_tokens = sum(estimate_token_count(text) for text in pages)
+
+    to_documents = lambda texts: [Document(page_content=text, metadata={"source": "corpus.pdf", "page": page})
+                                  for page, text in enumerate(texts)]
+    documents, edited_documents = to_documents(pages), to_documents(edited_pages)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # The same corpus as one text file, edited near its start
+        paths = [os.path.join(directory, name) for name in ("before.txt", "after.txt")]
+        for path, texts in zip(paths, (pages, [edit(pages[0], rng)] + pages[1:])):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("\n\n".join(texts))
+
+        # Both runs use the same source name so that their chunk IDs can be compared
+        def read(loader, path):
+            return [Document(page_content=doc.page_content, metadata=dict(doc.metadata, source="corpus.txt"))
+                    for doc in loader(path)]
+
+        print(f"{args.pages} pages, {corpus_tokens} estimated tokens, "
+              f"prompts of {RETRIEVAL_K} chunks ({PROMPT_SAMPLES} samples)")
+        report("characters (1500/200)", legacy_split, documents, edited_documents,
+               [read(legacy_blocks, path) for path in paths], rng)
+        for num_ctx in args.num_ctx:
+            target = chunk_token_target(num_ctx, RESERVED_TOKENS, RETRIEVAL_K)
+            report(f"tokens, num_ctx {num_ctx} ({target})", token_split(TokenChunker(target_tokens=target)),
+                   documents, edited_documents, [read(load_text, path) for path in paths], rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Near-duplicate question detection: an exact scan of every earlier question
+versus the LSH index of the quiz and the SQLite question history.
+
+Synthetic question embeddings share a common direction, like the embeddings
+of one model do (unrelated questions have a cosine similarity near 0.6), and
+each new question is either a paraphrase of an earlier one (cosine
+similarity 0.91 to 0.98) or a new question. The LSH center is the mean of a
+sample of the questions, standing in for the mean chunk embedding of a
+corpus. Reports the share of paraphrases caught and of new questions wrongly
+rejected, against the exact scan, and the lookup latency as the number of
+earlier questions grows.
+
+Usage:
+    python benchmarks/bench_dedup.py --dim 768 --sizes 1000,10000,100000
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'rag-system')))
+import numpy as np
+from question_dedup import DUPLICATE_SIMILARITY, DuplicateIndex, QuestionHistory, lsh_keys
+
+HISTORY_BATCH = 5000
+COMMON_WEIGHT = 1.2
+CENTER_SAMPLE = 1000
+
+
+def normalize(matrix):
+    return (matrix / np.linalg.norm(matrix, axis=-1, keepdims=True)).astype(np.float32)
+
+
+def make_questions(count, dim, rng, common):
+    return normalize(COMMON_WEIGHT * common + rng.normal(size=(count, dim)) / np.sqrt(dim))
+
+
+def make_probes(history, queries, dim, rng, common):
+    """Half paraphrases of earlier questions, half new questions."""
+    sources = rng.integers(0, len(history), queries // 2)
+    noise = normalize(rng.normal(size=(len(sources), dim)))
+    scale = rng.uniform(0.2, 0.45, size=(len(sources), 1))
+    paraphrases = normalize(history[sources] + scale * noise)
+    fresh = make_questions(queries - len(sources), dim, rng, common)
+    return np.concatenate([paraphrases, fresh]), np.array([True] * len(sources) + [False] * len(fresh))
+
+
+def measure(label, find, probes, truth):
+    latencies, found = [], []
+    for probe in probes:
+        start = time.perf_counter()
+        found.append(find(probe) is not None)
+        latencies.append(time.perf_counter() - start)
+    found = np.array(found)
+    print(f"  {label:<14} caught {found[truth].mean():6.1%} of paraphrases  "
+          f"rejected {found[~truth].mean():6.1%} of new questions  "
+          f"p50 {statistics.median(latencies) * 1000:7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dim", type=int, default=768, help="Embedding dimension.")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated numbers of earlier questions.")
+    parser.add_argument("--queries", type=int, default=400, help="New questions checked at each size.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    common = normalize(rng.normal(size=args.dim))
+    print(f"{args.dim}-dimensional embeddings, threshold {DUPLICATE_SIMILARITY}, {args.queries} checks per size")
+    for size in [int(value) for value in args.sizes.split(",")]:
+        history = make_questions(size, args.dim, rng, common)
+        probes, truth = make_probes(history, args.queries, args.dim, rng, common)
+        texts = [f"question {i}" for i in range(size)]
+        center = history[:CENTER_SAMPLE].mean(axis=0)
+        print(f"{size} earlier questions:")
+
+        measure("exact scan", lambda probe: True if (history @ probe).max() >= DUPLICATE_SIMILARITY else None,
+                probes, truth)
+
+        index = DuplicateIndex()
+        start = time.perf_counter()
+        for text, vector, keys in zip(texts, history, lsh_keys(history, center)):
+            index.add(vector, keys, text)
+        build = time.perf_counter() - start
+        measure("LSH in memory", lambda probe: index.find(probe, lsh_keys(probe, center)[0]), probes, truth)
+
+        with tempfile.TemporaryDirectory() as directory:
+            store = QuestionHistory(os.path.join(directory, "history.sqlite"), max_per_corpus=size)
+            start = time.perf_counter()
+            for begin in range(0, size, HISTORY_BATCH):
+                store.add_many("bench", "model", texts[begin:begin + HISTORY_BATCH],
+                               history[begin:begin + HISTORY_BATCH], center)
+            insert = time.perf_counter() - start
+            measure("LSH history", lambda probe: store.find("bench", "model", probe, lsh_keys(probe, center)[0]),
+                    probes, truth)
+        print(f"  indexing: {build:.2f} s in memory, {insert:.2f} s into the history")
+
+
+if __name__ == "__main__":
+    main()
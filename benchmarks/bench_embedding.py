@@ -0,0 +1,95 @@
+"""
+Ingestion embedding throughput: one sequential add_documents call versus the
+batched, parallel embedding stage, on a synthetic 1,000-page corpus embedded
+against a local stub Ollama server.
+
+Usage:
+    python benchmarks/bench_embedding.py --pages 1000 --workers 1 2 4 8
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'rag-system')))
+from langchain.schema.document import Document
+from langchain_chroma import Chroma
+from langchain_ollama import OllamaEmbeddings
+from embedder import BatchEmbedder
+from ingestion import split_documents, calculate_chunk_ids
+from stub_ollama import StubOllamaServer
+
+EMBEDDING_MODEL = "nomic-embed-text"
+WORDS = ("photosynthesis chlorophyll mitochondria enzyme membrane protein glucose energy "
+         "respiration nucleus ribosome osmosis diffusion catalyst molecule").split()
+
+
+def build_chunks(pages):
+    """Split a synthetic corpus of `pages` pages of about 2,500 characters each."""
+    documents = [
+        Document(
+            page_content=" ".join(f"{WORDS[(page * 7 + i) % len(WORDS)]}{i % 50}" for i in range(280)),
+            metadata={"source": "synthetic.pdf", "page": page},
+        )
+        for page in range(pages)
+    ]
+    return list(calculate_chunk_ids(split_documents(documents)))
+
+
+def fresh_store(persist_directory, name, base_url):
+    return Chroma(
+        collection_name=name,
+        persist_directory=persist_directory,
+        embedding_function=OllamaEmbeddings(model=EMBEDDING_MODEL, base_url=base_url),
+    )
+
+
+def report(label, chunks, seconds, stub, embed_calls_before, extra=""):
+    print(
+        f"{label:<24} {seconds:7.2f} s   {chunks / seconds:8.1f} chunks/s   "
+        f"embed calls {stub.counts['embed'] - embed_calls_before:5d}   {extra}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=1000, help="Pages in the synthetic corpus.")
+    parser.add_argument("--batch-size", type=int, default=64, help="Chunks per embedding request.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="Concurrent requests to try.")
+    parser.add_argument("--latency", type=float, default=0.02, help="Stub latency per embed call in seconds.")
+    parser.add_argument("--latency-per-text", type=float, default=0.005, help="Stub latency per embedded text.")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="Fraction of embed calls that fail.")
+    args = parser.parse_args()
+
+    chunks = build_chunks(args.pages)
+    print(f"{args.pages} pages, {len(chunks)} chunks, batch size {args.batch_size}, "
+          f"stub latency {args.latency * 1000:.0f} ms + {args.latency_per_text * 1000:.1f} ms/text, "
+          f"error rate {args.error_rate:.0%}")
+
+    with tempfile.TemporaryDirectory() as persist_directory, \
+            StubOllamaServer(embed_latency=args.latency, embed_latency_per_text=args.latency_per_text) as stub:
+        # Baseline: everything through one add_documents call (no failures injected,
+        # as a single error would abort the whole call)
+        db = fresh_store(persist_directory, "sequential", stub.base_url)
+        before = stub.counts["embed"]
+        start = time.perf_counter()
+        db.add_documents(chunks, ids=[chunk.metadata["id"] for chunk in chunks])
+        report("sequential add_documents", len(chunks), time.perf_counter() - start, stub, before)
+
+        stub.embed_error_rate = args.error_rate
+        for workers in args.workers:
+            db = fresh_store(persist_directory, f"batched_{workers}", stub.base_url)
+            embedder = BatchEmbedder(batch_size=args.batch_size, max_workers=workers, retry_delay=0.05)
+            before = stub.counts["embed"]
+            # Feed a generator so the backpressure path is exercised
+            metrics = embedder.add_documents(db, (chunk for chunk in chunks))
+            assert db._collection.count() == len(chunks)
+            report(
+                f"batched, {workers} workers", metrics["chunks"], metrics["seconds"], stub, before,
+                f"{metrics['tokens_per_second']:9.1f} tokens/s   retried batches {metrics['retries']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Quiz export: the python-docx document built one paragraph at a time, as
+quizzes were saved before, versus the export renderers writing from the
+structured quiz model, for quizzes of growing size.
+
+Reports the render time, the peak Python memory allocated while rendering
+(tracemalloc, in a second run) and the file size of each format, then the
+time to find a download in the export cache once the file has been rendered.
+
+Usage:
+    python benchmarks/bench_export.py --sizes 30,300,3000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'rag-system')))
+from docx import Document
+from question_schema import FILL_IN_THE_BLANK, MULTIPLE_CHOICE, OPTION_LETTERS, TRUE_FALSE
+from quiz_export import ANSWER_KEY, EXPORT_FORMATS, ExportCache, build_quiz
+
+QUESTION_TYPES = (MULTIPLE_CHOICE, TRUE_FALSE, FILL_IN_THE_BLANK, "Scenario-Based")
+DIFFICULTIES = ("easy", "medium", "difficult")
+HIT_REPEATS = 200
+
+
+def make_questions(count):
+    questions = []
+    for number in range(count):
+        question_type = QUESTION_TYPES[number % len(QUESTION_TYPES)]
+        difficulty = DIFFICULTIES[number % len(DIFFICULTIES)]
+        question = f"Which stage of process {number} converts light energy into chemical energy in the chloroplast?"
+        if question_type == MULTIPLE_CHOICE:
+            options = "\n".join(f"        {letter}) Stage {letter.lower()} of process {number}" for letter in OPTION_LETTERS)
+            text = f"- Question: {question}\n    Options:\n{options}\n- Answer: B) Stage b of process {number}"
+        elif question_type == TRUE_FALSE:
+            text = f"- Question: Process {number} takes place in the chloroplast.\n- Answer: True"
+        elif question_type == FILL_IN_THE_BLANK:
+            text = f"- Question: Process {number} converts light into ______ energy.\n- Answer: chemical"
+        else:
+            text = f"- Question: {question} Explain your reasoning.\n- Answer: The light-dependent reactions, because ..."
+        questions.append((question_type, difficulty, text))
+    return questions
+
+
+def legacy_docx(questions, path):
+    doc = Document()
+    doc.add_heading('Generated Questions', level=2)
+    for idx, (question_type, difficulty, text) in enumerate(questions, 1):
+        doc.add_paragraph(f"{idx}-)({question_type} {difficulty.capitalize()}) {text}")
+    doc.save(path)
+
+
+def measure(render, path):
+    """Time a render, then render again under tracemalloc for its peak memory."""
+    start = time.perf_counter()
+    render(path)
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    render(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak, os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="30,300,3000", help="Comma-separated numbers of questions per quiz.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for size in [int(value) for value in args.sizes.split(",")]:
+            questions = make_questions(size)
+            quiz = build_quiz(questions)
+            print(f"{size} questions:")
+
+            rows = [("python-docx", measure(lambda path: legacy_docx(questions, path),
+                                            os.path.join(directory, f"legacy-{size}.docx")))]
+            for export_format, spec in EXPORT_FORMATS.items():
+                def render(path, spec=spec):
+                    with open(path, "wb") as out:
+                        spec.render(quiz, ANSWER_KEY, out)
+                rows.append((export_format, measure(render, os.path.join(directory, f"{size}{spec.extension}"))))
+            for label, (seconds, peak, file_size) in rows:
+                print(f"  {label:<16} {seconds * 1000:9.1f} ms  peak {peak / 2**20:7.2f} MiB  {file_size / 1024:8.1f} KiB")
+
+            cache = ExportCache(os.path.join(directory, f"exports-{size}"))
+            cache.get(quiz, "docx", ANSWER_KEY)
+            start = time.perf_counter()
+            for _ in range(HIT_REPEATS):
+                cache.get(quiz, "docx", ANSWER_KEY)
+            print(f"  cached download  {(time.perf_counter() - start) / HIT_REPEATS * 1000:9.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
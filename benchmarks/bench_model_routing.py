@@ -0,0 +1,159 @@
+"""
+Model routing: every call on the large model, versus the small model writing
+the dynamic prompts and a first draft of each batch with the questions it got
+wrong escalated to the large model, with and without sending difficult
+questions straight to the large model.
+
+The models are emulated: a call costs its prompt tokens times --prompt-ms and
+its output tokens times --token-ms of model time, scaled by each model's
+--small-speed / --large-speed factor, and each question comes out malformed
+with a probability that depends on the model and the difficulty
+(--small-defects, --large-defects, for easy, medium and difficult). Calls go
+through the real router and the questions through the real validator. Reports
+the model time per question and, for each difficulty, the share of questions
+written by the large model.
+
+Usage:
+    python benchmarks/bench_model_routing.py --quizzes 50 --questions 30
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from collections import Counter
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'rag-system')))
+from model_router import ModelRouter
+from question_schema import MULTIPLE_CHOICE, OPTION_LETTERS, normalize_question, stream_json_items, validate_question
+
+SMALL, LARGE = "small", "large"
+DIFFICULTIES = ("easy", "medium", "difficult")
+BATCH_SIZE = 5
+MAX_RETRIES = 2
+PROMPT_TOKENS = 1200
+META_PROMPT_TOKENS = 900
+META_OUTPUT_TOKENS = 40
+TOKENS_PER_QUESTION = 70
+
+
+class EmulatedModel:
+    """Writes a JSON batch of questions with random defects and accounts its model time."""
+
+    def __init__(self, name, speed, defects, args, rng, clock):
+        self.name = name
+        self.speed = speed
+        self.defects = defects
+        self.args = args
+        self.rng = rng
+        self.clock = clock
+
+    def _spend(self, prompt_tokens, output_tokens):
+        self.clock[self.name] += self.speed * (prompt_tokens * self.args.prompt_ms
+                                               + output_tokens * self.args.token_ms) / 1000
+
+    def invoke(self, prompt, **kwargs):
+        self._spend(META_PROMPT_TOKENS, META_OUTPUT_TOKENS)
+        return "Write a question that tests how the stages of the process depend on each other."
+
+    def stream(self, prompt, **kwargs):
+        request = json.loads(prompt)
+        self._spend(PROMPT_TOKENS, TOKENS_PER_QUESTION * request["count"])
+        items = []
+        for number in range(request["count"]):
+            item = {
+                "question": f"Which stage {number} of the {request['difficulty']} process stores light energy?",
+                "options": {letter: f"Stage {letter.lower()}{number}" for letter in OPTION_LETTERS},
+                "answer": self.rng.choice(OPTION_LETTERS),
+            }
+            if self.rng.random() < self.defects[request["difficulty"]]:
+                item["options"]["C"] = "[Option 3]"
+            items.append(item)
+        yield json.dumps({"questions": items})
+
+
+def routes(policy):
+    large = {"model": LARGE}
+    if policy == "large only":
+        return {"dynamic_prompt": {"models": [large]}, "questions": {"models": [large]}}
+    small_first = {"models": [{"model": SMALL}, large]}
+    return {
+        "dynamic_prompt": small_first,
+        "questions": dict(small_first, speculative=True,
+                          large_only=["difficult"] if policy == "speculative, difficult on large" else []),
+    }
+
+
+def run_policy(policy, args):
+    rng = random.Random(args.seed)
+    clock = Counter()
+    models = {
+        SMALL: EmulatedModel(SMALL, args.small_speed, dict(zip(DIFFICULTIES, args.small_defects)), args, rng, clock),
+        LARGE: EmulatedModel(LARGE, args.large_speed, dict(zip(DIFFICULTIES, args.large_defects)), args, rng, clock),
+    }
+    router = ModelRouter(routes(policy), lambda model, **options: models[model], default={"model": LARGE})
+    written = Counter()
+    for _ in range(args.quizzes):
+        for index, difficulty in enumerate(DIFFICULTIES):
+            remaining = args.questions // len(DIFFICULTIES) + (index < args.questions % len(DIFFICULTIES))
+            while remaining > 0:
+                size = min(BATCH_SIZE, remaining)
+                remaining -= size
+                router.llm("dynamic_prompt").invoke("meta prompt")
+                missing, escalation = size, 0
+                for _ in range(MAX_RETRIES + 1):
+                    if not missing:
+                        break
+                    model = router.llm("questions", difficulty=difficulty, attempt=escalation)
+                    prompt = json.dumps({"count": missing, "difficulty": difficulty})
+                    rejected = 0
+                    for item in stream_json_items(model.stream(prompt)):
+                        item = normalize_question(MULTIPLE_CHOICE, item)
+                        if validate_question(MULTIPLE_CHOICE, item):
+                            rejected += 1
+                            continue
+                        written[(difficulty, model.model)] += 1
+                        missing -= 1
+                    if rejected:
+                        escalation += 1
+                # Questions still missing are written one by one by the last model of the route
+                for _ in range(missing):
+                    model = router.llm("questions", difficulty=difficulty, attempt=MAX_RETRIES + 1)
+                    model.invoke("single question")
+                    written[(difficulty, model.model)] += 1
+    return clock, written, router.summary()
+
+
+def main():
+    def rates(value):
+        return [float(rate) for rate in value.split(",")]
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--quizzes", type=int, default=50)
+    parser.add_argument("--questions", type=int, default=30, help="Questions per quiz, spread over the difficulties.")
+    parser.add_argument("--prompt-ms", type=float, default=0.5, help="Model time per prompt token of the large model.")
+    parser.add_argument("--token-ms", type=float, default=30.0, help="Model time per output token of the large model.")
+    parser.add_argument("--small-speed", type=float, default=0.4, help="Small model time relative to the large model.")
+    parser.add_argument("--large-speed", type=float, default=1.0)
+    parser.add_argument("--small-defects", type=rates, default=[0.08, 0.15, 0.35],
+                        help="Share of malformed easy, medium and difficult questions of the small model.")
+    parser.add_argument("--large-defects", type=rates, default=[0.03, 0.05, 0.10])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    total = args.quizzes * args.questions
+    for policy in ("large only", "speculative", "speculative, difficult on large"):
+        clock, written, summary = run_policy(policy, args)
+        seconds = sum(clock.values())
+        shares = []
+        for difficulty in DIFFICULTIES:
+            count = written[(difficulty, SMALL)] + written[(difficulty, LARGE)]
+            shares.append(f"{difficulty} {written[(difficulty, LARGE)] / count:4.0%}")
+        print(f"{policy:<32} {seconds / total:6.2f} s/question  "
+              f"(small {clock[SMALL]:7.0f} s, large {clock[LARGE]:7.0f} s)  "
+              f"large-model share: {', '.join(shares)}")
+        print(f"{'':<32} {summary}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Per-question latency with per-call client construction versus the shared
+client registry, measured against a local stub Ollama server.
+
+Usage:
+    python benchmarks/bench_rag_clients.py --questions 30
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'rag-system')))
+from langchain.schema.document import Document
+from langchain_chroma import Chroma
+from langchain_ollama import OllamaEmbeddings, OllamaLLM
+import clients
+from stub_ollama import StubOllamaServer
+
+MODEL = "llama3.2:3b"
+EMBEDDING_MODEL = "nomic-embed-text"
+
+
+def build_corpus(persist_directory, base_url, num_chunks):
+    """Fill a fresh Chroma collection with synthetic chunks."""
+    db = Chroma(
+        persist_directory=persist_directory,
+        embedding_function=OllamaEmbeddings(model=EMBEDDING_MODEL, base_url=base_url),
+    )
+    documents = [
+        Document(page_content=f"Section {i}: photosynthesis converts light energy in chloroplast {i % 17}.",
+                 metadata={"id": f"synthetic.pdf:{i // 4}:{i % 4}"})
+        for i in range(num_chunks)
+    ]
+    db.add_documents(documents, ids=[doc.metadata["id"] for doc in documents])
+
+
+def question_per_call_clients(persist_directory, base_url):
+    """One question the old way: new embeddings, Chroma and LLM for each of the two steps."""
+    for query in ("summary of the documents", "generated dynamic query"):
+        db = Chroma(
+            persist_directory=persist_directory,
+            embedding_function=OllamaEmbeddings(model=EMBEDDING_MODEL, base_url=base_url),
+        )
+        results = db.similarity_search_with_score(query, k=5)
+        context = "\n\n---\n\n".join(doc.page_content for doc, _ in results)
+        OllamaLLM(model=MODEL, base_url=base_url).invoke(f"{context}\n\n{query}")
+
+
+def question_shared_clients(persist_directory, base_url):
+    """One question through the shared client registry."""
+    for query in ("summary of the documents", "generated dynamic query"):
+        db = clients.get_vector_store(persist_directory=persist_directory)
+        results = db.similarity_search_with_score(query, k=5)
+        context = "\n\n---\n\n".join(doc.page_content for doc, _ in results)
+        clients.get_llm(MODEL).invoke(f"{context}\n\n{query}")
+
+
+def run(label, question, questions, persist_directory, stub):
+    connections_before = stub.counts["connections"]
+    latencies = []
+    for _ in range(questions):
+        start = time.perf_counter()
+        question(persist_directory, stub.base_url)
+        latencies.append((time.perf_counter() - start) * 1000)
+    print(
+        f"{label:<20} mean {statistics.mean(latencies):8.2f} ms   "
+        f"p50 {statistics.median(latencies):8.2f} ms   "
+        f"max {max(latencies):8.2f} ms   "
+        f"new connections {stub.counts['connections'] - connections_before}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=30, help="Questions per run.")
+    parser.add_argument("--chunks", type=int, default=200, help="Chunks in the synthetic collection.")
+    parser.add_argument("--llm-latency", type=float, default=0.02, help="Stub generate latency in seconds.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as persist_directory, \
+            StubOllamaServer(generate_latency=args.llm_latency, embed_latency=0.0) as stub:
+        build_corpus(persist_directory, stub.base_url, args.chunks)
+        clients.init_clients(persist_directory=persist_directory, base_url=stub.base_url, keep_alive="30m")
+
+        print(f"{args.questions} questions, {args.chunks} chunks, stub LLM latency {args.llm_latency * 1000:.0f} ms")
+        run("per-call clients", question_per_call_clients, args.questions, persist_directory, stub)
+        run("shared clients", question_shared_clients, args.questions, persist_directory, stub)
+        clients.close_clients()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Retrieval quality and latency: dense search, BM25, their reciprocal rank
+fusion, and the fusion reranked by term overlap.
+
+Without --queries, a synthetic corpus is generated: chunks on shared topics,
+each naming a few entities of its own, with embeddings near their topic. Three
+kinds of queries target one chunk each: "keyword" queries name its entities
+but embed near the topic only (the dense search sees the topic, not the
+chunk), "paraphrase" queries embed near the chunk but share none of its words,
+and "mixed" queries do a little of both. The chunks go into the local vector
+store and a lexical index like ingestion puts them there.
+
+With --queries, an existing collection is evaluated instead, embedding the
+queries with the Ollama server. The file has one JSON object per line:
+    {"query": "...", "relevant": ["<chunk id>", ...]}
+
+Reports recall@k (the share of relevant chunks among the first k results)
+for each method and query kind, and the p50/p95 query latency.
+
+Usage:
+    python benchmarks/bench_retrieval.py --chunks 100000
+    python benchmarks/bench_retrieval.py --queries eval.jsonl --persist rag-system/chroma --collection langchain
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'rag-system')))
+import numpy as np
+from langchain.schema.document import Document
+from langchain_core.embeddings import Embeddings
+from lexical_index import LexicalIndex
+from local_store import LocalVectorStore
+from retrieval import hybrid_search, OverlapReranker, document_key
+
+K_VALUES = (1, 5, 10)
+FETCH_K = 20
+BATCH = 2000
+CHUNK_WORDS = 150
+TOPIC_WORDS = 30
+ENTITIES_PER_CHUNK = 3
+QUERY_KINDS = ("keyword", "paraphrase", "mixed")
+
+
+class QueryVectors(Embeddings):
+    """Embeddings returning the precomputed vector of each query text."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_documents(self, texts):
+        raise NotImplementedError
+
+    def embed_query(self, text):
+        return self.vectors[text]
+
+
+def word(rng, prefix, size):
+    return prefix + "".join(rng.choice(list("bcdfghjklmnprstvz"), size=size))
+
+
+def make_corpus(chunks, dim, queries, rng):
+    """Synthetic chunks, their embeddings, and queries of each kind with their target chunk."""
+    topics = max(10, chunks // 50)
+    common = [word(rng, "c", 4) for _ in range(2000)]
+    common_weights = 1.0 / np.arange(1, len(common) + 1)
+    common_weights /= common_weights.sum()
+    topic_words = [[word(rng, "t", 6) for _ in range(TOPIC_WORDS)] for _ in range(topics)]
+    # Words of the same meaning as the topic words, used by paraphrases
+    synonyms = [[word(rng, "s", 6) for _ in range(TOPIC_WORDS)] for _ in range(topics)]
+
+    centers = rng.normal(size=(topics, dim))
+    topic_of = rng.integers(0, topics, chunks)
+    vectors = centers[topic_of] + 0.3 * rng.normal(size=(chunks, dim))
+    texts, entities = [], []
+    for i in range(chunks):
+        own = [word(rng, "e", 7) for _ in range(ENTITIES_PER_CHUNK)]
+        words = list(rng.choice(common, size=CHUNK_WORDS - 30, p=common_weights))
+        words += list(rng.choice(topic_words[topic_of[i]], size=30 - ENTITIES_PER_CHUNK))
+        words += own
+        rng.shuffle(words)
+        texts.append(" ".join(words))
+        entities.append(own)
+
+    query_texts, query_vectors, targets, kinds = [], [], [], []
+    for q in range(queries):
+        target = int(rng.integers(0, chunks))
+        topic = topic_of[target]
+        kind = QUERY_KINDS[q % len(QUERY_KINDS)]
+        filler = list(rng.choice(common[:50], size=4))
+        if kind == "keyword":
+            words = entities[target][:2] + list(rng.choice(topic_words[topic], size=3)) + filler
+            vector = centers[topic] + 0.6 * rng.normal(size=dim)
+        elif kind == "paraphrase":
+            words = list(rng.choice(synonyms[topic], size=5)) + filler
+            vector = vectors[target] + 2.5 * rng.normal(size=dim)
+        else:
+            words = entities[target][:1] + list(rng.choice(topic_words[topic], size=3)) + filler
+            vector = vectors[target] + 3.5 * rng.normal(size=dim)
+        query_texts.append(" ".join(words) + f" q{q}")
+        query_vectors.append(vector)
+        targets.append([f"chunk-{target}"])
+        kinds.append(kind)
+
+    normalize = lambda matrix: (matrix / np.linalg.norm(matrix, axis=-1, keepdims=True)).astype(np.float32)
+    return texts, normalize(vectors), query_texts, normalize(np.array(query_vectors)), targets, kinds
+
+
+def evaluate(label, search, query_texts, relevant, kinds):
+    """Run every query through a search function and print its recall@k by query kind and its latency."""
+    latencies = []
+    hits = {kind: {k: [] for k in K_VALUES} for kind in set(kinds)}
+    for query, targets, kind in zip(query_texts, relevant, kinds):
+        start = time.perf_counter()
+        ranked = [document_key(document) for document in search(query, max(K_VALUES))]
+        latencies.append(time.perf_counter() - start)
+        for k in K_VALUES:
+            hits[kind][k].append(len(set(ranked[:k]) & set(targets)) / len(targets))
+
+    latencies.sort()
+    columns = []
+    for kind in sorted(hits):
+        recalls = " ".join(f"{statistics.mean(hits[kind][k]):.3f}" for k in K_VALUES)
+        columns.append(f"{kind} {recalls}")
+    print(f"{label:<22} recall@{'/'.join(map(str, K_VALUES))}: {'  '.join(columns)}  "
+          f"p50 {statistics.median(latencies) * 1000:6.2f} ms  "
+          f"p95 {latencies[int(0.95 * (len(latencies) - 1))] * 1000:6.2f} ms")
+
+
+def methods(db, lexical_index):
+    reranker = OverlapReranker()
+    return [
+        ("dense", lambda query, k: [document for document, _ in db.similarity_search_with_score(query, k=k)]),
+        ("bm25", lambda query, k: [document for document, _ in lexical_index.search(query, k=k)]),
+        ("hybrid (rrf)", lambda query, k: [document for document, _ in
+                                           hybrid_search(db, lexical_index, query, k=k, fetch_k=FETCH_K)]),
+        ("hybrid + overlap", lambda query, k: [document for document, _ in
+                                               hybrid_search(db, lexical_index, query, k=k, fetch_k=FETCH_K,
+                                                             reranker=reranker)]),
+    ]
+
+
+def run_synthetic(args):
+    rng = np.random.default_rng(0)
+    texts, vectors, query_texts, query_vectors, relevant, kinds = make_corpus(args.chunks, args.dim, args.num_queries, rng)
+    ids = [f"chunk-{i}" for i in range(args.chunks)]
+    print(f"{args.chunks} synthetic chunks of {CHUNK_WORDS} words, {args.dim}-dimensional embeddings, "
+          f"{args.num_queries} queries, fetch_k={FETCH_K}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = LocalVectorStore("bench", directory, QueryVectors(dict(zip(query_texts, query_vectors.tolist()))),
+                              **json.loads(args.store_options))
+        lexical_index = LexicalIndex("bench", directory)
+        index_seconds = 0.0
+        for begin in range(0, args.chunks, BATCH):
+            batch = slice(begin, begin + BATCH)
+            documents = [Document(page_content=text, metadata={"id": chunk_id})
+                         for chunk_id, text in zip(ids[batch], texts[batch])]
+            db.upsert_embeddings(ids[batch], vectors[batch].tolist(), texts[batch], [{"id": i} for i in ids[batch]])
+            start = time.perf_counter()
+            lexical_index.add_documents(documents)
+            index_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        lexical_index.build()
+        build_seconds = time.perf_counter() - start
+        print(f"lexical index: {index_seconds:.1f} s to add the chunks, {build_seconds:.1f} s to build the postings")
+
+        for label, search in methods(db, lexical_index):
+            evaluate(label, search, query_texts, relevant, kinds)
+
+
+def run_collection(args):
+    from clients import init_clients, get_vector_store, get_lexical_index
+
+    with open(args.queries, "r", encoding="utf-8") as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+    init_clients(persist_directory=args.persist, base_url=args.base_url, vector_store=args.backend)
+    db = get_vector_store(args.collection, persist_directory=args.persist)
+    lexical_index = get_lexical_index(args.collection, persist_directory=args.persist)
+    print(f"Collection '{args.collection}': {lexical_index.count()} chunks in the lexical index, {len(cases)} queries")
+
+    query_texts = [case["query"] for case in cases]
+    relevant = [case["relevant"] for case in cases]
+    kinds = [case.get("kind", "all") for case in cases]
+    for label, search in methods(db, lexical_index):
+        evaluate(label, search, query_texts, relevant, kinds)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=100000, help="Chunks in the synthetic corpus.")
+    parser.add_argument("--dim", type=int, default=256, help="Embedding dimension of the synthetic corpus.")
+    parser.add_argument("--queries", default=None, help="JSON-lines file of queries with their relevant chunk ids.")
+    parser.add_argument("--num-queries", dest="num_queries", type=int, default=300, help="Synthetic queries.")
+    parser.add_argument("--store-options", default="{}", help="JSON options of the synthetic local vector store.")
+    parser.add_argument("--persist", default=os.path.join("rag-system", "chroma"), help="Directory of the collection.")
+    parser.add_argument("--collection", default="langchain", help="Collection to evaluate.")
+    parser.add_argument("--backend", default="chroma", help="Vector-store backend of the collection.")
+    parser.add_argument("--base-url", default=os.environ.get("OLLAMA_BASE_URL"), help="Ollama server URL.")
+    args = parser.parse_args()
+
+    if args.queries:
+        run_collection(args)
+    else:
+        run_synthetic(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Valid questions per minute: free-text quizzes regenerated whole when any
+question is malformed, versus validated questions with targeted retries in the
+numbered text format, Ollama's JSON mode and schema-constrained JSON.
+
+The model is emulated: each question it writes costs its tokens times
+--token-ms of model time, and comes out malformed with a probability that
+depends on the output mode (--text-defects, --json-defects, --schema-defects;
+structural defects such as a missing answer line or a truncated object cannot
+happen under a schema, only semantic ones such as a left-over placeholder).
+The emulated output goes through the real parsers and validator, whose CPU
+time per question is reported separately.
+
+Usage:
+    python benchmarks/bench_structured_output.py --questions 30 --quizzes 50
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'rag-system')))
+from question_schema import (
+    MULTIPLE_CHOICE,
+    OPTION_LETTERS,
+    format_question,
+    normalize_question,
+    parse_text_question,
+    stream_json_items,
+    validate_question,
+)
+
+MAX_RETRIES = 2
+PROMPT_TOKENS = 1200
+TOKENS_PER_QUESTION = 70
+TEXT_DEFECTS = ("placeholder", "missing_answer", "bad_answer", "missing_option")
+SCHEMA_DEFECTS = ("placeholder", "repeated_option")
+
+
+def write_item(rng, number, defect):
+    item = {
+        "question": f"Which process in section {number} converts light into chemical energy?",
+        "options": {letter: f"Process {letter.lower()}{number}" for letter in OPTION_LETTERS},
+        "answer": rng.choice(OPTION_LETTERS),
+    }
+    if defect == "placeholder":
+        item["options"]["C"] = "[Option 3]"
+    elif defect == "repeated_option":
+        item["options"]["D"] = item["options"]["B"]
+    elif defect == "missing_option":
+        del item["options"]["E"]
+    elif defect == "bad_answer":
+        item["answer"] = "[Correct option]"
+    elif defect == "missing_answer":
+        del item["answer"]
+    return item
+
+
+def as_text(item):
+    lines = [f"- Question: {item['question']}", "    Options:"]
+    lines.extend(f"        {letter}) {text}" for letter, text in item["options"].items())
+    if "answer" in item:
+        lines.append(f"- Answer: {item['answer']}")
+    return "\n".join(lines)
+
+
+class EmulatedModel:
+    """Writes questions with random defects and accounts the model time they take."""
+
+    def __init__(self, mode, defect_rate, token_ms, rng):
+        self.mode = mode
+        self.defect_rate = defect_rate
+        self.token_ms = token_ms
+        self.rng = rng
+        self.seconds = 0.0
+        self.calls = 0
+
+    def call(self, count):
+        """Return the raw responses of one call for `count` questions."""
+        self.calls += 1
+        self.seconds += (PROMPT_TOKENS / 10 + count * TOKENS_PER_QUESTION) * self.token_ms / 1000
+        defects = SCHEMA_DEFECTS if self.mode == "schema" else TEXT_DEFECTS
+        items = [write_item(self.rng, i, self.rng.choice(defects) if self.rng.random() < self.defect_rate else None)
+                 for i in range(count)]
+        if self.mode == "text":
+            return [as_text(item) for item in items]
+        response = json.dumps({"questions": items})
+        if self.mode == "json" and self.rng.random() < self.defect_rate:
+            # Unconstrained JSON: the response may stop in the middle of an object
+            response = response[:self.rng.randrange(len(response) // 2, len(response))]
+        chunk = 16
+        return list(stream_json_items(response[i:i + chunk] for i in range(0, len(response), chunk)))
+
+
+def read_items(mode, raw_items):
+    if mode == "text":
+        return [parse_text_question(MULTIPLE_CHOICE, text) for text in raw_items]
+    return raw_items
+
+
+def legacy_quiz(model, count):
+    """The whole quiz is regenerated until every question is well-formed."""
+    while True:
+        raw = model.call(count)
+        items = [normalize_question(MULTIPLE_CHOICE, item) for item in read_items("text", raw)]
+        if all(not validate_question(MULTIPLE_CHOICE, item) for item in items):
+            return count
+
+
+def validated_batch(model, count, mode, parse_seconds):
+    """Only rejected or missing questions are requested again."""
+    valid = 0
+    for _ in range(MAX_RETRIES + 1):
+        missing = count - valid
+        if missing <= 0:
+            break
+        raw = model.call(missing)
+        start = time.perf_counter()
+        for item in read_items(mode, raw):
+            item = normalize_question(MULTIPLE_CHOICE, item)
+            problems = validate_question(MULTIPLE_CHOICE, item)
+            if not problems:
+                format_question(MULTIPLE_CHOICE, item)
+                valid += 1
+        parse_seconds.append((time.perf_counter() - start) / max(len(raw), 1))
+    return min(valid, count)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=30, help="Questions per quiz.")
+    parser.add_argument("--quizzes", type=int, default=50, help="Quizzes per mode.")
+    parser.add_argument("--batch", type=int, default=5, help="Questions per call.")
+    parser.add_argument("--token-ms", dest="token_ms", type=float, default=25.0, help="Model time per token.")
+    parser.add_argument("--text-defects", dest="text_defects", type=float, default=0.08,
+                        help="Share of malformed questions in text mode.")
+    parser.add_argument("--json-defects", dest="json_defects", type=float, default=0.05,
+                        help="Share of malformed questions and truncated responses in JSON mode.")
+    parser.add_argument("--schema-defects", dest="schema_defects", type=float, default=0.03,
+                        help="Share of semantically invalid questions under a schema.")
+    args = parser.parse_args()
+
+    print(f"{args.quizzes} quizzes of {args.questions} multiple-choice questions, {args.batch} per call, "
+          f"{args.token_ms:.0f} ms per token")
+    runs = [
+        ("text, regenerate quiz", "legacy", args.text_defects),
+        ("text, validated", "text", args.text_defects),
+        ("json mode, validated", "json", args.json_defects),
+        ("json schema, validated", "schema", args.schema_defects),
+    ]
+    for label, mode, defect_rate in runs:
+        model = EmulatedModel("text" if mode == "legacy" else mode, defect_rate, args.token_ms, random.Random(0))
+        valid, parse_seconds = 0, []
+        for _ in range(args.quizzes):
+            if mode == "legacy":
+                valid += legacy_quiz(model, args.questions)
+                continue
+            for start in range(0, args.questions, args.batch):
+                valid += validated_batch(model, min(args.batch, args.questions - start), mode, parse_seconds)
+        validation = f"validation {statistics.mean(parse_seconds) * 1e6:6.1f} us/question" if parse_seconds else ""
+        print(f"{label:<24} {60 * valid / model.seconds:6.1f} valid questions/min  "
+              f"{model.calls / args.quizzes:6.1f} calls/quiz  {validation}")
+
+
+if __name__ == "__main__":
+    main()
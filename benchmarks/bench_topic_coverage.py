@@ -0,0 +1,118 @@
+"""
+Topic coverage of a quiz: contexts retrieved for each bucket's query versus
+contexts spread over the topics of the corpus by the topic planner.
+
+A synthetic corpus has topics of uneven size, each with chunks embedded near
+its center. A quiz of --questions questions is made of buckets (a question
+type and difficulty) of --bucket-size questions. Every bucket query embeds
+near the center of the whole corpus, as a query written from the corpus
+summary does, so the baseline retrieves the same few chunks for every bucket
+as generation did before the planner. With the planner, the questions are
+apportioned to k-means topics and each takes its own chunk from its topic.
+
+Reports the share of true topics the quiz draws on, the share of the corpus
+text those topics hold, and the distinct chunks used; then the time to plan
+corpora of growing size.
+
+Usage:
+    python benchmarks/bench_topic_coverage.py --chunks 2000 --topics 20 --questions 30
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'rag-system')))
+import numpy as np
+from topic_planner import TopicPlanner
+
+RETRIEVAL_K = 5
+PLAN_SIZES = (10000, 100000)
+
+
+class SyntheticStore:
+    """The part of a vector store the planner uses."""
+
+    def __init__(self, name, texts, vectors):
+        self.name = name
+        self.texts = texts
+        self.vectors = vectors
+
+    def get_vectors(self):
+        return [str(i) for i in range(len(self.texts))], self.texts, self.vectors
+
+
+def make_corpus(chunks, topics, dim, rng):
+    # Zipf-like topic sizes: a few long chapters and many short ones
+    sizes = 1.0 / np.arange(1, topics + 1) ** 0.8
+    topic_of = rng.choice(topics, size=chunks, p=sizes / sizes.sum())
+    centers = rng.normal(size=(topics, dim))
+    vectors = centers[topic_of] + 0.5 * rng.normal(size=(chunks, dim))
+    vectors = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+    texts = [f"chunk {i} " + "x" * int(rng.integers(600, 1400)) for i in range(chunks)]
+    return texts, vectors, topic_of
+
+
+def bucket_queries(vectors, buckets, rng):
+    mean = vectors.mean(axis=0)
+    queries = mean + 0.02 * np.linalg.norm(mean) * rng.normal(size=(buckets, vectors.shape[1]))
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def report(label, used, topic_of, texts):
+    used = sorted(set(used))
+    covered = set(topic_of[used].tolist())
+    lengths = np.array([len(text) for text in texts], dtype=np.float64)
+    text_share = lengths[np.isin(topic_of, list(covered))].sum() / lengths.sum()
+    print(f"{label:<10} topics {len(covered):3d}/{topic_of.max() + 1} "
+          f"text of covered topics {text_share:6.1%}  distinct chunks {len(used)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=2000, help="Chunks in the synthetic corpus.")
+    parser.add_argument("--topics", type=int, default=20, help="True topics of the synthetic corpus.")
+    parser.add_argument("--dim", type=int, default=256, help="Embedding dimension.")
+    parser.add_argument("--questions", type=int, default=30, help="Questions in the quiz.")
+    parser.add_argument("--bucket-size", dest="bucket_size", type=int, default=5, help="Questions per bucket.")
+    parser.add_argument("--max-topics", dest="max_topics", type=int, default=32, help="Topics the planner makes at most.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    texts, vectors, topic_of = make_corpus(args.chunks, args.topics, args.dim, rng)
+    buckets = [min(args.bucket_size, args.questions - start) for start in range(0, args.questions, args.bucket_size)]
+    queries = bucket_queries(vectors, len(buckets), rng)
+    print(f"{args.chunks} chunks on {args.topics} topics, a quiz of {args.questions} questions "
+          f"in {len(buckets)} buckets, {RETRIEVAL_K} chunks per call")
+
+    # Baseline: each bucket is written from the chunks retrieved for its query
+    baseline = []
+    for query in queries:
+        baseline.extend(np.argsort(-(vectors @ query))[:RETRIEVAL_K].tolist())
+    report("retrieval", baseline, topic_of, texts)
+
+    planner = TopicPlanner(max_topics=args.max_topics)
+    start = time.perf_counter()
+    plan = planner.plan(SyntheticStore("bench", texts, vectors), "v1")
+    plan_seconds = time.perf_counter() - start
+    coverage = plan.start_quiz(args.questions)
+    chunk_of_text = {text: i for i, text in enumerate(texts)}
+    planned, offset = [], 0
+    for query, count in zip(queries, buckets):
+        topics = coverage.topics(offset, count)
+        for group_start in range(0, len(topics), RETRIEVAL_K):
+            group = topics[group_start:group_start + RETRIEVAL_K]
+            planned.extend(chunk_of_text[text] for text in coverage.contexts(query, group))
+        offset += count
+    report("planner", planned, topic_of, texts)
+    print(f"planned in {plan_seconds:.2f} s")
+
+    for size in PLAN_SIZES:
+        texts, vectors, _ = make_corpus(size, args.max_topics, args.dim, rng)
+        start = time.perf_counter()
+        TopicPlanner(max_topics=args.max_topics).plan(SyntheticStore(f"bench-{size}", texts, vectors), "v1")
+        print(f"plan of {size} chunks: {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
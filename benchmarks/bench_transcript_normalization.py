@@ -0,0 +1,109 @@
+"""
+Transcript normalization time on multi-hour lecture captions: the previous
+line-by-line implementation (string concatenation, per-line regex, and a
+wrap that re-sums the line length per word) versus the streaming,
+linear-time normalizer.
+
+Auto-generated captions often have no punctuation, so a whole lecture can
+end up as one "sentence"; the --punctuated flag adds sentence endings.
+
+Usage:
+    python benchmarks/bench_transcript_normalization.py --hours 1 3
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'rag-system')))
+from transcript_normalizer import clean_transcript, normalize_segments
+
+WORDS = ("so today we are going to talk about photosynthesis and how plants turn light "
+         "energy into chemical energy inside the chloroplast which is really important").split()
+SEGMENT_SECONDS = 2.5
+
+
+def build_segments(hours, punctuated, seed=0):
+    """Synthetic caption segments of 6-10 words each."""
+    rng = random.Random(seed)
+    segments = []
+    for i in range(int(hours * 3600 / SEGMENT_SECONDS)):
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 10)))
+        if punctuated and rng.random() < 0.3:
+            text += "."
+        if rng.random() < 0.01:
+            text = "[Music] " + text.replace("and", "&amp;")
+        segments.append({"text": text, "start": i * SEGMENT_SECONDS, "duration": SEGMENT_SECONDS})
+    return segments
+
+
+def legacy_clean_transcript(transcript, max_line_length=80):
+    """The previous implementation, kept here for comparison."""
+    cleaned_lines = []
+    current_sentence = ""
+    for line in transcript.splitlines():
+        line = line.strip()
+        if line:
+            if current_sentence:
+                current_sentence += " " + line
+            else:
+                current_sentence = line
+            if re.search(r'[.!?]$', line):
+                cleaned_lines.extend(legacy_wrap_line(current_sentence, max_line_length))
+                current_sentence = ""
+    if current_sentence:
+        cleaned_lines.extend(legacy_wrap_line(current_sentence, max_line_length))
+    return "\n".join(cleaned_lines)
+
+
+def legacy_wrap_line(sentence, max_length):
+    words = sentence.split()
+    lines = []
+    current_line = []
+    for word in words:
+        if sum(len(w) for w in current_line) + len(current_line) + len(word) > max_length:
+            lines.append(" ".join(current_line))
+            current_line = [word]
+        else:
+            current_line.append(word)
+    if current_line:
+        lines.append(" ".join(current_line))
+    return lines
+
+
+def timed(function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hours", type=float, nargs="+", default=[1, 3], help="Lecture lengths to try.")
+    parser.add_argument("--punctuated", action="store_true", help="End about 30%% of captions with a period.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the best is reported.")
+    args = parser.parse_args()
+
+    for hours in args.hours:
+        segments = build_segments(hours, args.punctuated)
+        raw_text = "\n".join(segment["text"] for segment in segments)
+
+        legacy_ms, legacy = timed(lambda: legacy_clean_transcript(raw_text), args.repeat)
+        clean_ms, cleaned = timed(lambda: clean_transcript(raw_text), args.repeat)
+        stream_ms, normalized = timed(lambda: list(normalize_segments(segments)), args.repeat)
+        assert cleaned.split() == legacy.split()
+
+        print(
+            f"{hours:4.1f} h, {len(segments):6d} segments, {len(raw_text) / 1e6:5.2f} MB   "
+            f"legacy clean {legacy_ms:9.1f} ms   clean {clean_ms:7.1f} ms   "
+            f"segment normalization {stream_ms:6.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Vector-store backends: Chroma (HNSW) versus the local memory-mapped store,
+scanned exactly, with an IVF index, and with an int8 IVF index, on clustered
+synthetic embeddings.
+
+Reports the insert time, the size on disk, the query latency and recall@10
+against exact search, and, for several worker processes opening the same
+collection, the time to open it and answer a first query and the memory
+each worker uses on its own (private) next to its resident size.
+
+Usage:
+    python benchmarks/bench_vector_store.py --rows 20000 --dim 768 --workers 4
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'rag-system')))
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from vector_stores import open_vector_store
+
+K = 10
+BATCH = 1000
+CONFIGS = [
+    ("chroma (HNSW)", "chroma", {}),
+    ("local, exact scan", "local", {"ivf_min_rows": 10 ** 12}),
+    ("local, IVF float32", "local", {"ivf_min_rows": 0}),
+    ("local, IVF int8", "local", {"ivf_min_rows": 0, "dtype": "int8"}),
+]
+
+
+class QueryTable(Embeddings):
+    """Embeddings whose query "q<i>" is row i of a saved matrix."""
+
+    def __init__(self, path):
+        self.queries = np.load(path, mmap_mode="r")
+
+    def embed_documents(self, texts):
+        raise NotImplementedError
+
+    def embed_query(self, text):
+        return self.queries[int(text[1:])].tolist()
+
+
+def make_data(rows, dim, queries, rng):
+    centers = rng.normal(size=(max(8, rows // 100), dim))
+    vectors = centers[rng.integers(0, len(centers), rows)] + 0.6 * rng.normal(size=(rows, dim))
+    query_vectors = centers[rng.integers(0, len(centers), queries)] + 0.6 * rng.normal(size=(queries, dim))
+    # Unit length like the embeddings of the Ollama models, so that L2 and cosine rank alike
+    normalize = lambda matrix: (matrix / np.linalg.norm(matrix, axis=1, keepdims=True)).astype(np.float32)
+    return normalize(vectors), normalize(query_vectors)
+
+
+def memory():
+    """Resident and private memory of this process in MB."""
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Private_Clean:", "Private_Dirty:"):
+                values[parts[0]] = int(parts[1]) / 1024
+    return values["Rss:"], values["Private_Clean:"] + values["Private_Dirty:"]
+
+
+def worker(backend, options, directory, query_path, queries, result_queue):
+    """Open the collection in a fresh process, query it and report time and memory."""
+    _, private_before = memory()
+    start = time.perf_counter()
+    store = open_vector_store(backend, "bench", directory, QueryTable(query_path), **options)
+    store.similarity_search_with_score("q0", k=K)
+    first = time.perf_counter() - start
+    for i in range(queries):
+        store.similarity_search_with_score(f"q{i}", k=K)
+    rss, private = memory()
+    result_queue.put((first, rss, private - private_before))
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000, help="Vectors in the collection.")
+    parser.add_argument("--dim", type=int, default=768, help="Embedding dimension.")
+    parser.add_argument("--queries", type=int, default=200, help="Queries for latency and recall.")
+    parser.add_argument("--workers", type=int, default=4, help="Processes opening the same collection.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors, query_vectors = make_data(args.rows, args.dim, args.queries, rng)
+    exact = [set(np.argsort(-(vectors @ q))[:K]) for q in query_vectors]
+    ids = [f"{i}" for i in range(args.rows)]
+    print(f"{args.rows} vectors of {args.dim} dimensions, {args.queries} queries, k={K}, {args.workers} workers")
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as root:
+        query_path = os.path.join(root, "queries.npy")
+        np.save(query_path, query_vectors)
+
+        for label, backend, options in CONFIGS:
+            directory = os.path.join(root, label.replace(" ", "_").replace(",", ""))
+            store = open_vector_store(backend, "bench", directory, QueryTable(query_path), **options)
+            start = time.perf_counter()
+            for begin in range(0, args.rows, BATCH):
+                batch = slice(begin, begin + BATCH)
+                store.upsert_embeddings(ids[batch], vectors[batch].tolist(), ids[batch], [{"n": 0}] * len(ids[batch]))
+            insert_seconds = time.perf_counter() - start
+
+            latencies, recalls = [], []
+            for i in range(args.queries):
+                start = time.perf_counter()
+                results = store.similarity_search_with_score(f"q{i}", k=K)
+                latencies.append(time.perf_counter() - start)
+                recalls.append(len({int(doc.page_content) for doc, _ in results} & exact[i]) / K)
+            del store
+
+            result_queue = context.Queue()
+            processes = [context.Process(target=worker, args=(backend, options, directory, query_path,
+                                                                 args.queries, result_queue))
+                         for _ in range(args.workers)]
+            for process in processes:
+                process.start()
+            results = [result_queue.get() for _ in processes]
+            for process in processes:
+                process.join()
+
+            print(
+                f"{label:<20} insert {insert_seconds:6.1f} s  disk {directory_size(directory) / 2 ** 20:6.1f} MB  "
+                f"query p50 {statistics.median(latencies) * 1000:6.2f} ms  recall@{K} {statistics.mean(recalls):.3f}  "
+                f"worker open+first query {statistics.mean(r[0] for r in results):5.2f} s  "
+                f"RSS {statistics.mean(r[1] for r in results):6.1f} MB  "
+                f"private {statistics.mean(r[2] for r in results):6.1f} MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Minimal local stand-in for the Ollama HTTP API, used by the benchmarks.
+
+Implements /api/embed, /api/embeddings and /api/generate with a fixed,
+configurable latency so that client-side overhead can be measured without
+a GPU or real models.
+"""
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMBEDDING_DIM = 256
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def embed_text(text, dim=EMBEDDING_DIM):
+    """
+    Deterministic bag-of-words embedding so that similar texts get similar vectors.
+    """
+    vector = [0.0] * dim
+    for word in WORD_PATTERN.findall(text.lower()):
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "little") % dim
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = sum(v * v for v in vector) ** 0.5 or 1.0
+    return [v / norm for v in vector]
+
+
+BATCH_PATTERN = re.compile(r"write (\d+) different questions")
+_question_numbers = itertools.count()
+
+
+def stub_question():
+    """Return a statement on different made-up terms each time, so that questions are not near-duplicates."""
+    digest = hashlib.md5(str(next(_question_numbers)).encode("utf-8")).hexdigest()
+    terms = " ".join(f"term{digest[i:i + 4]}" for i in range(0, 24, 4))
+    return f"True or False? The ______ of {terms}."
+
+
+def sample_json(schema, name="value"):
+    """
+    Return a value matching a JSON schema, like a model constrained to it would write.
+    """
+    if "enum" in schema:
+        return schema["enum"][0]
+    kind = schema.get("type")
+    if kind == "object":
+        return {key: sample_json(value, key) for key, value in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [sample_json(schema.get("items", {}), name) for _ in range(schema.get("minItems", 1))]
+    if kind in ("integer", "number"):
+        return 0
+    if kind == "boolean":
+        return True
+    if name == "question":
+        return stub_question()
+    return "True" if name == "answer" else f"Stub {name}."
+
+
+def default_completion(prompt, body):
+    """Return a canned completion in the question format used by the app, or in the requested JSON format."""
+    batch = BATCH_PATTERN.search(prompt)
+    count = int(batch.group(1)) if batch else 1
+    output_format = body.get("format")
+    if isinstance(output_format, dict):
+        return json.dumps(sample_json(output_format))
+    if output_format == "json":
+        return json.dumps({"questions": [{"question": stub_question(), "answer": "True"} for _ in range(count)]})
+
+    if batch:
+        return "\n".join(f"{i}. - Question: {stub_question()}\n- Answer: True" for i in range(1, count + 1))
+    return f"- Question: {stub_question()}\n- Answer: True"
+
+
+class StubOllamaServer:
+    """
+    Threaded stub server. Use as a context manager; `base_url` points at it.
+
+    Args:
+        generate_latency (float): Seconds spent per /api/generate call.
+        embed_latency (float): Seconds spent per /api/embed call.
+        completion (callable): Maps (prompt, request body) to the completion text.
+        embed_latency_per_text (float): Extra seconds per embedded text of a call.
+        embed_error_rate (float): Fraction of /api/embed calls that fail with HTTP 500.
+    """
+
+    def __init__(self, generate_latency=0.05, embed_latency=0.01, completion=default_completion,
+                 embed_latency_per_text=0.0, embed_error_rate=0.0):
+        self.generate_latency = generate_latency
+        self.embed_latency = embed_latency
+        self.completion = completion
+        self.embed_latency_per_text = embed_latency_per_text
+        self.embed_error_rate = embed_error_rate
+        self._random = random.Random(0)
+        self.counts = {"generate": 0, "embed": 0, "embedded_texts": 0, "connections": 0, "embed_errors": 0}
+        self._counts_lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, name, amount=1):
+        with self._counts_lock:
+            self.counts[name] += amount
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                stub.count("connections")
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._send_json({"models": []})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+
+                if self.path in ("/api/embed", "/api/embeddings"):
+                    inputs = body.get("input", body.get("prompt", ""))
+                    if isinstance(inputs, str):
+                        inputs = [inputs]
+                    time.sleep(stub.embed_latency + stub.embed_latency_per_text * len(inputs))
+                    stub.count("embed")
+                    if stub._random.random() < stub.embed_error_rate:
+                        stub.count("embed_errors")
+                        self.send_error(500)
+                        return
+                    stub.count("embedded_texts", len(inputs))
+                    vectors = [embed_text(text) for text in inputs]
+                    if self.path == "/api/embeddings":
+                        self._send_json({"embedding": vectors[0]})
+                    else:
+                        self._send_json({"model": body.get("model"), "embeddings": vectors})
+                    return
+
+                if self.path in ("/api/generate", "/api/chat"):
+                    time.sleep(stub.generate_latency)
+                    stub.count("generate")
+                    prompt = body.get("prompt") or json.dumps(body.get("messages", []))
+                    text = stub.completion(prompt, body)
+                    self._send_generate(body, text)
+                    return
+
+                self.send_error(404)
+
+            def _send_generate(self, body, text):
+                final = {"model": body.get("model"), "done": True, "done_reason": "stop", "response": ""}
+                if not body.get("stream", True):
+                    final["response"] = text
+                    self._send_json(final)
+                    return
+
+                # Stream word by word as newline-delimited JSON, like Ollama does
+                pieces = re.findall(r"\S+\s*|\s+", text) or [""]
+                lines = [json.dumps({"model": body.get("model"), "done": False, "response": piece}) for piece in pieces]
+                lines.append(json.dumps(final))
+                payload = ("\n".join(lines) + "\n").encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
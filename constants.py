@@ -1,3 +1,5 @@
+import os
+
 PROMPT_TEMPLATE_FOR_QUESTIONS = """
 Answer the question based only on the following context:
 
@@ -20,14 +22,228 @@ The instruction must describe how the question tests the reader based on the abo
 Do not include examples, formatting, or additional details—return only the instruction sentence.
 """
 
+PROMPT_TEMPLATE_FOR_BATCH_QUESTIONS = """
+Answer the question based only on the following context:
+
+{context}
+
+---
+
+Based on the above context, write {count} different questions for this request: {question}
+
+Number the questions as "1.", "2.", and so on, each at the start of a new line, and write every question in the format given above.
+Return only the {count} numbered questions.
+"""
+
+PROMPT_TEMPLATE_FOR_TOPIC_QUESTIONS = """
+Answer the question based only on the following numbered context sections:
+
+{context}
+
+---
+
+Based on the above context, write {count} different questions for this request: {question}
+
+Base each question on a different numbered section, in order, starting with section [1].
+Number the questions as "1.", "2.", and so on, each at the start of a new line, and write every question in the format given above.
+Return only the {count} numbered questions.
+"""
+
+PROMPT_TEMPLATE_FOR_JSON_QUESTIONS = """
+Answer the question based only on the following context:
+
+{context}
+
+---
+
+Based on the above context, write {count} different questions for this request: {question}
+
+Return a JSON object with a "questions" array of exactly {count} objects, one per question, each with the fields {fields}.
+{feedback}
+"""
+
+PROMPT_TEMPLATE_FOR_JSON_TOPIC_QUESTIONS = """
+Answer the question based only on the following numbered context sections:
+
+{context}
+
+---
+
+Based on the above context, write {count} different questions for this request: {question}
+
+Base each question on a different numbered section, in order, starting with section [1].
+Return a JSON object with a "questions" array of exactly {count} objects, one per question, each with the fields {fields}.
+{feedback}
+"""
+
 ALLOWED_EXTENSIONS = {'pdf', 'txt', 'doc', 'docx'}
 
 CHROMA_FOLDER_PATH = "rag-system\chroma"
 UPLOAD_FOLDER_PATH = "rag-system\data"
 DOWNLOAD_FOLDER_PATH = "downloads"
+JOBS_DB_PATH = "jobs.db"
 MAX_CONTENT_LENGTH =  5 * 1024 * 1024
 CHARACTER_LIMIT = 100000
 
+# Upload admission: uploads whose estimated text exceeds CHARACTER_LIMIT, or
+# would take a collection past CORPUS_TOKEN_BUDGET tokens or all the
+# collections of a session past TENANT_TOKEN_BUDGET, are rejected before
+# they are stored. Each session may upload UPLOAD_TOKENS_PER_MINUTE tokens, in
+# bursts of up to UPLOAD_BURST_TOKENS; an upload beyond that is rejected
+# with the number of seconds after which it can be retried.
+# Ingestion and generation times are estimated from the throughput of recent
+# runs, starting from the two defaults below
+ADMISSION_DB_PATH = os.path.join("rag-system", "admission.db")
+CORPUS_TOKEN_BUDGET = 500000
+TENANT_TOKEN_BUDGET = 2000000
+UPLOAD_TOKENS_PER_MINUTE = 100000
+UPLOAD_BURST_TOKENS = 200000
+INGESTION_TOKENS_PER_SECOND = 2000
+GENERATION_SECONDS_PER_QUESTION = 6
+
+# Per-session corpora: registry, shared store of uploaded files, estimated disk
+# budget before idle corpora are evicted, seconds after which unused corpora
+# (with and without documents) expire, and memory for loaded collections
+CORPORA_DB_PATH = os.path.join("rag-system", "corpora.db")
+BLOB_FOLDER_PATH = os.path.join("rag-system", "blobs")
+CORPUS_DISK_BUDGET = 2 * 1024 ** 3
+CORPUS_MAX_IDLE = 30 * 24 * 3600
+EMPTY_CORPUS_MAX_IDLE = 24 * 3600
+CHROMA_MEMORY_LIMIT = 512 * 1024 ** 2
+
+# Vector-store backend: "chroma", or "local" for memory-mapped vectors with an
+# IVF index shared by worker processes. Local options: "dtype" ("float32" or
+# "int8"), "nlist" (IVF lists), "nprobe" (lists scanned per query) and
+# "ivf_min_rows" (collection size from which the index is built)
+VECTOR_STORE_BACKEND = "chroma"
+VECTOR_STORE_OPTIONS = {}
+
+# Ollama settings shared by the RAG client registry
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://127.0.0.1:11434")
+OLLAMA_KEEP_ALIVE = "30m"
+LLM_MODEL = "llama3.2:3b"
+SMALL_LLM_MODEL = "llama3.2:1b"
+EMBEDDING_MODEL = "nomic-embed-text"
+
+# Concurrent question generation: buckets generated in parallel, and the cap on
+# simultaneous requests per model (match OLLAMA_NUM_PARALLEL on the server)
+GENERATION_WORKERS = 4
+OLLAMA_MODEL_CONCURRENCY = {
+    LLM_MODEL: 2,
+    SMALL_LLM_MODEL: 2,
+}
+
+# Quiz generation jobs run at the same time in the background
+JOB_WORKERS = 2
+
+# Seconds between keep-alive comments on idle progress event streams
+PROGRESS_HEARTBEAT_SECONDS = 15
+
+# Map-reduce summarization: estimated tokens of content per LLM call and parallel calls
+SUMMARY_TOKEN_BUDGET = 3000
+SUMMARY_MAX_WORKERS = 4
+
+# Ingestion embedding stage: chunks per request, concurrent requests and
+# retries of a failed batch
+EMBEDDING_BATCH_SIZE = 64
+EMBEDDING_WORKERS = 4
+EMBEDDING_MAX_RETRIES = 3
+
+# Persistent LLM output caches: dynamic prompts by exact key, and (optionally)
+# whole batched answers by query-embedding similarity
+CACHE_FOLDER_PATH = os.path.join("rag-system", "cache")
+DYNAMIC_PROMPT_CACHE_TTL = 7 * 24 * 60 * 60
+DYNAMIC_PROMPT_CACHE_MAX_ENTRIES = 10000
+SEMANTIC_CACHE_ENABLED = False
+SEMANTIC_CACHE_THRESHOLD = 0.95
+# Fetched YouTube transcripts, one file per video and language
+TRANSCRIPT_CACHE_PATH = os.path.join(CACHE_FOLDER_PATH, "transcripts")
+# Embedding vectors by model and chunk text, reused across uploads and resets
+EMBEDDING_CACHE_PATH = os.path.join(CACHE_FOLDER_PATH, "embeddings")
+
+# Token-aware chunking: chunks are sized so that RETRIEVAL_K of them fill the
+# model's context window after PROMPT_RESERVED_TOKENS for the instructions and
+# the answer. Tokens are counted with the model's tokenizer.json if a path is
+# set and the `tokenizers` package is installed, and estimated otherwise.
+LLM_NUM_CTX = 4096
+PROMPT_RESERVED_TOKENS = 1024
+RETRIEVAL_K = 5
+CHUNK_TOKENIZER_PATH = None
+
+# Hybrid retrieval: BM25 results from a lexical index built at ingestion time
+# are fused with the dense results by reciprocal rank fusion, taking
+# RETRIEVAL_FETCH_K candidates from each. RERANKER reorders the fused
+# candidates: None, "overlap" (query-term and phrase overlap, on the CPU) or a
+# cross-encoder model name (needs the `sentence-transformers` package)
+HYBRID_RETRIEVAL = True
+RETRIEVAL_FETCH_K = 20
+RERANKER = None
+
+# Topic-coverage planning: the chunks of a corpus are clustered into at most
+# MAX_QUIZ_TOPICS topics, and the questions of a quiz are spread over them in
+# proportion to each topic's share of the text, each written from a chunk of
+# its own topic
+TOPIC_PLANNING = True
+MAX_QUIZ_TOPICS = 32
+
+# Model routing: each LLM stage calls the first model of its chain, and the
+# next one when a call fails (the model is skipped for MODEL_FAILURE_COOLDOWN
+# seconds). Options per model: "temperature", "num_ctx", "num_predict" and
+# "keep_alive". A "speculative" route writes question batches with its first
+# model and asks the next one for the questions rejected by the validator;
+# difficulties in "large_only" always go to the second model
+MODEL_ROUTES = {
+    "dynamic_prompt": {"models": [
+        {"model": SMALL_LLM_MODEL, "temperature": 0.3, "num_ctx": LLM_NUM_CTX, "num_predict": 160},
+        {"model": LLM_MODEL, "temperature": 0.3, "num_ctx": LLM_NUM_CTX, "num_predict": 160},
+    ]},
+    "summary": {"models": [
+        {"model": SMALL_LLM_MODEL, "temperature": 0.2, "num_ctx": LLM_NUM_CTX, "num_predict": 512},
+        {"model": LLM_MODEL, "temperature": 0.2, "num_ctx": LLM_NUM_CTX, "num_predict": 512},
+    ]},
+    "questions": {
+        "models": [
+            {"model": SMALL_LLM_MODEL, "num_ctx": LLM_NUM_CTX},
+            {"model": LLM_MODEL, "num_ctx": LLM_NUM_CTX},
+        ],
+        "speculative": True,
+        "large_only": ["difficult"],
+    },
+}
+MODEL_FAILURE_COOLDOWN = 60
+
+# Estimated tokens of retrieved context in each dynamic-query prompt
+CONTEXT_TOKEN_BUDGET = 2000
+
+# Extra batch calls allowed for questions missing from a batched response
+MAX_BATCH_RETRIES = 2
+
+# Structured output: None for numbered text, "json" for Ollama's JSON mode with
+# the fields described in the prompt, or "schema" to constrain the output to
+# the JSON schema of the question type (Ollama 0.5 or later). Questions are
+# validated against their type's schema in every mode, and only the rejected
+# ones are requested again
+STRUCTURED_OUTPUT = "schema"
+
+# Near-duplicate questions: a question whose embedding has at least
+# DUPLICATE_SIMILARITY cosine similarity with one already in the quiz, or with
+# one issued for the same corpus by an earlier quiz, is generated again
+DEDUP_ENABLED = True
+DUPLICATE_SIMILARITY = 0.9
+QUESTION_HISTORY_PATH = os.path.join(CACHE_FOLDER_PATH, "question_history.sqlite")
+
+# Quiz downloads are rendered from the saved quiz file on request and kept in
+# EXPORT_CACHE_PATH; the least recently downloaded files are removed beyond
+# EXPORT_CACHE_MAX_BYTES and after EXPORT_CACHE_MAX_AGE seconds
+EXPORT_CACHE_PATH = os.path.join(DOWNLOAD_FOLDER_PATH, "exports")
+EXPORT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+EXPORT_CACHE_MAX_AGE = 7 * 24 * 60 * 60
+# Each job's quiz file is kept in a folder of its own in DOWNLOAD_FOLDER_PATH;
+# folders not downloaded for QUIZ_FOLDER_MAX_AGE seconds are removed, and the
+# least recently used ones beyond QUIZ_FOLDER_MAX_BYTES
+QUIZ_FOLDER_MAX_BYTES = 256 * 1024 * 1024
+QUIZ_FOLDER_MAX_AGE = 30 * 24 * 60 * 60
+
 question_types = [
         "True/False",
         "Multiple Choice",
@@ -0,0 +1,216 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# Background job subsystem for quiz generation. Jobs are stored in a SQLite
+# table so that queued and interrupted jobs are picked up again after a
+# restart, and run on a bounded pool of worker threads.
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+_lock = threading.Lock()
+_state = {"db_path": None, "handler": None, "executor": None, "on_cancelled": None}
+_cancel_events = {}
+
+
+class JobCancelled(Exception):
+    """Raised inside a job handler when its job has been cancelled."""
+
+
+def start_job_workers(db_path, handler, max_workers=2, on_cancelled=None):
+    """
+    Open the job table and start the worker pool. Safe to call more than once.
+
+    Jobs left queued or running by a previous process are queued again.
+
+    Args:
+        db_path (str): Path of the SQLite job database.
+        handler (callable): Called as handler(job_id, payload, is_cancelled) and returns the job result.
+        max_workers (int): The number of jobs run at the same time.
+        on_cancelled (callable, optional): Called as on_cancelled(job_id) when a
+            queued job is cancelled, as its handler will never run to report it,
+            and when a job is cancelled after its handler last checked.
+    """
+    with _lock:
+        if _state["executor"] is not None:
+            return
+        _state.update({
+            "db_path": db_path,
+            "handler": handler,
+            "executor": ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job"),
+            "on_cancelled": on_cancelled,
+        })
+        with _connect() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            pending = [row[0] for row in conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created_at", (QUEUED, RUNNING)
+            )]
+
+    for job_id in pending:
+        print(f"Resuming job {job_id}")
+        _schedule(job_id)
+
+
+def stop_job_workers():
+    """
+    Stop accepting jobs and wait for running ones to finish.
+    """
+    with _lock:
+        executor = _state["executor"]
+        _state["executor"] = None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def submit_job(payload, on_submitted=None):
+    """
+    Queue a new job.
+
+    Args:
+        payload (dict): JSON-serializable job input.
+        on_submitted (callable, optional): Called as on_submitted(job_id) once the
+            job is stored and before a worker can pick it up, e.g. to publish
+            its initial progress without overwriting the worker's.
+
+    Returns:
+        str: The job ID.
+    """
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    with _connect() as conn:
+        conn.execute(
+            "INSERT INTO jobs (id, status, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (job_id, QUEUED, json.dumps(payload), now, now)
+        )
+    if on_submitted is not None:
+        on_submitted(job_id)
+    _schedule(job_id)
+    return job_id
+
+
+def get_job(job_id):
+    """
+    Look up a job.
+
+    Returns:
+        dict: The job's id, status, payload, result and error, or None if unknown.
+    """
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT id, status, payload, result, error, created_at, updated_at FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+    if row is None:
+        return None
+    return {
+        "id": row[0],
+        "status": row[1],
+        "payload": json.loads(row[2]),
+        "result": row[3],
+        "error": row[4],
+        "created_at": row[5],
+        "updated_at": row[6],
+    }
+
+
+def cancel_job(job_id):
+    """
+    Cancel a queued or running job.
+
+    Returns:
+        bool: True if the job was cancelled, False if it had already finished or is unknown.
+    """
+    with _connect() as conn:
+        queued = conn.execute(
+            "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+            (CANCELLED, time.time(), job_id, QUEUED)
+        ).rowcount > 0
+        running = not queued and conn.execute(
+            "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+            (CANCELLED, time.time(), job_id, RUNNING)
+        ).rowcount > 0
+    with _lock:
+        event = _cancel_events.get(job_id)
+    if event is not None:
+        event.set()
+    # A running job reports its own cancellation; a queued one never starts
+    if queued and _state["on_cancelled"] is not None:
+        _state["on_cancelled"](job_id)
+    return queued or running
+
+
+def _schedule(job_id):
+    """Hand a job to the worker pool."""
+    with _lock:
+        _cancel_events[job_id] = threading.Event()
+    _state["executor"].submit(_run_job, job_id)
+
+
+def _run_job(job_id):
+    """Run one job and record its outcome."""
+    with _lock:
+        event = _cancel_events[job_id]
+    try:
+        job = get_job(job_id)
+        if job is None or job["status"] == CANCELLED:
+            return
+
+        _set_status(job_id, RUNNING)
+        try:
+            result = _state["handler"](job_id, job["payload"], event.is_set)
+        except JobCancelled:
+            print(f"Job {job_id} cancelled.")
+            return
+        except Exception as e:
+            print(f"Job {job_id} failed: {str(e)}")
+            _set_status(job_id, FAILED, error=str(e))
+            return
+
+        if not event.is_set():
+            _set_status(job_id, COMPLETED, result=result)
+        elif _state["on_cancelled"] is not None:
+            # Cancelled after the handler's last check: its result is discarded
+            _state["on_cancelled"](job_id)
+    finally:
+        with _lock:
+            _cancel_events.pop(job_id, None)
+
+
+def _set_status(job_id, status, result=None, error=None):
+    """Update a job unless it has been cancelled in the meantime."""
+    with _connect() as conn:
+        conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ? AND status != ?",
+            (status, result, error, time.time(), job_id, CANCELLED)
+        )
+
+
+@contextmanager
+def _connect():
+    """Open a connection to the job database; one per call keeps threads independent."""
+    os.makedirs(os.path.dirname(_state["db_path"]) or ".", exist_ok=True)
+    conn = sqlite3.connect(_state["db_path"], timeout=30)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
@@ -1,47 +1,226 @@
+import math
 import os
-import shutil
-import subprocess
 import re
 import sys
-from PyPDF2 import PdfReader
-from docx import Document
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from flask import jsonify, url_for
 from youtube_transcript_api import YouTubeTranscriptApi
 from youtube_transcript_api._errors import (
     TranscriptsDisabled, NoTranscriptFound, VideoUnavailable
 )
-from youtube_transcript_api.formatters import TextFormatter
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from werkzeug.utils import secure_filename
 from constants import (
     PROMPT_TEMPLATE_FOR_QUESTIONS,
     PROMPT_TEMPLATE_FOR_PROMPTS, 
+    PROMPT_TEMPLATE_FOR_BATCH_QUESTIONS,
+    PROMPT_TEMPLATE_FOR_TOPIC_QUESTIONS,
+    PROMPT_TEMPLATE_FOR_JSON_QUESTIONS,
+    PROMPT_TEMPLATE_FOR_JSON_TOPIC_QUESTIONS,
     ALLOWED_EXTENSIONS, 
     CHROMA_FOLDER_PATH,
     UPLOAD_FOLDER_PATH, 
     DOWNLOAD_FOLDER_PATH,
+    CHARACTER_LIMIT,
+    ADMISSION_DB_PATH,
+    CORPUS_TOKEN_BUDGET,
+    TENANT_TOKEN_BUDGET,
+    UPLOAD_TOKENS_PER_MINUTE,
+    UPLOAD_BURST_TOKENS,
+    INGESTION_TOKENS_PER_SECOND,
+    GENERATION_SECONDS_PER_QUESTION,
+    OLLAMA_BASE_URL,
+    OLLAMA_KEEP_ALIVE,
+    LLM_MODEL,
+    EMBEDDING_MODEL,
+    SUMMARY_TOKEN_BUDGET,
+    SUMMARY_MAX_WORKERS,
+    CONTEXT_TOKEN_BUDGET,
+    CACHE_FOLDER_PATH,
+    DYNAMIC_PROMPT_CACHE_TTL,
+    DYNAMIC_PROMPT_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_THRESHOLD,
+    EMBEDDING_CACHE_PATH,
+    CORPORA_DB_PATH,
+    BLOB_FOLDER_PATH,
+    CORPUS_DISK_BUDGET,
+    CORPUS_MAX_IDLE,
+    EMPTY_CORPUS_MAX_IDLE,
+    CHROMA_MEMORY_LIMIT,
+    VECTOR_STORE_BACKEND,
+    VECTOR_STORE_OPTIONS,
+    TRANSCRIPT_CACHE_PATH,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_WORKERS,
+    EMBEDDING_MAX_RETRIES,
+    LLM_NUM_CTX,
+    PROMPT_RESERVED_TOKENS,
+    RETRIEVAL_K,
+    CHUNK_TOKENIZER_PATH,
+    HYBRID_RETRIEVAL,
+    RETRIEVAL_FETCH_K,
+    RERANKER,
+    TOPIC_PLANNING,
+    MAX_QUIZ_TOPICS,
+    MAX_BATCH_RETRIES,
+    STRUCTURED_OUTPUT,
+    DEDUP_ENABLED,
+    DUPLICATE_SIMILARITY,
+    QUESTION_HISTORY_PATH,
+    EXPORT_CACHE_PATH,
+    EXPORT_CACHE_MAX_BYTES,
+    EXPORT_CACHE_MAX_AGE,
+    QUIZ_FOLDER_MAX_BYTES,
+    QUIZ_FOLDER_MAX_AGE,
+    GENERATION_WORKERS,
+    OLLAMA_MODEL_CONCURRENCY,
+    MODEL_ROUTES,
+    MODEL_FAILURE_COOLDOWN,
     question_types, 
     example_prompt_templates
 )
-from langchain_chroma import Chroma
 from langchain.prompts import ChatPromptTemplate
-from langchain_ollama import OllamaLLM
-from progress import progress_data
+from progress import progress_store, DONE, ERROR, CANCELLED
+from jobs import JobCancelled
 
 # Add the 'rag-system' directory to sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), 'rag-system')))
-from get_embeddings import get_embeddings_function
+from clients import (
+    DEFAULT_COLLECTION,
+    init_clients,
+    close_clients,
+    get_embeddings,
+    get_llm,
+    get_vector_store,
+    get_lexical_index
+)
+from loaders import close_pdf_workers
+from ingestion import ingest_directory, manifest_path_for, corpus_fingerprint
+from summarizer import SummaryCache, summarize_documents, natural_sort_key
+from context_builder import ContextCache
+from cache import DiskCache, SemanticCache, make_key
+from embedder import BatchEmbedder
+from chunker import TokenChunker, chunk_token_target, load_token_counter
+from transcripts import TRANSCRIPT_EXTENSION, TranscriptCache, is_video_id, write_transcript
+from transcript_normalizer import clean_transcript, normalize_segments
+from corpora import CorpusManager
+from retrieval import hybrid_search, load_reranker
+from topic_planner import TopicPlanner
+from question_schema import (
+    GenerationStats,
+    batch_schema,
+    describe_fields,
+    format_question,
+    normalize_question,
+    parse_text_question,
+    retry_feedback,
+    stream_json_items,
+    validate_question
+)
+from question_dedup import DUPLICATE_PROBLEM, QuestionHistory, QuizDeduplicator
+from admission import AdmissionController, ThroughputEstimator, estimate_document, estimate_text
+from model_router import ModelRouter
+from quiz_export import (
+    ANSWER_KEY,
+    EXPORT_FORMATS,
+    EXPORT_VERSIONS,
+    ExportCache,
+    build_quiz,
+    evict_quiz_folders,
+    read_quiz,
+    write_quiz
+)
+
+_summary_cache = SummaryCache(os.path.join(CHROMA_FOLDER_PATH, "summary_cache.json"))
+_context_cache = ContextCache()
+_transcript_cache = TranscriptCache(TRANSCRIPT_CACHE_PATH)
+_corpus_manager = CorpusManager(
+    CORPORA_DB_PATH,
+    upload_root=UPLOAD_FOLDER_PATH,
+    persist_directory=CHROMA_FOLDER_PATH,
+    blob_dir=BLOB_FOLDER_PATH,
+    disk_budget=CORPUS_DISK_BUDGET,
+    max_idle=CORPUS_MAX_IDLE,
+    empty_max_idle=EMPTY_CORPUS_MAX_IDLE
+)
+_embedder = BatchEmbedder(
+    batch_size=EMBEDDING_BATCH_SIZE,
+    max_workers=EMBEDDING_WORKERS,
+    max_retries=EMBEDDING_MAX_RETRIES
+)
+_count_tokens, _tokenizer_name = load_token_counter(CHUNK_TOKENIZER_PATH)
+_chunker = TokenChunker(
+    target_tokens=chunk_token_target(LLM_NUM_CTX, PROMPT_RESERVED_TOKENS, RETRIEVAL_K),
+    count_tokens=_count_tokens,
+    tokenizer_name=_tokenizer_name
+)
+_reranker = load_reranker(RERANKER)
+_topic_planner = TopicPlanner(max_topics=MAX_QUIZ_TOPICS)
+_question_history = QuestionHistory(QUESTION_HISTORY_PATH, threshold=DUPLICATE_SIMILARITY)
+_admission = AdmissionController(
+    ADMISSION_DB_PATH,
+    character_limit=CHARACTER_LIMIT,
+    corpus_token_budget=CORPUS_TOKEN_BUDGET,
+    tenant_token_budget=TENANT_TOKEN_BUDGET,
+    tokens_per_minute=UPLOAD_TOKENS_PER_MINUTE,
+    burst_tokens=UPLOAD_BURST_TOKENS
+)
+_throughput = ThroughputEstimator(
+    tokens_per_second=INGESTION_TOKENS_PER_SECOND,
+    seconds_per_question=GENERATION_SECONDS_PER_QUESTION
+)
+_export_cache = ExportCache(EXPORT_CACHE_PATH, max_bytes=EXPORT_CACHE_MAX_BYTES, max_age=EXPORT_CACHE_MAX_AGE)
+_router = ModelRouter(
+    MODEL_ROUTES, get_llm,
+    default={"model": LLM_MODEL, "num_ctx": LLM_NUM_CTX},
+    cooldown=MODEL_FAILURE_COOLDOWN
+)
+_dynamic_prompt_cache = DiskCache(
+    os.path.join(CACHE_FOLDER_PATH, "dynamic_prompts.sqlite"),
+    max_entries=DYNAMIC_PROMPT_CACHE_MAX_ENTRIES,
+    ttl=DYNAMIC_PROMPT_CACHE_TTL
+)
+_answer_cache = SemanticCache(
+    os.path.join(CACHE_FOLDER_PATH, "answers.sqlite"),
+    threshold=SEMANTIC_CACHE_THRESHOLD
+) if SEMANTIC_CACHE_ENABLED else None
+
+
+def _forget_corpus(corpus_id, collection):
+    # Per-corpus data kept outside the corpus registry, removed with the corpus
+    _admission.forget(corpus_id)
+    _question_history.clear(collection)
+    _context_cache.clear(collection)
+    _topic_planner.clear(collection)
+
+
+_corpus_manager.add_delete_hook(_forget_corpus)
+
+DEFAULT_PROGRESS_KEY = "default"
+
+NUMBERED_ITEM_PATTERN = re.compile(r"^[ \t*#]*(?:question[ \t]*)?\d{1,2}[ \t]*[.):][ \t*]*", re.IGNORECASE | re.MULTILINE)
+QUESTION_PATTERN = re.compile(r"question\s*:", re.IGNORECASE)
+ANSWER_PATTERN = re.compile(r"answer\s*:", re.IGNORECASE)
 
 #--------------------------------------------------------------------------------------------#
 
-def handle_file_upload(file):
+def handle_file_upload(file, corpus_id):
     """
     Handle the upload and preprocessing of a file.
 
+    The size of the file's text is estimated from a sample before the file
+    joins the corpus, and the upload is rejected at once if it is over the
+    character limit, the corpus' token budget or the tenant's upload rate.
+
     Args:
         file (FileStorage): The uploaded file object.
+        corpus_id (str): The corpus the file is added to.
 
     Returns:
         Response: A JSON response indicating success or failure, with appropriate status codes.
@@ -52,12 +231,25 @@ def handle_file_upload(file):
     if not allowed_file(file.filename):
         return jsonify({'error': 'Unsupported file type.'}), 415
 
+    incoming_path = None
     try:
-        # Secure the filename and save the file
+        # Secure the filename and estimate the text before the file joins the corpus
         filename = secure_filename(file.filename)
-        file_path = os.path.join(UPLOAD_FOLDER_PATH, filename)
-        os.makedirs(UPLOAD_FOLDER_PATH, exist_ok=True)
-        file.save(file_path)
+        incoming_path = incoming_file_path()
+        file.save(incoming_path)
+        estimate = estimate_document(incoming_path, filename.rsplit('.', 1)[1], _count_tokens)
+        decision = admit_upload(corpus_id, filename, estimate)
+        if not decision['admitted']:
+            return admission_error(decision)
+
+        try:
+            file_path = _corpus_manager.add_file(corpus_id, incoming_path, filename)
+        except Exception:
+            # The file never joined the corpus, so it costs the tenant nothing
+            _admission.refund(decision)
+            raise
+        incoming_path = None
+        _admission.record(corpus_id, filename, estimate)
 
         # Preprocess the uploaded file
         preprocess_result = preprocess_file(file_path)
@@ -67,7 +259,8 @@ def handle_file_upload(file):
         # Return success response
         return jsonify({
             'success': True,
-            'processing_message': preprocess_result['message'],
+            'processing_message': f"{preprocess_result['message']} {describe_estimate(estimate)}",
+            'estimate': estimate_times(estimate),
             'redirect_url': url_for('questions')
         }), 200
 
@@ -75,6 +268,74 @@ def handle_file_upload(file):
         print(f"Exception in handle_file_upload: {e}")
         return jsonify({'error': f"An unexpected error occurred: {str(e)}"}), 500
 
+    finally:
+        # A rejected or failed upload leaves nothing behind
+        if incoming_path and os.path.exists(incoming_path):
+            os.remove(incoming_path)
+
+
+def admit_upload(corpus_id, name, estimate):
+    """
+    Check an upload's estimate against the budgets of its corpus and tenant.
+
+    Args:
+        corpus_id (str): The corpus the upload goes into.
+        name (str): The document name in the corpus.
+        estimate (dict): The estimated characters and tokens of the upload.
+
+    Returns:
+        dict: The admission decision; see AdmissionController.admit.
+    """
+    corpus = _corpus_manager.get(corpus_id)
+    if corpus is None:
+        return {'admitted': False, 'status': 404, 'error': "This collection is no longer available."}
+    tenant_corpora = {owned['id']: owned['documents'] for owned in _corpus_manager.list(corpus['owner'])}
+    decision = _admission.admit(corpus['owner'], corpus_id, name, estimate, documents=corpus['documents'],
+                                tenant_corpora=tenant_corpora)
+    if not decision['admitted']:
+        print(f"Upload of '{name}' rejected: {decision['error']}")
+    return decision
+
+
+def admission_error(decision):
+    """Turn a rejected admission decision into a JSON error response."""
+    response = jsonify({'error': decision['error']})
+    response.status_code = decision['status']
+    if decision.get('retry'):
+        response.headers['Retry-After'] = str(decision['retry'])
+    return response
+
+
+def estimate_times(estimate):
+    """
+    Add the expected ingestion time and generation time per question to an upload's estimate.
+    """
+    return {
+        **estimate,
+        'ingestion_seconds': round(_throughput.ingestion_seconds(estimate['tokens']), 1),
+        'seconds_per_question': round(_throughput.generation_seconds(1), 1),
+    }
+
+
+def describe_estimate(estimate):
+    """
+    Describe an upload's estimate and the time it will take in one sentence.
+    """
+    times = estimate_times(estimate)
+    text = f"About {estimate['tokens']:,} tokens of text"
+    if estimate.get('pages'):
+        text += f" on {estimate['pages']} pages"
+    return (f"{text}; indexing will take about {math.ceil(times['ingestion_seconds'])}s "
+            f"and each question about {math.ceil(times['seconds_per_question'])}s to generate.")
+
+
+def estimate_quiz_seconds(question_data):
+    """
+    Estimate the seconds a quiz takes to generate from the recent generation throughput.
+    """
+    total = sum(item[difficulty] for item in question_data for difficulty in ['easy', 'medium', 'difficult'])
+    return _throughput.generation_seconds(total)
+
 
 def allowed_file(filename):
     """Check if the file type is allowed."""
@@ -82,12 +343,13 @@ def allowed_file(filename):
 
 #--------------------------------------------------------------------------------------------#
 
-def handle_youtube_upload(youtube_url):
+def handle_youtube_upload(youtube_url, corpus_id):
     """
     Handle the processing of a YouTube URL.
 
     Args:
         youtube_url (str): The YouTube URL provided by the user.
+        corpus_id (str): The corpus the transcript is added to.
 
     Returns:
         Response: A JSON response indicating success or failure, with appropriate status codes.
@@ -96,42 +358,67 @@ def handle_youtube_upload(youtube_url):
         return jsonify({'error': 'YouTube URL is required.'}), 400  # 400: Bad Request
 
     try:
-        preprocess_result = preprocess_youtube(youtube_url)
+        preprocess_result = preprocess_youtube(youtube_url, corpus_id)
+        if preprocess_result.get('status'):
+            return admission_error(preprocess_result)  # Rejected by admission control
         if preprocess_result.get('error'):
             return jsonify(preprocess_result), 400  # 400: Bad Request
 
         return jsonify({
             'success': True,
             'processing_message': preprocess_result['message'],
-            'redirect_url': url_for('questions')
+            'estimate': preprocess_result['estimate'],
+            'redirect_url': url_for('questions'),
+            'transcript_pdf_url': url_for('export_transcript', video_id=preprocess_result['video_id'])
         }), 200  # 200: OK
 
     except Exception as e:
         return jsonify({'error': f"An unexpected error occurred: {str(e)}"}), 500  # 500: Internal Server Error
 
 
-def preprocess_youtube(video_url):
+def preprocess_youtube(video_url, corpus_id):
     """
-    Fetch and save a YouTube transcript.
+    Fetch a YouTube transcript and add it to a corpus for ingestion.
+
+    The caption segments are stored as a transcript file, which the ingestion
+    engine reads directly as timestamped text.
 
     Args:
         video_url (str): The YouTube video URL.
+        corpus_id (str): The corpus the transcript is added to.
 
     Returns:
-        dict: A dictionary containing a success message or an error message.
+        dict: A dictionary containing a success message, the video ID and the
+            transcript's estimate, or an error message (with an HTTP 'status'
+            if admission control rejected the transcript).
     """
     try:
-        transcript = fetch_youtube_transcript(video_url)
-        if not transcript:
+        video_id = extract_video_id(video_url)
+        segments = fetch_youtube_transcript(video_id)
+        if not segments:
             return {'error': "No transcript available for this video."}
 
-        video_title = "YouTube_Transcript"
-        pdf_result = save_transcript_to_pdf(transcript, video_title)
+        name = f"{video_id}{TRANSCRIPT_EXTENSION}"
+        estimate = estimate_text(" ".join(segment['text'] for segment in segments), _count_tokens)
+        decision = admit_upload(corpus_id, name, estimate)
+        if not decision['admitted']:
+            return decision
 
-        if pdf_result.get('error'):
-            return pdf_result  # Return the error from saving the PDF
-
-        return {'message': pdf_result['message']}
+        try:
+            incoming_path = incoming_file_path()
+            write_transcript(incoming_path, video_id, segments)
+            _corpus_manager.add_file(corpus_id, incoming_path, name)
+        except Exception:
+            # The transcript never joined the corpus, so it costs the tenant nothing
+            _admission.refund(decision)
+            raise
+        _admission.record(corpus_id, name, estimate)
+
+        return {
+            'message': f"Transcript of video {video_id} saved ({len(segments)} captions). {describe_estimate(estimate)}",
+            'video_id': video_id,
+            'estimate': estimate_times(estimate)
+        }
 
     except ValueError as e:
         return {'error': str(e)}  # Invalid YouTube URL
@@ -140,26 +427,26 @@ def preprocess_youtube(video_url):
         return {'error': f"An unexpected error occurred during preprocessing: {str(e)}"}
 
 
-def fetch_youtube_transcript(video_url, language="en"):
+def fetch_youtube_transcript(video_id, language="en"):
     """
-    Fetch the transcript for a YouTube video.
+    Fetch the caption segments of a YouTube video, from the transcript cache if possible.
 
     Args:
-        video_url (str): The YouTube video URL.
+        video_id (str): The YouTube video ID.
         language (str): The desired language for the transcript (default: "en").
 
     Returns:
-        str: The cleaned transcript, or None if not available.
+        list: Segments with "text", "start" and "duration", or None if not available.
     """
-    try:
-        video_id = extract_video_id(video_url)
-        transcript_list = YouTubeTranscriptApi.list_transcripts(video_id)
-        transcript = transcript_list.find_transcript([language])
-        formatter = TextFormatter()
-        raw_transcript = formatter.format_transcript(transcript.fetch())
+    segments = _transcript_cache.get(video_id, language)
+    if segments is not None:
+        return segments
 
-        # Clean up the transcript
-        return clean_transcript(raw_transcript)
+    try:
+        transcript = YouTubeTranscriptApi().list(video_id).find_transcript([language])
+        segments = transcript.fetch().to_raw_data()
+        _transcript_cache.put(video_id, language, segments)
+        return segments
     except NoTranscriptFound:
         return None  # No transcript available
     except TranscriptsDisabled:
@@ -171,22 +458,46 @@ def fetch_youtube_transcript(video_url, language="en"):
         return None
 
 
-def save_transcript_to_pdf(transcript, video_title):
+def export_transcript_pdf(video_id, language="en", output_dir=DOWNLOAD_FOLDER_PATH):
+    """
+    Export the cached transcript of a video as a PDF.
+
+    Args:
+        video_id (str): The YouTube video ID.
+        language (str): The language of the transcript.
+        output_dir (str): The folder to save the PDF in.
+
+    Returns:
+        dict: The 'path' of the PDF, or an error message.
+    """
+    if not is_video_id(video_id):
+        return {'error': "Invalid video ID."}
+
+    segments = _transcript_cache.get(video_id, language)
+    if not segments:
+        return {'error': "No transcript available for this video."}
+
+    transcript = clean_transcript("\n".join(segment["text"] for segment in normalize_segments(segments)))
+    return save_transcript_to_pdf(transcript, f"YouTube_Transcript_{video_id}", output_dir)
+
+
+def save_transcript_to_pdf(transcript, video_title, output_dir=DOWNLOAD_FOLDER_PATH):
     """
     Save a cleaned transcript to a PDF file.
 
     Args:
         transcript (str): The cleaned transcript text.
         video_title (str): The title of the video.
+        output_dir (str): The folder to save the PDF in.
 
     Returns:
-        dict: A dictionary containing a success message or an error message.
+        dict: A dictionary containing a success message and the PDF path, or an error message.
     """
     pdf_file = None  # Initialize to ensure clean handling
     try:
-        # Ensure the upload folder exists
-        os.makedirs(UPLOAD_FOLDER_PATH, exist_ok=True)
-        pdf_path = os.path.join(UPLOAD_FOLDER_PATH, f"{video_title.replace(' ', '_')}.pdf")
+        # Ensure the output folder exists
+        os.makedirs(output_dir, exist_ok=True)
+        pdf_path = os.path.join(output_dir, f"{video_title.replace(' ', '_')}.pdf")
 
         # Safely create the PDF
         c = canvas.Canvas(pdf_path, pagesize=letter)
@@ -213,7 +524,7 @@ def save_transcript_to_pdf(transcript, video_title):
             pdf_file = open(pdf_path, "rb")
             pdf_file.close()
 
-        return {'message': f"Transcription saved to {pdf_path}."}
+        return {'message': f"Transcription saved to {pdf_path}.", 'path': pdf_path}
 
     except Exception as e:
         return {'error': f"Error saving transcript to PDF: {str(e)}"}
@@ -238,77 +549,15 @@ def extract_video_id(video_url):
         ValueError: If the URL is invalid.
     """
     if "v=" in video_url:
-        return video_url.split("v=")[-1].split("&")[0]
+        video_id = video_url.split("v=")[-1].split("&")[0]
     elif "youtu.be/" in video_url:
-        return video_url.split("youtu.be/")[-1].split("?")[0]
+        video_id = video_url.split("youtu.be/")[-1].split("?")[0]
     else:
         raise ValueError("Invalid YouTube URL")
 
-
-def clean_transcript(transcript, max_line_length=80):
-    """
-    Clean the YouTube transcript by removing unnecessary newlines
-    and formatting sentences to avoid line overflow.
-
-    Args:
-        transcript (str): The raw transcript text.
-        max_line_length (int): The maximum number of characters per line.
-
-    Returns:
-        str: A cleaned transcript with properly formatted lines.
-    """
-    # Remove excessive newlines and combine broken lines
-    cleaned_lines = []
-    current_sentence = ""
-
-    for line in transcript.splitlines():
-        line = line.strip()  # Remove leading/trailing spaces
-        if line:  # If line is not empty
-            if current_sentence:
-                current_sentence += " " + line
-            else:
-                current_sentence = line
-
-            # If the current line ends with punctuation, finalize the sentence
-            if re.search(r'[.!?]$', line):
-                cleaned_lines.extend(wrap_line(current_sentence, max_line_length))
-                current_sentence = ""
-
-    # Append the last sentence if any
-    if current_sentence:
-        cleaned_lines.extend(wrap_line(current_sentence, max_line_length))
-
-    return "\n".join(cleaned_lines)
-
-
-def wrap_line(sentence, max_length):
-    """
-    Wrap a single sentence into multiple lines without splitting words.
-
-    Args:
-        sentence (str): The sentence to wrap.
-        max_length (int): The maximum number of characters per line.
-
-    Returns:
-        list: A list of lines, each with a maximum length of `max_length`.
-    """
-    words = sentence.split()
-    lines = []
-    current_line = []
-
-    for word in words:
-        # Check if adding the next word exceeds the max_length
-        if sum(len(w) for w in current_line) + len(current_line) + len(word) > max_length:
-            lines.append(" ".join(current_line))
-            current_line = [word]  # Start a new line with the current word
-        else:
-            current_line.append(word)
-
-    # Add the last line if any
-    if current_line:
-        lines.append(" ".join(current_line))
-
-    return lines
+    if not is_video_id(video_id):
+        raise ValueError("Invalid YouTube URL")
+    return video_id
 
 #--------------------------------------------------------------------------------------------#
 
@@ -376,93 +625,576 @@ def validate_questions(form_data):
     return question_data, errors
 
 
-def generate_questions(question_data):
+def generate_questions(question_data, max_workers=GENERATION_WORKERS, output_dir=DOWNLOAD_FOLDER_PATH, is_cancelled=None,
+                       progress_key=DEFAULT_PROGRESS_KEY, data_path=UPLOAD_FOLDER_PATH, collection_name=DEFAULT_COLLECTION):
     """
-    Generate questions using the RAG system and save them to a .docx file.
+    Generate questions using the RAG system and save them as a quiz file.
+
+    Questions are generated in batches: one dynamic query and one structured
+    LLM call per (question type, difficulty) bucket. With topic planning, the
+    questions are first spread over the topics of the corpus, and each call
+    covers up to RETRIEVAL_K topics. Every question is validated against the
+    schema of its type and checked for near-duplicates within the quiz and
+    among the questions issued for the corpus before, and only the rejected
+    ones are requested again.
+    Buckets run concurrently on a thread pool; the concurrency cap of each
+    model is enforced by the client registry. Each question is published to
+    the progress store as soon as it is generated, and the saved questions
+    keep the order of `question_data`. Downloads are rendered from the quiz
+    file by `export_quiz`.
 
     Args:
         question_data (list): List of dictionaries containing question configurations.
+        max_workers (int): The number of buckets generated in parallel.
+        output_dir (str): The folder the quiz file is saved in.
+        is_cancelled (callable, optional): Returns True once the job has been cancelled.
+        progress_key (str): The progress store key updates are published under.
+        data_path (str): The upload folder of the corpus.
+        collection_name (str): The collection of the corpus.
 
     Returns:
-        str: The filename of the saved .docx file.
+        str: The filename of the saved quiz file.
+
+    Raises:
+        JobCancelled: If `is_cancelled` reports a cancellation before the quiz is
+            saved; the questions are then neither saved nor added to the corpus' history.
     """
     try:
-        progress_data["status"] = "Updating the resource database..."
-        print("Populating the database...")
-        run_script('populate_database.py', cwd='rag-system')
-
-        progress_data["status"] = f"Generating summary of documents to create dynamic prompts."
-        print(progress_data["status"])
-        summary = get_summary_of_all_documents()
-
-        generated_questions = []
-        total_questions = sum(item[difficulty] for item in question_data for difficulty in ['easy', 'medium', 'difficult'])
-        current_question = 0
-                
-        # Generate questions with progress updates
-        for item in question_data:
-            question_type = item['question_type']
-            for difficulty in ['easy', 'medium', 'difficult']:
-                count = item[difficulty]
-                if count > 0:
-                    for _ in range(count):
-                        current_question += 1
-                        progress_data["status"] = f"Generating question {current_question}/{total_questions} ({question_type} - {difficulty.capitalize()})"
-                        print(progress_data["status"])
-                        
-                        # Generate dynamic query and fetch the question response
-                        dynamic_query =  create_dynamic_query(summary, question_type, difficulty)
-                        question_response = query_rag(dynamic_query)
-                        generated_questions.append((f"{question_type} {difficulty.capitalize()}", question_response))
-
-        progress_data["status"] = "Saving generated questions..."
-        filename = save_questions_to_docx(generated_questions)
-        progress_data["status"] = "Questions generated successfully."
+        report_progress(progress_key, "Updating the resource database...", phase="ingestion")
+        update_database(data_path, collection_name=collection_name)
+
+        report_progress(progress_key, "Generating summary of documents to create dynamic prompts.", phase="summary")
+        summary = get_summary_of_all_documents(collection_name=collection_name)
+
+        work_items = [
+            (item['question_type'], difficulty, item[difficulty])
+            for item in question_data
+            for difficulty in ['easy', 'medium', 'difficult']
+            if item[difficulty] > 0
+        ]
+        total_questions = sum(count for _, _, count in work_items)
+        offsets = [sum(count for _, _, count in work_items[:index]) for index in range(len(work_items))]
+        completed = {"questions": 0}
+        progress_lock = threading.Lock()
+
+        coverage, plan = None, None
+        if TOPIC_PLANNING:
+            report_progress(progress_key, "Planning the topics the questions cover...", phase="planning")
+            plan = plan_topics(collection_name=collection_name)
+            if plan is not None:
+                coverage = plan.start_quiz(total_questions)
+
+        report_progress(
+            progress_key, f"Generating questions 0/{total_questions}...",
+            phase="generation", completed=0, total=total_questions
+        )
+        stats = GenerationStats()
+        dedup = QuizDeduplicator(
+            get_embeddings(), _question_history, corpus=collection_name,
+            model=EMBEDDING_MODEL, threshold=DUPLICATE_SIMILARITY,
+            center=plan.center if plan is not None else None
+        ) if DEDUP_ENABLED else None
+
+        def run_work_item(question_type, difficulty, count, offset):
+            check_cancelled(is_cancelled)
+            label = f"{question_type} {difficulty.capitalize()}"
+
+            def publish_question(index, question):
+                with progress_lock:
+                    progress_store.publish_item(progress_key, {
+                        "number": offset + index + 1,
+                        "question_type": label,
+                        "text": question
+                    })
+
+            batch = generate_question_batch(
+                summary, question_type, difficulty, count,
+                on_question=publish_question, collection_name=collection_name,
+                coverage=coverage, offset=offset, stats=stats, dedup=dedup,
+                is_cancelled=is_cancelled
+            )
+            with progress_lock:
+                completed["questions"] += count
+                report_progress(
+                    progress_key,
+                    f"Generated questions {completed['questions']}/{total_questions} (finished {question_type} - {difficulty.capitalize()})",
+                    completed=completed["questions"]
+                )
+            return [(question_type, difficulty, question_response) for question_response in batch]
+
+        # Collect results by work item index so that the output order is deterministic
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(run_work_item, *work_item, offset)
+                for work_item, offset in zip(work_items, offsets)
+            ]
+            generated_questions = [question for future in futures for question in future.result()]
+        print(f"Question generation: {stats.summary()}")
+        print(f"Model routing since start: {_router.summary()}")
+        _throughput.record_generation(total_questions, time.perf_counter() - stats.started)
+
+        check_cancelled(is_cancelled)
+        report_progress(progress_key, "Saving generated questions...", phase="saving")
+        filename = save_quiz(generated_questions, output_dir)
+        # A quiz cancelled while it was saved is thrown away, and its questions
+        # never enter the corpus' history
+        if is_cancelled and is_cancelled():
+            os.remove(os.path.join(output_dir, filename))
+            raise JobCancelled()
+        if dedup is not None:
+            dedup.commit()
+        report_progress(progress_key, "Questions generated successfully.", phase=DONE)
         return filename
 
+    except JobCancelled:
+        report_progress(progress_key, "Question generation cancelled.", phase=CANCELLED)
+        raise
+
     except Exception as e:
-        progress_data["status"] = "Error during question generation."
+        report_progress(progress_key, "Error during question generation.", phase=ERROR)
         print(f"Error in generate_questions: {str(e)}")
         raise RuntimeError("Failed to generate questions.")
 
 
-def query_rag(query_text, chroma_path=CHROMA_FOLDER_PATH, prompt_template=PROMPT_TEMPLATE_FOR_QUESTIONS):
+def report_progress(progress_key, status, **fields):
+    """
+    Publish a progress update and log its status message.
+
+    Args:
+        progress_key (str): The job or session key.
+        status (str): Human-readable status message.
+        **fields: Other progress fields (phase, completed, total).
+    """
+    progress_store.update(progress_key, status=status, **fields)
+    print(status)
+
+
+def run_quiz_job(job_id, payload, is_cancelled):
+    """
+    Job handler for quiz generation; saves the quiz in a folder of its own.
+
+    The job's corpus is protected from eviction while the quiz is generated.
+    Jobs queued without a corpus use the shared default collection. Once the
+    quiz is saved, the folders of quizzes no longer used are removed.
+
+    Args:
+        job_id (str): The job ID.
+        payload (dict): The job input with the validated 'question_data' and the 'corpus_id'.
+        is_cancelled (callable): Returns True once the job has been cancelled.
+
+    Returns:
+        str: The filename of the saved quiz file inside the job's folder.
+    """
+    options = {
+        "output_dir": job_output_dir(job_id),
+        "is_cancelled": is_cancelled,
+        "progress_key": job_id,
+    }
+    corpus_id = payload.get('corpus_id')
+    if corpus_id is None:
+        filename = generate_questions(payload['question_data'], **options)
+    else:
+        corpus = _corpus_manager.get(corpus_id)
+        if corpus is None:
+            report_progress(job_id, "The uploaded resources of this quiz are no longer available.", phase=ERROR)
+            raise RuntimeError("The corpus of this quiz no longer exists.")
+
+        with _corpus_manager.in_use(corpus_id):
+            filename = generate_questions(
+                payload['question_data'],
+                data_path=corpus['data_path'],
+                collection_name=corpus['collection'],
+                **options
+            )
+            _corpus_manager.record_ingestion(corpus_id)
+
+    evict_quiz_folders(DOWNLOAD_FOLDER_PATH, QUIZ_FOLDER_MAX_BYTES, QUIZ_FOLDER_MAX_AGE,
+                       keep=options["output_dir"], exclude=(EXPORT_CACHE_PATH,))
+    return filename
+
+
+def check_cancelled(is_cancelled):
+    """
+    Raise JobCancelled if the job of a generation has been cancelled.
+
+    Args:
+        is_cancelled (callable, optional): Returns True once the job has been cancelled.
+    """
+    if is_cancelled and is_cancelled():
+        raise JobCancelled()
+
+
+def report_quiz_job_cancelled(job_id):
+    """
+    Report the cancellation of a quiz job that never got to report it itself,
+    so its progress stream ends.
+
+    Args:
+        job_id (str): The job ID.
+    """
+    report_progress(job_id, "Question generation cancelled.", phase=CANCELLED)
+
+
+def job_output_dir(job_id):
+    """Return the folder holding the files produced by a job."""
+    return os.path.join(DOWNLOAD_FOLDER_PATH, job_id)
+
+
+def generate_question_batch(summary, question_type, difficulty, count, max_retries=MAX_BATCH_RETRIES, on_question=None,
+                            collection_name=DEFAULT_COLLECTION, coverage=None, offset=0, stats=None, dedup=None,
+                            is_cancelled=None):
+    """
+    Generate `count` questions of one type and difficulty with as few LLM calls as possible.
+
+    The questions are requested as a JSON array (or a numbered list without
+    STRUCTURED_OUTPUT) in a single streamed call, and each one is handed to
+    `on_question` as soon as it is complete and valid. Only the items that are
+    missing or rejected by the validator are requested again, with their
+    problems named in the prompt, and any still missing after `max_retries`
+    extra calls are generated one by one, with the same checks and up to
+    `max_retries` + 1 calls per question. With a speculative model route, the
+    batch is written by the route's small model and every retry after
+    rejected questions moves to the next, larger model.
+
+    With a topic coverage, the questions are requested in groups of up to
+    RETRIEVAL_K, each given one chunk of every topic assigned to its questions
+    instead of the chunks retrieved for the query.
+
+    Args:
+        summary (str): A summary of the document context.
+        question_type (str): The type of question.
+        difficulty (str): The difficulty level.
+        count (int): The number of questions to generate.
+        max_retries (int): Extra batch calls allowed for missing items.
+        on_question (callable, optional): Called as on_question(index, question) for each new question.
+        collection_name (str): The collection of the corpus to generate from.
+        coverage (QuizCoverage, optional): Topic assignment of the quiz's questions.
+        offset (int): Number of the batch's first question within the quiz, counted from 0.
+        stats (GenerationStats, optional): Counts of the quiz's calls and valid and rejected questions.
+        dedup (QuizDeduplicator, optional): Rejects questions that repeat earlier ones.
+        is_cancelled (callable, optional): Returns True once the job has been cancelled;
+            checked before every LLM call and while responses stream.
+
+    Returns:
+        list: The generated questions, `count` items long unless some could
+            not be generated, which are logged and counted as missing.
+
+    Raises:
+        JobCancelled: If the job is cancelled while the batch is generated.
+    """
+    dynamic_query = create_dynamic_query(summary, question_type, difficulty, collection_name=collection_name)
+    questions = []
+
+    def accept(question):
+        questions.append(question)
+        if on_question:
+            on_question(len(questions) - 1, question)
+
+    if STRUCTURED_OUTPUT:
+        batch_template, topic_template = PROMPT_TEMPLATE_FOR_JSON_QUESTIONS, PROMPT_TEMPLATE_FOR_JSON_TOPIC_QUESTIONS
+    else:
+        batch_template, topic_template = PROMPT_TEMPLATE_FOR_BATCH_QUESTIONS, PROMPT_TEMPLATE_FOR_TOPIC_QUESTIONS
+
+    # (questions, context, template) of each call; retrieved context if None
+    groups = [(count, None, batch_template)]
+    if coverage is not None:
+        topics = coverage.topics(offset, count)
+        query_vector = get_embeddings().embed_query(dynamic_query)
+        groups = [
+            (len(group), format_topic_context(coverage.contexts(query_vector, group)), topic_template)
+            for group in (topics[start:start + RETRIEVAL_K] for start in range(0, len(topics), RETRIEVAL_K))
+        ]
+
+    for size, context_text, prompt_template in groups:
+        target = len(questions) + size
+        feedback = ""
+        escalation = 0
+        for _ in range(max_retries + 1):
+            missing = target - len(questions)
+            if missing <= 0:
+                break
+            check_cancelled(is_cancelled)
+            rejected = []
+            for question in stream_rag_batch(dynamic_query, missing, collection_name=collection_name,
+                                             prompt_template=prompt_template, context_text=context_text,
+                                             question_type=question_type, feedback=feedback,
+                                             on_rejected=rejected.append, stats=stats, dedup=dedup,
+                                             difficulty=difficulty, escalation=escalation,
+                                             is_cancelled=is_cancelled):
+                accept(question)
+                if len(questions) == target:
+                    break
+            feedback = retry_feedback(rejected)
+            # Questions the validator rejected are asked of the next model of the route
+            if rejected:
+                escalation += 1
+
+    # Fall back to single-question calls for anything still missing, each one
+    # read, validated and checked for duplicates like the batched questions
+    for _ in range((count - len(questions)) * (max_retries + 1)):
+        if len(questions) >= count:
+            break
+        check_cancelled(is_cancelled)
+        if stats is not None:
+            stats.record_fallback()
+        response = query_rag(dynamic_query, collection_name=collection_name, difficulty=difficulty,
+                             escalation=max_retries + 1)
+        if response is None:
+            continue
+        question = check_question(question_type, parse_text_question(question_type, response),
+                                  stats=stats, dedup=dedup)
+        if question is not None:
+            accept(question)
+
+    if len(questions) < count:
+        print(f"Could not generate {count - len(questions)} of {count} {question_type} {difficulty} questions.")
+        if stats is not None:
+            stats.record_missing(count - len(questions))
+
+    return questions
+
+
+def check_question(question_type, item, stats=None, dedup=None, on_rejected=None):
+    """
+    Normalize and validate the fields of a generated question and reject repeats.
+
+    Args:
+        question_type (str): The type whose schema the question is validated against.
+        item (dict): The fields read from the model's response.
+        stats (GenerationStats, optional): Counts of valid and rejected questions.
+        dedup (QuizDeduplicator, optional): Rejects valid questions that repeat earlier ones.
+        on_rejected (callable, optional): Called with the problem list of a rejected question.
+
+    Returns:
+        str: The formatted question, or None if it was rejected.
+    """
+    item = normalize_question(question_type, item)
+    problems = validate_question(question_type, item)
+    if not problems and dedup is not None and not dedup.admit(item["question"]):
+        problems = [DUPLICATE_PROBLEM]
+    if stats is not None:
+        stats.record_item(problems)
+    if problems:
+        print(f"Rejected a generated {question_type} question: {'; '.join(problems)}")
+        if on_rejected:
+            on_rejected(problems)
+        return None
+    return format_question(question_type, item)
+
+
+def retrieve_context(query_text, chroma_path=CHROMA_FOLDER_PATH, collection_name=DEFAULT_COLLECTION, k=RETRIEVAL_K):
+    """
+    Retrieve the text of the chunks most relevant to a query, fusing dense and
+    BM25 results when hybrid retrieval is enabled.
+
+    Args:
+        query_text (str): The query text.
+        chroma_path (str): The path to the RAG system database.
+        collection_name (str): The collection of the corpus.
+        k (int): The number of chunks to retrieve.
+
+    Returns:
+        str: The joined chunk texts, or an empty string if nothing was found.
+    """
+    db = get_vector_store(collection_name, persist_directory=chroma_path)
+    if HYBRID_RETRIEVAL:
+        lexical_index = get_lexical_index(collection_name, persist_directory=chroma_path)
+        results = hybrid_search(db, lexical_index, query_text, k=k, fetch_k=RETRIEVAL_FETCH_K, reranker=_reranker)
+    else:
+        results = db.similarity_search_with_score(query_text, k=k)
+    return "\n\n---\n\n".join([doc.page_content for doc, _ in results])
+
+
+def query_rag(query_text, chroma_path=CHROMA_FOLDER_PATH, collection_name=DEFAULT_COLLECTION,
+              prompt_template=PROMPT_TEMPLATE_FOR_QUESTIONS, difficulty=None, escalation=0):
     """
     Query the RAG system for context-based answers.
 
     Args:
         query_text (str): The query text.
         chroma_path (str): The path to the RAG system database.
+        collection_name (str): The collection of the corpus.
         prompt_template (str): Template for the query.
+        difficulty (str, optional): The difficulty of the question, for model routing.
+        escalation (int): Steps down the question route's model chain.
 
     Returns:
-        str: The generated question or an error message.
+        str: The generated answer, or None if no context was found or the call failed.
     """
     try:
         print(f"Querying... Text: {query_text}")
 
-        embedding_function = get_embeddings_function()
-        db = Chroma(persist_directory=chroma_path, embedding_function=embedding_function)
+        context_text = retrieve_context(query_text, chroma_path, collection_name)
 
-        results = db.similarity_search_with_score(query_text, k=5)
+        if not context_text:
+            print("No relevant context found.")
+            return None
 
-        if not results:
-            return "No relevant context found."
-
-        context_text = "\n\n---\n\n".join([doc.page_content for doc, _ in results])
         prompt = ChatPromptTemplate.from_template(prompt_template).format(
             context=context_text, question=query_text
         )
 
-        model = OllamaLLM(model="llama3.2:3b")
+        model = _router.llm("questions", difficulty=difficulty, attempt=escalation)
         return model.invoke(prompt)
 
     except Exception as e:
-        progress_data["status"] = f"Error querying RAG system: {str(e)}"
-        print(progress_data["status"])
-        return "An error occurred while querying the RAG system."
+        print(f"Error querying RAG system: {str(e)}")
+        return None
 
-def create_dynamic_query(summary, question_type, difficulty, chroma_path=CHROMA_FOLDER_PATH, prompt_template=PROMPT_TEMPLATE_FOR_PROMPTS):
+
+def stream_rag_batch(query_text, count, chroma_path=CHROMA_FOLDER_PATH, collection_name=DEFAULT_COLLECTION,
+                     prompt_template=PROMPT_TEMPLATE_FOR_BATCH_QUESTIONS, context_text=None, question_type=None,
+                     feedback="", on_rejected=None, stats=None, dedup=None, difficulty=None, escalation=0,
+                     is_cancelled=None):
+    """
+    Ask the RAG system for several questions in one streamed call.
+
+    With a question type, each question is read into the fields of its type's
+    schema, normalized and validated, and only valid questions are yielded.
+    With STRUCTURED_OUTPUT, the questions are read from a JSON response whose
+    format is set on the Ollama call; otherwise from a numbered list.
+
+    Args:
+        query_text (str): The dynamic query describing one question.
+        count (int): The number of questions to ask for.
+        chroma_path (str): The path to the RAG system database.
+        collection_name (str): The collection of the corpus.
+        prompt_template (str): Template for the batch query.
+        context_text (str, optional): Context to use instead of retrieving it for the query.
+        question_type (str, optional): The type whose schema the questions are validated against.
+        feedback (str): Problems of earlier rejected questions, for the prompt.
+        on_rejected (callable, optional): Called with the problem list of each rejected question.
+        stats (GenerationStats, optional): Counts of calls and valid and rejected questions.
+        dedup (QuizDeduplicator, optional): Rejects valid questions that repeat earlier ones.
+        difficulty (str, optional): The difficulty of the questions, for model routing.
+        escalation (int): Steps down the question route's model chain, one per retry after rejections.
+        is_cancelled (callable, optional): Returns True once the job has been cancelled;
+            checked for every streamed chunk, so a cancelled call stops early.
+
+    Yields:
+        str: Each well-formed question as soon as the model has finished it.
+
+    Raises:
+        JobCancelled: If the job is cancelled during the call.
+    """
+    try:
+        print(f"Querying batch of {count}... Text: {query_text}")
+
+        if context_text is None:
+            context_text = retrieve_context(query_text, chroma_path, collection_name)
+
+        if not context_text:
+            return
+
+        structured = question_type is not None and STRUCTURED_OUTPUT
+        prompt = ChatPromptTemplate.from_template(prompt_template).format(
+            context=context_text, question=query_text, count=count,
+            fields=describe_fields(question_type), feedback=feedback
+        )
+
+        def read_questions(stream):
+            if question_type is None:
+                yield from stream_numbered_questions(stream)
+                return
+            if structured:
+                items = stream_json_items(stream)
+            else:
+                items = (parse_text_question(question_type, text) for text in stream_numbered_questions(stream))
+            for item in items:
+                question = check_question(question_type, item, stats=stats, dedup=dedup, on_rejected=on_rejected)
+                if question is not None:
+                    yield question
+
+        model = _router.llm("questions", difficulty=difficulty, attempt=escalation)
+
+        # Serve a cached answer to a near-identical query on the same corpus
+        if _answer_cache is not None:
+            namespace = make_key(current_corpus_fingerprint(chroma_path, collection_name), model.model, prompt_template, count,
+                                 make_key(context_text), question_type, STRUCTURED_OUTPUT, feedback)
+            query_embedding = get_embeddings().embed_query(query_text)
+            cached_response = _answer_cache.get(namespace, query_embedding)
+            if cached_response is not None:
+                yield from read_questions([cached_response])
+                return
+
+        chunks = []
+
+        def record(stream):
+            for chunk in stream:
+                check_cancelled(is_cancelled)
+                chunks.append(chunk)
+                yield chunk
+
+        options = {}
+        if structured:
+            options["format"] = batch_schema(question_type, count) if STRUCTURED_OUTPUT == "schema" else "json"
+        if stats is not None:
+            stats.record_call()
+        produced = 0
+        for question in read_questions(record(model.stream(prompt, **options))):
+            produced += 1
+            # Store the answer before the last question, as the caller stops reading there
+            if produced == count and _answer_cache is not None:
+                _answer_cache.put(namespace, query_embedding, "".join(chunks))
+            yield question
+
+        if produced < count and _answer_cache is not None and chunks:
+            _answer_cache.put(namespace, query_embedding, "".join(chunks))
+
+    except JobCancelled:
+        raise
+
+    except Exception as e:
+        print(f"Error querying RAG system for a batch: {str(e)}")
+
+
+def format_topic_context(texts):
+    """
+    Join the chunks picked for a group of topics into numbered context sections.
+    """
+    return "\n\n---\n\n".join(f"[{number}] {text}" for number, text in enumerate(texts, start=1))
+
+
+def stream_numbered_questions(chunks):
+    """
+    Split streamed numbered LLM output into individual, well-formed questions.
+
+    An item is complete once the next item's number appears (or the stream
+    ends), so each question is yielded while the model is still writing the
+    following ones.
+
+    Args:
+        chunks (iterable): Text pieces of a response with items starting with "1.", "2)" and so on.
+
+    Yields:
+        str: The items that contain both a question and an answer.
+    """
+    response = ""
+    emitted = 0
+    for chunk in chunks:
+        response += chunk
+        matches = list(NUMBERED_ITEM_PATTERN.finditer(response))
+        while emitted < len(matches) - 1:
+            item = response[matches[emitted].end():matches[emitted + 1].start()].strip()
+            emitted += 1
+            if is_valid_question(item):
+                yield item
+
+    matches = list(NUMBERED_ITEM_PATTERN.finditer(response))
+    for match, next_match in zip(matches[emitted:], matches[emitted + 1:] + [None]):
+        end = next_match.start() if next_match else len(response)
+        item = response[match.end():end].strip()
+        if is_valid_question(item):
+            yield item
+
+
+def is_valid_question(item):
+    """Check that a generated item has both a question and an answer part."""
+    return bool(QUESTION_PATTERN.search(item) and ANSWER_PATTERN.search(item))
+
+
+def create_dynamic_query(summary, question_type, difficulty, chroma_path=CHROMA_FOLDER_PATH,
+                         collection_name=DEFAULT_COLLECTION, prompt_template=PROMPT_TEMPLATE_FOR_PROMPTS):
     """
     Create a dynamic query using the document summary, question type, and difficulty.
 
@@ -471,6 +1203,7 @@ def create_dynamic_query(summary, question_type, difficulty, chroma_path=CHROMA_
         question_type (str): The type of question (e.g., "True/False", "Multiple Choice").
         difficulty (str): The difficulty level (e.g., "easy", "medium", "difficult").
         chroma_path (str): Path to the Chroma database.
+        collection_name (str): The collection of the corpus.
         prompt_template (str): Template to guide LLM in generating the query.
 
     Returns:
@@ -481,29 +1214,36 @@ def create_dynamic_query(summary, question_type, difficulty, chroma_path=CHROMA_
         example_prompt = example_prompt_templates[question_type][difficulty]
         question_base = f"{question_type}-{difficulty}"
         
-        # Retrieve relevant contexts from the database
-        embedding_function = get_embeddings_function()
-        db = Chroma(persist_directory=chroma_path, embedding_function=embedding_function)
-        
-        num_docs_to_include = db._collection.count()
-        results = db.similarity_search_with_score(summary, k=num_docs_to_include)
-        
-        if not results:
-            return "No relevant context found to create the prompt template."
-        
-        # Combine the retrieved contexts
-        context_text = "\n\n---\n\n".join([doc.page_content for doc, _ in results])
-        
-        # Format the dynamic prompt template
-        formatted_prompt = ChatPromptTemplate.from_template(prompt_template).format(
-            context=context_text,
-            question_base=question_base,
-            example_prompt=example_prompt
+        # Reuse the dynamic prompt written for this corpus, bucket, model route and template
+        cache_key = make_key(
+            current_corpus_fingerprint(chroma_path, collection_name), question_type, difficulty,
+            _router.signature("dynamic_prompt"), make_key(prompt_template, example_prompt)
         )
-        
-        # Query the LLM for a dynamic prompt
-        model = OllamaLLM(model="llama3.2:3b")
-        dynamic_prompt = model.invoke(formatted_prompt).strip()
+        dynamic_prompt = _dynamic_prompt_cache.get(cache_key)
+
+        if dynamic_prompt is None:
+            # Retrieve a small, diverse context shared by all questions of this bucket
+            db = get_vector_store(collection_name, persist_directory=chroma_path)
+            context_text = _context_cache.get_or_build(
+                db, summary, question_type, difficulty,
+                token_budget=CONTEXT_TOKEN_BUDGET
+            )
+            
+            if not context_text:
+                return "No relevant context found to create the prompt template."
+            
+            # Format the dynamic prompt template
+            formatted_prompt = ChatPromptTemplate.from_template(prompt_template).format(
+                context=context_text,
+                question_base=question_base,
+                example_prompt=example_prompt
+            )
+            
+            # Query the LLM for a dynamic prompt
+            model = _router.llm("dynamic_prompt")
+            dynamic_prompt = model.invoke(formatted_prompt).strip()
+            if dynamic_prompt:
+                _dynamic_prompt_cache.put(cache_key, dynamic_prompt)
         
         # Format the query for question generation
         question_format = example_prompt_templates[question_type]["question_format"]
@@ -516,150 +1256,242 @@ def create_dynamic_query(summary, question_type, difficulty, chroma_path=CHROMA_
         return "Error generating prompt template."
 
 
-def get_summary_of_all_documents(max_docs=None):
+def get_summary_of_all_documents(max_docs=None, chroma_path=CHROMA_FOLDER_PATH, collection_name=DEFAULT_COLLECTION):
     """
     Summarize the content of all documents in the Chroma database.
 
+    Chunks are summarized in groups that fit the model's context (map) and the
+    partial summaries are combined into the final summary (reduce). Partial
+    summaries are cached by chunk content, so an unchanged corpus is summarized
+    without any LLM calls.
+
     Args:
         max_docs (int, optional): Limit the number of documents to include in the summary. Defaults to None.
+        chroma_path (str): The path to the Chroma database.
+        collection_name (str): The collection of the corpus.
 
     Returns:
         str: A summary of all documents in the database.
     """
     try:
-        # Connect to the Chroma database
-        db = Chroma(persist_directory=CHROMA_FOLDER_PATH, embedding_function=get_embeddings_function())
+        db = get_vector_store(collection_name, persist_directory=chroma_path)
 
-        # Fetch all documents
-        all_documents = db.get(include=["documents"])
-        total_docs = len(all_documents["documents"])
+        # Fetch all documents in a stable order so that cached partials stay valid
+        ordered = sorted(db.get_documents(), key=lambda item: natural_sort_key(item[0]))
+        documents = [document for _, document in ordered]
 
         # Limit the number of documents if max_docs is provided
-        if max_docs is not None and max_docs < total_docs:
-            documents = all_documents["documents"][:max_docs]
-        else:
-            documents = all_documents["documents"]
-
-        # Combine content from all documents
-        combined_content = "\n\n---\n\n".join(documents)
-
-        # Create a prompt for summarization
-        summary_prompt = f"Summarize the following content in 5 sentences:\n\n{combined_content}"
-
-        # Use the LLM to generate the summary
-        model = OllamaLLM(model="llama3.2:3b")
-        summary = model.invoke(summary_prompt).strip()
-        
-        return summary
+        if max_docs is not None:
+            documents = documents[:max_docs]
+
+        model = _router.llm("summary")
+        return summarize_documents(
+            model,
+            documents,
+            _summary_cache,
+            token_budget=SUMMARY_TOKEN_BUDGET,
+            max_workers=SUMMARY_MAX_WORKERS
+        )
 
     except Exception as e:
         print(f"Error generating summary of documents: {e}")
         return "An error occurred while summarizing the documents."
 
 
-def save_questions_to_docx(questions_and_answers):
+def save_quiz(questions, output_dir=DOWNLOAD_FOLDER_PATH):
     """
-    Save processed questions and answers to a .docx file.
+    Save generated questions as a structured quiz file.
 
     Args:
-        questions_and_answers (list): A list of tuples containing question type, question text, and answer.
+        questions (list): (question type, difficulty, question text) tuples in quiz order.
+        output_dir (str): The folder to save the file in.
 
     Returns:
-        str: The filename of the saved .docx file.
+        str: The filename of the saved quiz file.
     """
     try:
-        os.makedirs(DOWNLOAD_FOLDER_PATH, exist_ok=True)
+        os.makedirs(output_dir, exist_ok=True)
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"quiz_{timestamp}.docx"
-        filepath = os.path.join(DOWNLOAD_FOLDER_PATH, filename)
-
-        # Write to .docx
-        doc = Document()
-        doc.add_heading('Generated Questions', level=2)
-
-        for idx, (question_type, questions_and_answer) in enumerate(questions_and_answers, 1):
-            doc.add_paragraph(f"{idx}-)({question_type}) {questions_and_answer}")
-        doc.save(filepath)
+        filename = f"quiz_{timestamp}.json"
+        write_quiz(build_quiz(questions), os.path.join(output_dir, filename))
         return filename
     except Exception as e:
-        print(f"Error saving questions to DOCX: {str(e)}")
+        print(f"Error saving quiz: {str(e)}")
         raise RuntimeError("Failed to save questions to file.")
 
 
-def reset_database(chroma_path=CHROMA_FOLDER_PATH):
+def export_quiz(output_dir, filename, export_format="docx", version=ANSWER_KEY):
     """
-    Delete all vectors (documents, embeddings, etc.) from the Chroma database.
+    Render a saved quiz for download, or reuse the file rendered for an earlier download.
+
+    Quizzes saved as .docx files before quiz files existed can only be
+    downloaded as they are.
 
     Args:
-        chroma_path (str): The path to the Chroma database.
+        output_dir (str): The folder the quiz was saved in.
+        filename (str): The filename of the quiz file.
+        export_format (str): One of EXPORT_FORMATS: docx, pdf, moodle, gift or json.
+        version (str): "student" for the questions only, "key" for the questions with their answers.
+
+    Returns:
+        dict: The 'path', 'download_name' and 'mimetype' of the file, or an error message.
     """
+    spec = EXPORT_FORMATS.get(export_format)
+    if spec is None:
+        return {'error': f"Unknown format '{export_format}'. Choose one of: {', '.join(EXPORT_FORMATS)}."}
+    if version not in EXPORT_VERSIONS:
+        return {'error': f"Unknown version '{version}'. Choose one of: {', '.join(EXPORT_VERSIONS)}."}
+
+    path = os.path.join(output_dir, filename)
+    stem, extension = os.path.splitext(filename)
+    if extension == ".docx":
+        if export_format != "docx":
+            return {'error': "This quiz was saved before other formats were available; it can only be downloaded as a Word file."}
+        return {'path': path, 'download_name': filename, 'mimetype': spec.mimetype}
+
     try:
-        # Connect to the Chroma database
-        db = Chroma(persist_directory=chroma_path, embedding_function=get_embeddings_function())
+        quiz = read_quiz(path)
+        # A download counts as a use of the quiz folder, which keeps it from eviction
+        os.utime(path)
+        export_path = _export_cache.get(quiz, export_format, version)
+    except FileNotFoundError:
+        return {'error': "The quiz file is no longer available."}
+    except Exception as e:
+        print(f"Error exporting quiz: {str(e)}")
+        return {'error': "Failed to export the quiz."}
 
+    suffix = "" if len(spec.versions) == 1 else ("_answer_key" if version == ANSWER_KEY else "_student")
+    return {'path': export_path, 'download_name': f"{stem}{suffix}{spec.extension}", 'mimetype': spec.mimetype}
 
-        db.reset_collection()
-    except Exception as e:
-        print(f"Error deleting all entries from Chroma: {e}")
 
+def update_database(data_path=UPLOAD_FOLDER_PATH, chroma_path=CHROMA_FOLDER_PATH, collection_name=DEFAULT_COLLECTION):
+    """
+    Ingest new and changed files from the upload folder into the Chroma database.
 
-def count_characters(file_path, file_type):
-    """Count the number of characters in a file based on its type."""
-    try:
-        if file_type == 'txt':
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return len(f.read())
-        elif file_type == 'pdf':
-            reader = PdfReader(file_path)
-            return sum(len(page.extract_text()) for page in reader.pages)
-        elif file_type in {'doc', 'docx'}:
-            doc = Document(file_path)
-            return sum(len(paragraph.text) for paragraph in doc.paragraphs)
-        return 0
-    except Exception as e:
-        return f"Error counting characters: {e}"
+    Args:
+        data_path (str): The folder with the uploaded files.
+        chroma_path (str): The path to the Chroma database.
+        collection_name (str): The collection of the corpus.
 
-#--------------------------------------------------------------------------------------------#
+    Returns:
+        dict: Ingestion statistics.
+    """
+    db = get_vector_store(collection_name, persist_directory=chroma_path)
+    lexical_index = get_lexical_index(collection_name, persist_directory=chroma_path) if HYBRID_RETRIEVAL else None
+    started = time.perf_counter()
+    stats = ingest_directory(db, data_path, manifest_path_for(chroma_path, collection_name),
+                             embedder=_embedder, chunker=_chunker, lexical_index=lexical_index)
+    _throughput.record_ingestion(stats["embedding"]["tokens"], time.perf_counter() - started)
+    if stats["added_chunks"] or stats["removed_chunks"]:
+        _context_cache.clear()
+    return stats
+
+
+def plan_topics(chroma_path=CHROMA_FOLDER_PATH, collection_name=DEFAULT_COLLECTION):
+    """
+    Return the topic plan of a corpus, clustering its chunks once per corpus version.
 
-def run_script(script_name, arguments="", cwd=None):
+    Returns:
+        TopicPlan: The plan, or None if the collection is empty.
     """
-    Run a Python script as a subprocess.
+    db = get_vector_store(collection_name, persist_directory=chroma_path)
+    return _topic_planner.plan(db, current_corpus_fingerprint(chroma_path, collection_name))
 
-    Args:
-        script_name (str): The name of the script to run.
-        arguments (str, optional): Additional arguments for the script.
-        cwd (str, optional): Working directory for the script.
 
-    Raises:
-        RuntimeError: If the script execution fails.
+def current_corpus_fingerprint(chroma_path=CHROMA_FOLDER_PATH, collection_name=DEFAULT_COLLECTION):
     """
-    try:
-        current_python = sys.executable
-        cmd = [current_python, script_name] + arguments.split()
-        subprocess.run(cmd, cwd=cwd, check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"Error running script '{script_name}': {str(e)}")
-        raise RuntimeError(f"Script execution failed: {script_name}")
+    Return the content fingerprint of the corpus ingested into the Chroma database.
+    """
+    return corpus_fingerprint(manifest_path_for(chroma_path, collection_name))
+
+
+def get_cache_stats():
+    """
+    Return hit and miss counters of the LLM output, embedding and export caches.
+
+    Returns:
+        dict: Statistics per cache; a cache that is disabled is None.
+    """
+    embedding_cache = getattr(get_embeddings(), "cache", None)
+    return {
+        "dynamic_prompts": _dynamic_prompt_cache.stats(),
+        "answers": _answer_cache.stats() if _answer_cache is not None else None,
+        "embeddings": embedding_cache.stats() if embedding_cache is not None else None,
+        "exports": _export_cache.stats(),
+    }
 
 #--------------------------------------------------------------------------------------------#
 
-def clear_folder(folder_path):
+def get_tenant_corpus(tenant_id, corpus_id=None):
     """
-    Delete all files and directories in the specified folder.
+    Return a tenant's corpus if it still exists.
 
     Args:
-        folder_path (str): The path to the folder to clear.
+        tenant_id (str): The tenant (browser session) ID.
+        corpus_id (str, optional): The corpus the tenant last used.
+
+    Returns:
+        dict: The corpus, or None if the tenant has none or it was deleted.
     """
-    try:
-        if os.path.exists(folder_path):
-            for file_name in os.listdir(folder_path):
-                file_path = os.path.join(folder_path, file_name)
-                if os.path.isfile(file_path) or os.path.islink(file_path):
-                    os.unlink(file_path)  # Remove the file or link
-                elif os.path.isdir(file_path):
-                    shutil.rmtree(file_path)  # Remove the directory
-            print(f"Cleared all files in: {folder_path}")
-        else:
-            print(f"Folder does not exist: {folder_path}")
-    except Exception as e:
-        print(f"Error clearing folder '{folder_path}': {str(e)}")
+    return _corpus_manager.get(corpus_id, owner=tenant_id) if corpus_id else None
+
+
+def create_corpus(tenant_id):
+    """
+    Create an empty corpus for a tenant.
+    """
+    return _corpus_manager.create(tenant_id)
+
+
+def list_corpora(tenant_id):
+    """
+    List a tenant's corpora, most recently used first.
+    """
+    return _corpus_manager.list(tenant_id)
+
+
+def activate_corpus(tenant_id, corpus_id):
+    """
+    Switch a tenant to one of its corpora.
+
+    Returns:
+        dict: The corpus, or None if it is not one of the tenant's corpora.
+    """
+    corpus = _corpus_manager.get(corpus_id, owner=tenant_id)
+    if corpus is not None:
+        _corpus_manager.touch(corpus_id)
+    return corpus
+
+
+def incoming_file_path():
+    """
+    Return a fresh temporary path for a file before it is added to a corpus.
+    """
+    os.makedirs(BLOB_FOLDER_PATH, exist_ok=True)
+    return os.path.join(BLOB_FOLDER_PATH, f".incoming-{uuid.uuid4().hex}")
+
+#--------------------------------------------------------------------------------------------#
+
+def start_rag_clients():
+    """
+    Open the shared RAG clients. Called once when the Flask app starts.
+    """
+    init_clients(
+        persist_directory=CHROMA_FOLDER_PATH,
+        base_url=OLLAMA_BASE_URL,
+        keep_alive=OLLAMA_KEEP_ALIVE,
+        embedding_model=EMBEDDING_MODEL,
+        model_concurrency=OLLAMA_MODEL_CONCURRENCY,
+        embedding_cache_dir=EMBEDDING_CACHE_PATH,
+        memory_limit_bytes=CHROMA_MEMORY_LIMIT,
+        vector_store=VECTOR_STORE_BACKEND,
+        vector_store_options=VECTOR_STORE_OPTIONS
+    )
+
+
+def stop_rag_clients():
+    """
+    Close the shared RAG clients and the PDF extraction processes. Called when the Flask app shuts down.
+    """
+    close_clients()
+    close_pdf_workers()
@@ -1 +1,150 @@
-progress_data = {"status": "idle"}
+import threading
+import time
+
+# Progress tracking keyed by job or session. Every entry is an immutable
+# snapshot that is replaced as a whole on update, so readers never lock and
+# writers only swap a dictionary item. Listeners block on a per-key event
+# that is set whenever a new snapshot is published. Jobs can also publish
+# result items (e.g. generated questions) that are streamed to listeners.
+
+IDLE = "idle"
+DONE = "done"
+ERROR = "error"
+CANCELLED = "cancelled"
+FINAL_PHASES = {DONE, ERROR, CANCELLED}
+
+ENTRY_MAX_AGE = 60 * 60
+
+
+class ProgressStore:
+    """
+    Structured progress per key: phase, status message, completed/total
+    counts, per-phase timings and an ETA for the current phase.
+
+    Each key is expected to have one logical writer at a time (a job, or a
+    session's upload request); concurrent writers to one key must serialize
+    their own updates.
+    """
+
+    def __init__(self, max_age=ENTRY_MAX_AGE):
+        self.max_age = max_age
+        self._snapshots = {}
+        self._items = {}
+        self._events = {}
+
+    def get(self, key):
+        """
+        Return the latest snapshot for a key.
+        """
+        return self._snapshots.get(key) or _initial_snapshot()
+
+    def update(self, key, status=None, phase=None, completed=None, total=None):
+        """
+        Publish a new snapshot for a key and wake up its listeners.
+
+        Args:
+            key (str): The job or session key.
+            status (str, optional): Human-readable status message.
+            phase (str, optional): Name of the current phase; a new phase resets the counts.
+            completed (int, optional): Work items completed in the current phase.
+            total (int, optional): Work items in the current phase.
+
+        Returns:
+            dict: The published snapshot.
+        """
+        now = time.time()
+        previous = self._snapshots.get(key)
+        if previous is None:
+            self._prune(now)
+            previous = _initial_snapshot(now)
+
+        snapshot = dict(previous)
+        snapshot["timings"] = dict(previous["timings"])
+        if phase is not None and phase != previous["phase"]:
+            if previous["phase"] != IDLE:
+                snapshot["timings"][previous["phase"]] = round(now - previous["phase_started_at"], 3)
+            snapshot.update({"phase": phase, "phase_started_at": now, "completed": 0, "total": None})
+        if status is not None:
+            snapshot["status"] = status
+        if completed is not None:
+            snapshot["completed"] = completed
+        if total is not None:
+            snapshot["total"] = total
+        snapshot["items"] = len(self._items.get(key, []))
+        snapshot["eta"] = _estimate_eta(snapshot, now)
+        snapshot["version"] = previous["version"] + 1
+        snapshot["updated_at"] = now
+
+        self._snapshots[key] = snapshot
+        event = self._events.pop(key, None)
+        if event is not None:
+            event.set()
+        return snapshot
+
+    def publish_item(self, key, item):
+        """
+        Append a result item for a key and wake up its listeners.
+
+        Args:
+            key (str): The job key.
+            item (dict): JSON-serializable item.
+        """
+        # list.append is atomic, so concurrent publishers to one key need no lock
+        self._items.setdefault(key, []).append(item)
+        self.update(key)
+
+    def items(self, key, start=0):
+        """
+        Return the items published for a key, starting at index `start`.
+        """
+        return self._items.get(key, [])[start:]
+
+    def wait_for_change(self, key, version, timeout=None):
+        """
+        Block until the snapshot for a key is newer than `version`.
+
+        Returns:
+            dict: The newer snapshot, or None if the timeout expired first.
+        """
+        event = self._events.setdefault(key, threading.Event())
+        snapshot = self.get(key)
+        if snapshot["version"] > version:
+            return snapshot
+        if not event.wait(timeout):
+            return None
+        return self.get(key)
+
+    def _prune(self, now):
+        """Drop entries that have not been updated for `max_age` seconds."""
+        for key, snapshot in list(self._snapshots.items()):
+            if now - snapshot["updated_at"] > self.max_age:
+                self._snapshots.pop(key, None)
+                self._items.pop(key, None)
+
+
+def _initial_snapshot(now=None):
+    now = now or time.time()
+    return {
+        "status": IDLE,
+        "phase": IDLE,
+        "completed": 0,
+        "total": None,
+        "timings": {},
+        "items": 0,
+        "eta": None,
+        "version": 0,
+        "phase_started_at": now,
+        "updated_at": now,
+    }
+
+
+def _estimate_eta(snapshot, now):
+    """Estimate the seconds left in the current phase from its average pace."""
+    completed, total = snapshot["completed"], snapshot["total"]
+    if not total or not completed or completed >= total:
+        return None
+    elapsed = now - snapshot["phase_started_at"]
+    return round(elapsed / completed * (total - completed), 1)
+
+
+progress_store = ProgressStore()
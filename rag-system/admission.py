@@ -0,0 +1,325 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+from xml.etree.ElementTree import iterparse
+from pypdf import PdfReader
+
+# Upload admission control. Before an uploaded file joins a corpus, the size
+# of its text is estimated without extracting all of it: a few evenly spaced
+# PDF pages are extracted and scaled to the page count, the head of a text
+# file is scaled to the file size, and the text runs of a Word document are
+# counted while its XML is streamed. Tokens are counted on the sampled text
+# and scaled the same way. The estimate is checked against the character
+# limit of a single upload, the token budget of the corpus it goes into and
+# the token budget of all the tenant's corpora together, and uploads are
+# metered by a token bucket per tenant: an upload the bucket cannot cover yet
+# is rejected at once with the time after which it will, so no request thread
+# waits for the bucket, and an admitted upload that fails to join its corpus
+# gets its tokens back. A throughput estimator, updated by every ingestion and
+# quiz, turns token and question counts into the expected ingestion and
+# generation time.
+
+SAMPLE_PAGES = 8
+TEXT_SAMPLE_BYTES = 64 * 1024
+TOKEN_SAMPLE_CHARACTERS = 20000
+W_TEXT_TAG = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}t"
+W_PARAGRAPH_TAG = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}p"
+DEFAULT_TOKENS_PER_SECOND = 2000.0
+DEFAULT_SECONDS_PER_QUESTION = 6.0
+THROUGHPUT_SMOOTHING = 0.3
+
+
+def estimate_document(file_path, file_type, count_tokens, sample_pages=SAMPLE_PAGES):
+    """
+    Estimate the characters and tokens of an uploaded file from a sample of its text.
+
+    Args:
+        file_path (str): Path of the file.
+        file_type (str): The file extension without the dot, e.g. "pdf".
+        count_tokens (callable): Counts the tokens of a text, as the chunker does.
+        sample_pages (int): PDF pages extracted at most.
+
+    Returns:
+        dict: The estimated 'characters' and 'tokens', the 'pages' (PDF only),
+            and 'sampled', True if the counts were scaled from a sample.
+    """
+    file_type = file_type.lower()
+    if file_type == "pdf":
+        return _estimate_pdf(file_path, count_tokens, sample_pages)
+    if file_type == "docx":
+        return _estimate_docx(file_path, count_tokens)
+    if file_type == "txt":
+        return _estimate_text(file_path, count_tokens)
+    # Formats without a loader are stored but never ingested
+    return {"characters": 0, "tokens": 0, "pages": None, "sampled": False}
+
+
+def estimate_text(text, count_tokens):
+    """
+    Estimate the characters and tokens of a text that is already in memory.
+    """
+    return _scaled(text, len(text), count_tokens, pages=None)
+
+
+def _scaled(sample, characters, count_tokens, pages):
+    # Tokens are counted on at most TOKEN_SAMPLE_CHARACTERS and scaled to the characters
+    counted = sample[:TOKEN_SAMPLE_CHARACTERS]
+    tokens = count_tokens(counted) if counted else 0
+    if counted and len(counted) < characters:
+        tokens = math.ceil(tokens * characters / len(counted))
+    return {"characters": int(characters), "tokens": int(tokens), "pages": pages,
+            "sampled": len(sample) < characters}
+
+
+def _estimate_pdf(file_path, count_tokens, sample_pages):
+    reader = PdfReader(file_path)
+    page_count = len(reader.pages)
+    if not page_count:
+        return {"characters": 0, "tokens": 0, "pages": 0, "sampled": False}
+    count = min(sample_pages, page_count)
+    # Evenly spaced pages: the first, the last and those in between
+    indices = sorted({round(i * (page_count - 1) / max(count - 1, 1)) for i in range(count)})
+    texts = [reader.pages[index].extract_text() or "" for index in indices]
+    sample = "\n".join(texts)
+    characters = sum(len(text) for text in texts) * page_count / len(indices)
+    estimate = _scaled(sample, characters, count_tokens, pages=page_count)
+    estimate["sampled"] = len(indices) < page_count
+    return estimate
+
+
+def _estimate_docx(file_path, count_tokens):
+    characters = 0
+    sample = []
+    sampled_characters = 0
+    with zipfile.ZipFile(file_path) as package, package.open("word/document.xml") as part:
+        for _, element in iterparse(part, events=("end",)):
+            if element.tag == W_TEXT_TAG and element.text:
+                characters += len(element.text)
+                if sampled_characters < TOKEN_SAMPLE_CHARACTERS:
+                    sample.append(element.text)
+                    sampled_characters += len(element.text)
+            elif element.tag == W_PARAGRAPH_TAG:
+                element.clear()
+    return _scaled(" ".join(sample), characters, count_tokens, pages=None)
+
+
+def _estimate_text(file_path, count_tokens):
+    size = os.path.getsize(file_path)
+    with open(file_path, "rb") as f:
+        head = f.read(TEXT_SAMPLE_BYTES)
+    sample = head.decode("utf-8", errors="ignore")
+    characters = len(sample) if len(head) >= size else len(sample) * size / max(len(head), 1)
+    return _scaled(sample, characters, count_tokens, pages=None)
+
+
+class ThroughputEstimator:
+    """
+    Smoothed ingestion and generation throughput, measured by recent runs.
+
+    Args:
+        tokens_per_second (float): Ingestion throughput assumed before the first measurement.
+        seconds_per_question (float): Generation time per question assumed before the first measurement.
+        smoothing (float): Weight of a new measurement in the moving averages.
+    """
+
+    def __init__(self, tokens_per_second=DEFAULT_TOKENS_PER_SECOND,
+                 seconds_per_question=DEFAULT_SECONDS_PER_QUESTION, smoothing=THROUGHPUT_SMOOTHING):
+        self.tokens_per_second = tokens_per_second
+        self.seconds_per_question = seconds_per_question
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+
+    def record_ingestion(self, tokens, seconds):
+        """Update the ingestion throughput with the tokens embedded in `seconds`."""
+        if tokens <= 0 or seconds <= 0:
+            return
+        with self._lock:
+            self.tokens_per_second += self.smoothing * (tokens / seconds - self.tokens_per_second)
+
+    def record_generation(self, questions, seconds):
+        """Update the generation time per question with a finished quiz."""
+        if questions <= 0 or seconds <= 0:
+            return
+        with self._lock:
+            self.seconds_per_question += self.smoothing * (seconds / questions - self.seconds_per_question)
+
+    def ingestion_seconds(self, tokens):
+        with self._lock:
+            return tokens / self.tokens_per_second
+
+    def generation_seconds(self, questions):
+        with self._lock:
+            return questions * self.seconds_per_question
+
+
+class AdmissionController:
+    """
+    Admission decisions for uploads, with a ledger of the estimated tokens of every admitted document.
+
+    Args:
+        path (str): Path of the SQLite ledger.
+        character_limit (int): Estimated characters allowed in a single upload.
+        corpus_token_budget (int): Estimated tokens allowed in one corpus.
+        tenant_token_budget (int): Estimated tokens allowed in all the corpora of one tenant.
+        tokens_per_minute (float): Rate at which a tenant's token bucket refills.
+        burst_tokens (float): Capacity of a tenant's token bucket.
+    """
+
+    def __init__(self, path, character_limit, corpus_token_budget, tenant_token_budget, tokens_per_minute,
+                 burst_tokens):
+        self.path = path
+        self.character_limit = character_limit
+        self.corpus_token_budget = corpus_token_budget
+        self.tenant_token_budget = tenant_token_budget
+        self.rate = tokens_per_minute / 60.0
+        self.burst_tokens = burst_tokens
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def admit(self, tenant, corpus_id, name, estimate, documents=None, tenant_corpora=None):
+        """
+        Decide whether an upload may join a corpus, taking its tokens from the tenant's bucket.
+
+        Args:
+            tenant (str): The tenant uploading the file.
+            corpus_id (str): The corpus the file is added to.
+            name (str): The file name in the corpus; a file of the same name is replaced.
+            estimate (dict): The file's estimate from `estimate_document` or `estimate_text`.
+            documents (list, optional): The names of the documents currently in the corpus.
+            tenant_corpora (dict, optional): The names of the documents in each of the
+                tenant's corpora, by corpus ID; without it the tenant budget is not checked.
+
+        Returns:
+            dict: 'admitted', with the 'tenant' and the tokens 'reserved' from
+                its bucket, or 'admitted' False with an 'error' message, an
+                HTTP 'status' and, for uploads that were metered out, the
+                seconds after which to 'retry'.
+        """
+        characters, tokens = estimate["characters"], estimate["tokens"]
+        if characters > self.character_limit:
+            return {
+                "admitted": False, "status": 413,
+                "error": f"This file holds about {characters:,} characters of text; "
+                         f"uploads are limited to {self.character_limit:,}. Split it into smaller files."
+            }
+
+        used = self.corpus_tokens(corpus_id, documents, exclude=name)
+        if used + tokens > self.corpus_token_budget:
+            return {
+                "admitted": False, "status": 413,
+                "error": f"This collection already holds about {used:,} tokens and this file adds about "
+                         f"{tokens:,}; a collection is limited to {self.corpus_token_budget:,}. "
+                         "Start a new collection for more material."
+            }
+
+        if tenant_corpora is not None:
+            owned = sum(self.corpus_tokens(owned_id, owned_documents, exclude=name if owned_id == corpus_id else None)
+                        for owned_id, owned_documents in tenant_corpora.items())
+            if owned + tokens > self.tenant_token_budget:
+                return {
+                    "admitted": False, "status": 413,
+                    "error": f"Your collections already hold about {owned:,} tokens and this file adds about "
+                             f"{tokens:,}; all your collections together are limited to "
+                             f"{self.tenant_token_budget:,}. Remove collections you no longer need."
+                }
+
+        reserved, wait = self._reserve(tenant, tokens)
+        if wait > 0:
+            return {
+                "admitted": False, "status": 429, "retry": math.ceil(wait),
+                "error": f"Too much material was uploaded in a short time. "
+                         f"Try again in {math.ceil(wait)} seconds."
+            }
+        return {"admitted": True, "tenant": tenant, "reserved": reserved}
+
+    def refund(self, decision):
+        """
+        Return the tokens an admitted upload took from its tenant's bucket,
+        for an upload that failed before it joined its corpus.
+        """
+        if not decision.get("reserved"):
+            return
+        with self._lock:
+            available, updated = self._buckets.get(decision["tenant"], (self.burst_tokens, time.monotonic()))
+            self._buckets[decision["tenant"]] = (min(self.burst_tokens, available + decision["reserved"]), updated)
+
+    def record(self, corpus_id, name, estimate):
+        """
+        Store the estimate of an admitted document, replacing an earlier file of the same name.
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (corpus_id, name, characters, tokens, admitted_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (corpus_id, name, estimate["characters"], estimate["tokens"], time.time())
+            )
+
+    def forget(self, corpus_id):
+        """
+        Remove the estimates of a deleted corpus' documents.
+        """
+        with self._connect() as conn:
+            conn.execute("DELETE FROM documents WHERE corpus_id = ?", (corpus_id,))
+
+    def corpus_tokens(self, corpus_id, documents=None, exclude=None):
+        """
+        Return the estimated tokens of a corpus' admitted documents.
+
+        Args:
+            corpus_id (str): The corpus.
+            documents (list, optional): Only these document names are counted,
+                so files that have left the corpus no longer count.
+            exclude (str, optional): A document name not counted, such as a file being replaced.
+        """
+        with self._connect() as conn:
+            rows = conn.execute("SELECT name, tokens FROM documents WHERE corpus_id = ?", (corpus_id,)).fetchall()
+        current = set(documents) if documents is not None else None
+        return sum(tokens for name, tokens in rows
+                   if name != exclude and (current is None or name in current))
+
+    def _reserve(self, tenant, tokens):
+        """
+        Take a file's tokens from a tenant's bucket if it holds them.
+
+        Returns the tokens taken and the seconds until the bucket holds them,
+        0 if they were taken. Nothing is taken from a bucket that cannot cover
+        the file yet. A file larger than the bucket costs a full bucket.
+        """
+        now = time.monotonic()
+        needed = min(tokens, self.burst_tokens)
+        with self._lock:
+            available, updated = self._buckets.get(tenant, (self.burst_tokens, now))
+            available = min(self.burst_tokens, available + (now - updated) * self.rate)
+            wait = max(0.0, (needed - available) / self.rate) if self.rate > 0 else 0.0
+            if wait == 0:
+                available -= needed
+            self._buckets[tenant] = (available, now)
+        return (needed if wait == 0 else 0), wait
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection to the ledger, creating its table on first use."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                if not self._initialized:
+                    conn.execute(
+                        """CREATE TABLE IF NOT EXISTS documents (
+                            corpus_id TEXT NOT NULL,
+                            name TEXT NOT NULL,
+                            characters INTEGER NOT NULL,
+                            tokens INTEGER NOT NULL,
+                            admitted_at REAL NOT NULL,
+                            PRIMARY KEY (corpus_id, name)
+                        )"""
+                    )
+                    self._initialized = True
+                yield conn
+        finally:
+            conn.close()
@@ -0,0 +1,234 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+
+# Persistent caches for LLM output. DiskCache maps exact keys to values;
+# SemanticCache finds values by the cosine similarity of query embeddings.
+# Both live in SQLite files, evict least-recently-used entries beyond a size
+# limit, expire entries after a TTL, and count hits and misses.
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_TTL = 7 * 24 * 60 * 60
+DEFAULT_SIMILARITY = 0.95
+
+
+def make_key(*parts):
+    """
+    Build a cache key from JSON-serializable parts.
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class _SQLiteCache:
+    """Shared storage, eviction and statistics of the SQLite-backed caches."""
+
+    def __init__(self, path, max_entries, ttl):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            self._create_table(conn)
+
+    def stats(self):
+        """
+        Return hit and miss counters and the number of stored entries.
+        """
+        with self._lock, self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else None,
+                "entries": entries,
+            }
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM entries")
+            self._on_clear()
+
+    def _record(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def _evict(self, conn, now):
+        """Drop expired entries and the least recently used ones beyond the size limit."""
+        conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.ttl,))
+        conn.execute(
+            """DELETE FROM entries WHERE key IN (
+                SELECT key FROM entries ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+            )""",
+            (self.max_entries,)
+        )
+
+    def _on_clear(self):
+        pass
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+
+class DiskCache(_SQLiteCache):
+    """
+    Exact-key cache of text values with LRU and TTL eviction.
+
+    Args:
+        path (str): Path of the SQLite file.
+        max_entries (int): Entries kept before the least recently used are evicted.
+        ttl (float): Seconds after which an entry expires.
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        super().__init__(path, max_entries, ttl)
+
+    def _create_table(self, conn):
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+
+    def get(self, key):
+        """
+        Return the cached value for a key, or None if missing or expired.
+        """
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM entries WHERE key = ? AND created_at >= ?", (key, now - self.ttl)
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._record(row is not None)
+        return row[0] if row else None
+
+    def put(self, key, value):
+        """
+        Store a value under a key.
+        """
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            self._evict(conn, now)
+
+
+class SemanticCache(_SQLiteCache):
+    """
+    Cache of text values looked up by query-embedding similarity.
+
+    Entries are grouped in namespaces (e.g. corpus, model and prompt template);
+    a lookup only matches entries of the same namespace whose embedding has a
+    cosine similarity of at least `threshold` with the query's. Embeddings of a
+    namespace are kept in memory as one normalized matrix, so a lookup is a
+    single matrix-vector product.
+
+    Args:
+        path (str): Path of the SQLite file.
+        threshold (float): Minimum cosine similarity of a hit.
+        max_entries (int): Entries kept before the least recently used are evicted.
+        ttl (float): Seconds after which an entry expires.
+    """
+
+    def __init__(self, path, threshold=DEFAULT_SIMILARITY, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.threshold = threshold
+        self._matrices = {}
+        super().__init__(path, max_entries, ttl)
+
+    def _create_table(self, conn):
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_namespace ON entries (namespace)")
+
+    def get(self, namespace, embedding):
+        """
+        Return the value of the most similar entry in a namespace, or None.
+        """
+        query = _normalize(embedding)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            keys, matrix = self._matrix(conn, namespace, now)
+            value = None
+            if len(keys):
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    row = conn.execute(
+                        "SELECT value FROM entries WHERE key = ? AND created_at >= ?", (keys[best], now - self.ttl)
+                    ).fetchone()
+                    if row is not None:
+                        conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, keys[best]))
+                        value = row[0]
+            self._record(value is not None)
+        return value
+
+    def put(self, namespace, embedding, value):
+        """
+        Store a value under a query embedding in a namespace.
+        """
+        vector = _normalize(embedding)
+        key = make_key(namespace, hashlib.sha256(vector.tobytes()).hexdigest())
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                """INSERT OR REPLACE INTO entries (key, namespace, embedding, value, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?)""",
+                (key, namespace, vector.tobytes(), value, now, now)
+            )
+            self._evict(conn, now)
+            self._matrices.clear()
+
+    def _matrix(self, conn, namespace, now):
+        """Load (and memoize) the keys and embedding matrix of a namespace."""
+        cached = self._matrices.get(namespace)
+        if cached is None:
+            rows = conn.execute(
+                "SELECT key, embedding FROM entries WHERE namespace = ? AND created_at >= ?",
+                (namespace, now - self.ttl)
+            ).fetchall()
+            keys = [row[0] for row in rows]
+            matrix = (np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+                      if rows else np.zeros((0, 0), dtype=np.float32))
+            cached = (keys, matrix)
+            self._matrices[namespace] = cached
+        return cached
+
+    def _on_clear(self):
+        self._matrices.clear()
+
+
+def _normalize(embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
@@ -0,0 +1,218 @@
+import math
+import os
+import re
+import zlib
+from langchain.schema.document import Document
+
+# Token-aware chunker. Text is split into headings and sentences, which are
+# packed across the pages of a source into chunks of at most a target number
+# of model tokens; the target is derived from the context window so that the
+# chunks retrieved for one prompt always fit it. Chunk boundaries are content-defined: once a chunk holds the
+# minimum number of tokens, it ends after any sentence whose hash hits an
+# anchor value, so an edit only moves the boundaries of the chunks around it
+# and the chunks after it are cut exactly as before.
+
+CONTEXT_WINDOW = 4096
+RESERVED_TOKENS = 1024
+CHUNKS_PER_PROMPT = 5
+MIN_FILL = 0.75
+ANCHOR_DIVISOR = 4
+
+TOKEN_PATTERN = re.compile(r"[^\W\d_]+|\d+|[^\w\s]|_+")
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])[\"')\]]*\s+(?=[\"'(\[]?[A-Z0-9])")
+HEADING_PATTERN = re.compile(r"^(#{1,6}\s+\S|(\d+(\.\d+)*\.?|[IVX]+\.|(Chapter|CHAPTER|Section|SECTION)\s+\d+)\s+[A-Z])")
+HEADING_MAX_WORDS = 12
+
+# Metadata marking where a chunk spanning several pages ends, taken from its last page
+SPAN_END_KEYS = ("end",)
+
+HEADING = "heading"
+PARAGRAPH = "paragraph"
+SENTENCE = "sentence"
+
+
+def estimate_token_count(text):
+    """
+    Estimate the model tokens of a text without a tokenizer.
+
+    Words count as one token per five letters, numbers as one per three
+    digits and every punctuation mark as one token, which follows subword
+    tokenizers far closer than a fixed number of characters per token.
+    """
+    count = 0
+    for token in TOKEN_PATTERN.findall(text):
+        if token[0].isdigit():
+            count += math.ceil(len(token) / 3)
+        else:
+            count += math.ceil(len(token) / 5)
+    return count
+
+
+def load_token_counter(tokenizer_path=None):
+    """
+    Return a function counting the tokens of a text.
+
+    Args:
+        tokenizer_path (str, optional): A Hugging Face tokenizer.json of the model.
+            Needs the `tokenizers` package; without it, tokens are estimated.
+
+    Returns:
+        tuple: The counting function and the name of the tokenizer.
+    """
+    if tokenizer_path and os.path.exists(tokenizer_path):
+        try:
+            from tokenizers import Tokenizer
+        except ImportError:
+            print("The 'tokenizers' package is not installed; estimating chunk tokens instead.")
+        else:
+            tokenizer = Tokenizer.from_file(tokenizer_path)
+            return (
+                lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids),
+                os.path.basename(tokenizer_path),
+            )
+    return estimate_token_count, "estimate"
+
+
+def chunk_token_target(context_window=CONTEXT_WINDOW, reserved_tokens=RESERVED_TOKENS, chunks_per_prompt=CHUNKS_PER_PROMPT):
+    """
+    Return the chunk size in tokens at which `chunks_per_prompt` chunks fill a
+    context window, after reserving tokens for the instructions and the answer.
+    """
+    return max(64, (context_window - reserved_tokens) // chunks_per_prompt)
+
+
+def is_heading(line):
+    """
+    Check whether a line looks like a heading: a Markdown heading, a numbered
+    or "Chapter" section title, or a short line in capitals, never ending in
+    sentence punctuation.
+    """
+    if len(line.split()) > HEADING_MAX_WORDS or line.endswith((".", ",", ";", ":", "?", "!")):
+        return False
+    return bool(HEADING_PATTERN.match(line)) or (line.isupper() and any(c.isalpha() for c in line))
+
+
+def is_anchor(text, divisor=ANCHOR_DIVISOR):
+    """
+    Check whether a content-defined boundary may follow this text.
+    """
+    return zlib.crc32(text.encode("utf-8")) % divisor == 0
+
+
+class TokenChunker:
+    """
+    Split documents into chunks of at most `target_tokens` tokens at sentence
+    and heading boundaries.
+
+    Args:
+        target_tokens (int): Maximum tokens per chunk. Defaults to `chunk_token_target()`.
+        count_tokens (callable, optional): Token counting function. Defaults to `estimate_token_count`.
+        tokenizer_name (str): Name of the tokenizer, part of the chunker's signature.
+        min_fill (float): Fraction of the target a chunk holds before it may end at an anchor.
+        anchor_divisor (int): One in `anchor_divisor` sentences is an anchor.
+    """
+
+    def __init__(self, target_tokens=None, count_tokens=None, tokenizer_name="estimate",
+                 min_fill=MIN_FILL, anchor_divisor=ANCHOR_DIVISOR):
+        self.target_tokens = target_tokens or chunk_token_target()
+        self.min_tokens = int(self.target_tokens * min_fill)
+        self.count_tokens = count_tokens or estimate_token_count
+        self.anchor_divisor = anchor_divisor
+        self.signature = f"tokens-v1:{tokenizer_name}:{self.target_tokens}:{self.min_tokens}:{anchor_divisor}"
+
+    def split_documents(self, documents):
+        """
+        Pack the headings and sentences of documents into chunks.
+
+        A chunk may continue onto the next page of the same source, so page
+        ends do not leave small chunks behind. A heading starts a new chunk
+        unless the current one is still below the minimum size, and is never
+        left at the end of a chunk.
+
+        Args:
+            documents (iterable): Documents to split, in order; may be a generator.
+
+        Yields:
+            Document: The chunks, with the metadata of the page they start on,
+            their token count and, if any, the heading of their section.
+        """
+        parts, tokens = [], 0
+        section = chunk_section = None
+
+        for document in documents:
+            if parts and parts[0][3].metadata.get("source") != document.metadata.get("source"):
+                yield self._chunk(parts, chunk_section)
+                parts, tokens, section = [], 0, None
+
+            for text, count, kind in self._segments(document.page_content):
+                if parts and (tokens + count > self.target_tokens or (kind == HEADING and tokens >= self.min_tokens)):
+                    carried = []
+                    while parts and parts[-1][2] == HEADING:
+                        carried.insert(0, parts.pop())
+                    if parts:
+                        yield self._chunk(parts, chunk_section)
+                    parts = carried
+                    tokens = sum(part[1] for part in parts)
+                    chunk_section = section
+
+                if kind == HEADING:
+                    section = text
+                if not parts:
+                    chunk_section = section
+                parts.append((text, count, kind, document))
+                tokens += count
+
+                if kind != HEADING and tokens >= self.min_tokens and is_anchor(text, self.anchor_divisor):
+                    yield self._chunk(parts, chunk_section)
+                    parts, tokens = [], 0
+
+        if parts:
+            yield self._chunk(parts, chunk_section)
+
+    def _segments(self, text):
+        """Yield (text, tokens, kind) for every heading and sentence of a text."""
+        paragraph = []
+        for line in text.splitlines():
+            line = line.strip()
+            if line and not is_heading(line):
+                paragraph.append(line)
+                continue
+            yield from self._sentences(" ".join(paragraph))
+            paragraph = []
+            if line:
+                yield line, self.count_tokens(line), HEADING
+        yield from self._sentences(" ".join(paragraph))
+
+    def _sentences(self, paragraph):
+        """Yield the sentences of a paragraph, cutting overlong ones at word boundaries."""
+        kind = PARAGRAPH
+        for sentence in SENTENCE_PATTERN.split(paragraph):
+            sentence = " ".join(sentence.split())
+            if not sentence:
+                continue
+            count = self.count_tokens(sentence)
+            if count <= self.target_tokens:
+                yield sentence, count, kind
+            else:
+                words = sentence.split()
+                pieces = math.ceil(count / self.target_tokens) + 1
+                size = math.ceil(len(words) / pieces)
+                for start in range(0, len(words), size):
+                    piece = " ".join(words[start:start + size])
+                    yield piece, self.count_tokens(piece), kind
+                    kind = SENTENCE
+            kind = SENTENCE
+
+    def _chunk(self, parts, section):
+        text = parts[0][0]
+        for part_text, _, kind, _ in parts[1:]:
+            text += ("\n" if kind != SENTENCE else " ") + part_text
+        metadata = dict(parts[0][3].metadata)
+        last = parts[-1][3].metadata
+        for key in SPAN_END_KEYS:
+            if key in last:
+                metadata[key] = last[key]
+        metadata["tokens"] = sum(part[1] for part in parts)
+        if section:
+            metadata["section"] = section
+        return Document(page_content=text, metadata=metadata)
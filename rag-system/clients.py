@@ -0,0 +1,259 @@
+import threading
+from contextlib import contextmanager
+from chromadb.config import Settings
+from langchain_ollama import OllamaLLM
+from get_embeddings import get_embeddings_function, EMBEDDING_MODEL
+from embedding_cache import EmbeddingCache, CachedEmbeddings
+from vector_stores import open_vector_store
+from lexical_index import LexicalIndex
+
+# Process-wide registry of RAG clients. Every request thread shares one
+# embeddings client, one vector-store handle and one BM25 index per
+# collection, and one keep-alive LLM client per model instead of rebuilding
+# them on each call. Calls to each model endpoint are capped by a semaphore
+# so that concurrent workers do not overload the Ollama server. Embeddings are served from an on-disk
+# content-addressed cache when a cache directory is configured.
+
+CHROMA_PATH = "chroma"
+DEFAULT_COLLECTION = "langchain"
+DEFAULT_BACKEND = "chroma"
+DEFAULT_MODEL_CONCURRENCY = 2
+
+_lock = threading.RLock()
+_settings = {
+    "persist_directory": CHROMA_PATH,
+    "base_url": None,
+    "keep_alive": None,
+    "embedding_model": EMBEDDING_MODEL,
+    "model_concurrency": {},
+    "embedding_cache_dir": None,
+    "memory_limit_bytes": None,
+    "vector_store": DEFAULT_BACKEND,
+    "vector_store_options": {},
+}
+_embeddings = None
+_vector_stores = {}
+_lexical_indexes = {}
+_llms = {}
+_model_slots = {}
+
+
+def init_clients(persist_directory=CHROMA_PATH, base_url=None, keep_alive=None, embedding_model=EMBEDDING_MODEL,
+                 model_concurrency=None, embedding_cache_dir=None, memory_limit_bytes=None,
+                 vector_store=DEFAULT_BACKEND, vector_store_options=None):
+    """
+    Configure the registry and open the default clients.
+
+    Called once at application startup. Clients created before this call are
+    closed so that the new settings take effect.
+
+    Args:
+        persist_directory (str): Default directory of the vector-store database.
+        base_url (str, optional): Ollama server URL.
+        keep_alive (str | int, optional): How long Ollama keeps models loaded between calls.
+        embedding_model (str): Ollama embedding model name.
+        model_concurrency (dict, optional): Maximum concurrent requests per model name.
+        embedding_cache_dir (str, optional): Directory of the embedding cache; no caching if None.
+        memory_limit_bytes (int, optional): Memory for loaded Chroma collections; least recently used
+            collections are unloaded beyond it. Unlimited if None.
+        vector_store (str): Vector-store backend, "chroma" or "local" (see vector_stores.py).
+        vector_store_options (dict, optional): Extra parameters of the backend.
+    """
+    with _lock:
+        close_clients()
+        _settings.update({
+            "persist_directory": persist_directory,
+            "base_url": base_url,
+            "keep_alive": keep_alive,
+            "embedding_model": embedding_model,
+            "model_concurrency": dict(model_concurrency or {}),
+            "embedding_cache_dir": embedding_cache_dir,
+            "memory_limit_bytes": memory_limit_bytes,
+            "vector_store": vector_store,
+            "vector_store_options": dict(vector_store_options or {}),
+        })
+        _model_slots.clear()
+        get_vector_store()
+
+
+def get_embeddings():
+    """
+    Return the shared embeddings client.
+    """
+    global _embeddings
+    if _embeddings is None:
+        with _lock:
+            if _embeddings is None:
+                embeddings = get_embeddings_function(
+                    model=_settings["embedding_model"],
+                    base_url=_settings["base_url"],
+                )
+                if _settings["embedding_cache_dir"]:
+                    cache = EmbeddingCache(_settings["embedding_cache_dir"], _settings["embedding_model"])
+                    embeddings = CachedEmbeddings(embeddings, cache)
+                _embeddings = embeddings
+    return _embeddings
+
+
+def get_vector_store(collection_name=DEFAULT_COLLECTION, persist_directory=None):
+    """
+    Return the shared vector-store handle for a collection.
+
+    Args:
+        collection_name (str): Name of the collection.
+        persist_directory (str, optional): Database directory. Defaults to the configured one.
+
+    Returns:
+        VectorStore: The vector store for the collection, from the configured backend.
+    """
+    key = (persist_directory or _settings["persist_directory"], collection_name)
+    store = _vector_stores.get(key)
+    if store is None:
+        with _lock:
+            store = _vector_stores.get(key)
+            if store is None:
+                options = dict(_settings["vector_store_options"])
+                if _settings["vector_store"] == "chroma":
+                    options["client_settings"] = _client_settings()
+                store = open_vector_store(
+                    _settings["vector_store"], collection_name, key[0], get_embeddings(), **options
+                )
+                _vector_stores[key] = store
+    return store
+
+
+def get_lexical_index(collection_name=DEFAULT_COLLECTION, persist_directory=None):
+    """
+    Return the shared BM25 index of a collection, stored next to its vector store.
+    """
+    key = (persist_directory or _settings["persist_directory"], collection_name)
+    index = _lexical_indexes.get(key)
+    if index is None:
+        with _lock:
+            index = _lexical_indexes.setdefault(key, LexicalIndex(collection_name, key[0]))
+    return index
+
+
+def get_llm(model, **options):
+    """
+    Return the shared LLM client for a model and option set.
+
+    The underlying HTTP client keeps its connections open, and Ollama is
+    asked to keep the model loaded between calls. Calls through the client
+    wait for a free slot of the model's concurrency cap.
+
+    Args:
+        model (str): Ollama model name.
+        **options: Extra OllamaLLM parameters (e.g. temperature, num_ctx).
+
+    Returns:
+        RateLimitedLLM: The LLM client.
+    """
+    key = (model, tuple(sorted(options.items())))
+    llm = _llms.get(key)
+    if llm is None:
+        with _lock:
+            llm = _llms.get(key)
+            if llm is None:
+                params = {"keep_alive": _settings["keep_alive"], "base_url": _settings["base_url"]}
+                params.update(options)
+                llm = RateLimitedLLM(OllamaLLM(model=model, **params))
+                _llms[key] = llm
+    return llm
+
+
+@contextmanager
+def model_slot(model):
+    """
+    Hold one of the concurrent-request slots of a model endpoint.
+    """
+    key = (_settings["base_url"], model)
+    slot = _model_slots.get(key)
+    if slot is None:
+        with _lock:
+            slot = _model_slots.get(key)
+            if slot is None:
+                limit = _settings["model_concurrency"].get(model, DEFAULT_MODEL_CONCURRENCY)
+                slot = threading.BoundedSemaphore(limit)
+                _model_slots[key] = slot
+    with slot:
+        yield
+
+
+class RateLimitedLLM:
+    """
+    Wrapper around an OllamaLLM that caps concurrent calls per model endpoint.
+    """
+
+    def __init__(self, llm):
+        self.llm = llm
+
+    def invoke(self, prompt, **kwargs):
+        with model_slot(self.llm.model):
+            return self.llm.invoke(prompt, **kwargs)
+
+    def stream(self, prompt, **kwargs):
+        with model_slot(self.llm.model):
+            yield from self.llm.stream(prompt, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+
+def reset_vector_store(collection_name=DEFAULT_COLLECTION, persist_directory=None):
+    """
+    Delete every entry of a collection and of its lexical index while keeping the shared handles usable.
+    """
+    with _lock:
+        get_vector_store(collection_name, persist_directory).reset_collection()
+        get_lexical_index(collection_name, persist_directory).reset()
+
+
+def delete_vector_store(collection_name, persist_directory=None):
+    """
+    Delete a collection with all its entries and its lexical index, and drop their shared handles.
+    """
+    with _lock:
+        key = (persist_directory or _settings["persist_directory"], collection_name)
+        get_vector_store(collection_name, persist_directory).delete_collection()
+        get_lexical_index(collection_name, persist_directory).delete_index()
+        _vector_stores.pop(key, None)
+        _lexical_indexes.pop(key, None)
+
+
+def close_clients():
+    """
+    Close every shared client. Called at application teardown.
+    """
+    global _embeddings
+    with _lock:
+        for llm in _llms.values():
+            _close_http_client(llm.llm)
+        if _embeddings is not None:
+            _close_http_client(getattr(_embeddings, "embeddings", _embeddings))
+        _llms.clear()
+        _vector_stores.clear()
+        _lexical_indexes.clear()
+        _embeddings = None
+
+
+def _client_settings():
+    """Chroma client settings; every handle of one directory must use the same."""
+    if _settings["memory_limit_bytes"] is None:
+        return None
+    return Settings(
+        chroma_segment_cache_policy="LRU",
+        chroma_memory_limit_bytes=_settings["memory_limit_bytes"],
+        anonymized_telemetry=False,
+    )
+
+
+def _close_http_client(client):
+    """Close the HTTP connection pool behind an Ollama LangChain client, if any."""
+    ollama_client = getattr(client, "_client", None)
+    http_client = getattr(ollama_client, "_client", None)
+    try:
+        if http_client is not None:
+            http_client.close()
+    except Exception as e:
+        print(f"Error closing client: {e}")
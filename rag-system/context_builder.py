@@ -0,0 +1,101 @@
+import threading
+from summarizer import estimate_tokens, CHARS_PER_TOKEN, SEPARATOR
+
+# Prompt-building stage for dynamic queries. Instead of ranking the whole
+# collection for every question, a small and diverse set of chunks is picked
+# with maximal marginal relevance (MMR), packed into a token budget and reused
+# by every question of the same type and difficulty.
+
+TOKEN_BUDGET = 2000
+TOP_K = 8
+FETCH_K = 24
+LAMBDA_MULT = 0.5
+MAX_CACHE_ENTRIES = 256
+
+
+class ContextCache:
+    """
+    Thread-safe cache of packed contexts, keyed by collection, query and question bucket.
+    """
+
+    def __init__(self, max_entries=MAX_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get_or_build(self, db, query, question_type, difficulty, **options):
+        """
+        Return the cached context for a bucket, building it on first use.
+
+        Args:
+            db (VectorStore): The vector store to retrieve from.
+            query (str): Text the context should be relevant to.
+            question_type (str): The question type of the bucket.
+            difficulty (str): The difficulty of the bucket.
+            **options: Passed on to `build_context`.
+
+        Returns:
+            str: The packed context text.
+        """
+        key = (db.name, query, question_type, difficulty)
+        with self._lock:
+            context = self._entries.get(key)
+        if context is not None:
+            return context
+
+        context = build_context(db, query, **options)
+        with self._lock:
+            self._entries[key] = context
+            while len(self._entries) > self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+        return context
+
+    def clear(self, collection=None):
+        """Drop the cached contexts of one collection, or of all collections."""
+        with self._lock:
+            if collection is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key[0] == collection]:
+                    del self._entries[key]
+
+
+def build_context(db, query, token_budget=TOKEN_BUDGET, k=TOP_K, fetch_k=FETCH_K, lambda_mult=LAMBDA_MULT):
+    """
+    Pick a small, diverse set of relevant chunks and pack them into a token budget.
+
+    Args:
+        db (VectorStore): The vector store to retrieve from.
+        query (str): Text the context should be relevant to.
+        token_budget (int): Maximum estimated tokens of the packed context.
+        k (int): Number of chunks selected by MMR.
+        fetch_k (int): Number of nearest chunks MMR chooses from.
+        lambda_mult (float): 1 favours relevance, 0 favours diversity.
+
+    Returns:
+        str: The packed context, or an empty string if nothing was found.
+    """
+    documents = db.max_marginal_relevance_search(query, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult)
+    return pack_context([doc.page_content for doc in documents], token_budget)
+
+
+def pack_context(texts, token_budget):
+    """
+    Join texts in order until the token budget is spent.
+
+    The first text is always included, truncated if it alone exceeds the budget.
+    """
+    packed = []
+    used_tokens = 0
+    separator_tokens = estimate_tokens(SEPARATOR)
+
+    for text in texts:
+        tokens = estimate_tokens(text) + (separator_tokens if packed else 0)
+        if used_tokens + tokens > token_budget:
+            if not packed:
+                packed.append(text[:token_budget * CHARS_PER_TOKEN])
+            break
+        packed.append(text)
+        used_tokens += tokens
+
+    return SEPARATOR.join(packed)
@@ -0,0 +1,336 @@
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from clients import delete_vector_store
+from ingestion import manifest_path_for, load_manifest, clear_manifest, file_hash
+
+# Per-tenant corpora. Every corpus has its own Chroma collection, upload
+# directory and ingestion manifest, so tenants never see or reset each other's
+# material and switching back to an earlier corpus needs no re-ingestion.
+# Uploaded files are stored once in a content-addressed blob directory and
+# hard-linked into each corpus that uses them; blobs are reference-counted and
+# deleted with their last corpus. Whenever a file is added or a corpus
+# ingested, corpora left unused for too long expire (empty ones much sooner),
+# and while the estimated disk usage exceeds the budget, the least recently
+# used corpora that are not in use are evicted.
+# Other stores that keep data per corpus register a delete hook, which is
+# called whenever a corpus is deleted or evicted.
+
+COLLECTION_PREFIX = "corpus-"
+DISK_BUDGET = 2 * 1024 ** 3
+MAX_IDLE = 30 * 24 * 3600
+EMPTY_MAX_IDLE = 24 * 3600
+# Estimated index size of one chunk: its vector, text and Chroma bookkeeping
+INDEX_BYTES_PER_CHUNK = 8 * 1024
+
+
+class CorpusManager:
+    """
+    Registry of tenant corpora backed by a SQLite database.
+
+    Args:
+        db_path (str): Path of the corpus registry database.
+        upload_root (str): Directory holding one upload directory per corpus.
+        persist_directory (str): Chroma database directory of the corpus collections.
+        blob_dir (str): Directory of the shared, content-addressed uploaded files.
+        disk_budget (int): Estimated bytes of files and index kept before idle corpora are evicted.
+        max_idle (float): Seconds a corpus with documents is kept without being used.
+        empty_max_idle (float): Seconds a corpus without documents is kept without being used.
+    """
+
+    def __init__(self, db_path, upload_root, persist_directory, blob_dir, disk_budget=DISK_BUDGET,
+                 max_idle=MAX_IDLE, empty_max_idle=EMPTY_MAX_IDLE):
+        self.db_path = db_path
+        self.upload_root = upload_root
+        self.persist_directory = persist_directory
+        self.blob_dir = blob_dir
+        self.disk_budget = disk_budget
+        self.max_idle = max_idle
+        self.empty_max_idle = empty_max_idle
+        self._lock = threading.RLock()
+        self._pins = {}
+        self._delete_hooks = []
+        self._initialized = False
+
+    def add_delete_hook(self, hook):
+        """
+        Register a function called as hook(corpus_id, collection) when a corpus is deleted or evicted.
+        """
+        self._delete_hooks.append(hook)
+
+    def create(self, owner):
+        """
+        Create an empty corpus for a tenant.
+
+        Returns:
+            dict: The new corpus.
+        """
+        corpus_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO corpora (id, owner, created_at, last_used, chunks) VALUES (?, ?, ?, ?, 0)",
+                (corpus_id, owner, now, now)
+            )
+        os.makedirs(self._data_path(corpus_id), exist_ok=True)
+        return self.get(corpus_id)
+
+    def get(self, corpus_id, owner=None):
+        """
+        Look up a corpus, optionally only if it belongs to `owner`.
+
+        Returns:
+            dict: The corpus' id, owner, collection, data_path, manifest_path, documents and chunks, or None.
+        """
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, owner, created_at, last_used, chunks FROM corpora WHERE id = ?", (corpus_id,)
+            ).fetchone()
+            if row is None or (owner is not None and row[1] != owner):
+                return None
+            documents = [name for (name,) in conn.execute(
+                "SELECT name FROM documents WHERE corpus_id = ? ORDER BY name", (corpus_id,)
+            )]
+        return self._describe(row, documents)
+
+    def list(self, owner):
+        """
+        List a tenant's corpora, most recently used first.
+        """
+        with self._lock, self._connect() as conn:
+            ids = [corpus_id for (corpus_id,) in conn.execute(
+                "SELECT id FROM corpora WHERE owner = ? ORDER BY last_used DESC", (owner,)
+            )]
+        return [corpus for corpus in (self.get(corpus_id) for corpus_id in ids) if corpus]
+
+    def touch(self, corpus_id):
+        """
+        Mark a corpus as used now.
+        """
+        with self._lock, self._connect() as conn:
+            conn.execute("UPDATE corpora SET last_used = ? WHERE id = ?", (time.time(), corpus_id))
+
+    def add_file(self, corpus_id, source_path, filename):
+        """
+        Add a file to a corpus, taking ownership of `source_path`.
+
+        The file is moved into the blob directory unless an identical file is
+        already stored there, and is hard-linked into the corpus' upload
+        directory. A file of the same name is replaced. Expired and, over the
+        disk budget, idle corpora other than this one are then evicted.
+
+        Returns:
+            str: The path of the file in the corpus' upload directory.
+        """
+        digest = file_hash(source_path)
+        size = os.path.getsize(source_path)
+        blob_path = os.path.join(self.blob_dir, digest)
+        target_path = os.path.join(self._data_path(corpus_id), filename)
+
+        with self._lock:
+            with self._connect() as conn:
+                previous = conn.execute(
+                    "SELECT digest FROM documents WHERE corpus_id = ? AND name = ?", (corpus_id, filename)
+                ).fetchone()
+                if previous and previous[0] == digest:
+                    os.remove(source_path)
+                    return target_path
+
+                os.makedirs(self.blob_dir, exist_ok=True)
+                if os.path.exists(blob_path):
+                    os.remove(source_path)
+                else:
+                    os.replace(source_path, blob_path)
+                conn.execute(
+                    "INSERT INTO blobs (digest, size, refcount) VALUES (?, ?, 1) "
+                    "ON CONFLICT(digest) DO UPDATE SET refcount = refcount + 1",
+                    (digest, size)
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO documents (corpus_id, name, digest) VALUES (?, ?, ?)",
+                    (corpus_id, filename, digest)
+                )
+                if previous:
+                    self._release_blob(conn, previous[0])
+
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            if os.path.exists(target_path):
+                os.remove(target_path)
+            _link_or_copy(blob_path, target_path)
+        self.touch(corpus_id)
+        self.evict(keep={corpus_id})
+        return target_path
+
+    def record_ingestion(self, corpus_id):
+        """
+        Store a corpus' chunk count after ingestion and evict expired and, over budget, idle corpora.
+        """
+        manifest = load_manifest(manifest_path_for(self.persist_directory, _collection_name(corpus_id)))
+        chunks = sum(len(entry["chunks"]) for entry in manifest["files"].values())
+        with self._lock, self._connect() as conn:
+            conn.execute("UPDATE corpora SET chunks = ?, last_used = ? WHERE id = ?", (chunks, time.time(), corpus_id))
+        self.evict(keep={corpus_id})
+
+    def delete(self, corpus_id):
+        """
+        Delete a corpus: its collection, manifest and upload directory, its blob
+        references, and what the delete hooks keep for it.
+        """
+        with self._lock:
+            collection = _collection_name(corpus_id)
+            try:
+                delete_vector_store(collection, self.persist_directory)
+            except Exception as e:
+                print(f"Error deleting collection '{collection}': {str(e)}")
+            clear_manifest(manifest_path_for(self.persist_directory, collection))
+            shutil.rmtree(self._data_path(corpus_id), ignore_errors=True)
+
+            with self._connect() as conn:
+                digests = [digest for (digest,) in conn.execute(
+                    "SELECT digest FROM documents WHERE corpus_id = ?", (corpus_id,)
+                )]
+                conn.execute("DELETE FROM documents WHERE corpus_id = ?", (corpus_id,))
+                conn.execute("DELETE FROM corpora WHERE id = ?", (corpus_id,))
+                for digest in digests:
+                    self._release_blob(conn, digest)
+
+            for hook in self._delete_hooks:
+                try:
+                    hook(corpus_id, collection)
+                except Exception as e:
+                    print(f"Error clearing the data of corpus {corpus_id}: {str(e)}")
+        print(f"Deleted corpus {corpus_id}")
+
+    def disk_usage(self):
+        """
+        Estimate the bytes used by stored files and corpus indexes.
+        """
+        with self._lock, self._connect() as conn:
+            files = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            chunks = conn.execute("SELECT COALESCE(SUM(chunks), 0) FROM corpora").fetchone()[0]
+        return files + chunks * INDEX_BYTES_PER_CHUNK
+
+    def evict(self, keep=()):
+        """
+        Delete expired corpora, then least recently used ones until the disk usage fits the budget.
+
+        A corpus expires when it has not been used for `max_idle` seconds, or
+        `empty_max_idle` seconds if it holds no documents. Corpora in `keep`
+        and corpora in use are never evicted.
+
+        Returns:
+            list: The IDs of the evicted corpora.
+        """
+        evicted = []
+        now = time.time()
+        with self._lock:
+            with self._connect() as conn:
+                candidates = conn.execute(
+                    "SELECT id, last_used, EXISTS (SELECT 1 FROM documents WHERE corpus_id = corpora.id) "
+                    "FROM corpora ORDER BY last_used"
+                ).fetchall()
+            over_budget = self.disk_usage() > self.disk_budget
+            for corpus_id, last_used, has_documents in candidates:
+                if corpus_id in keep or self._pins.get(corpus_id):
+                    continue
+                max_idle = self.max_idle if has_documents else self.empty_max_idle
+                if not over_budget and now - last_used <= max_idle:
+                    continue
+                self.delete(corpus_id)
+                evicted.append(corpus_id)
+                over_budget = self.disk_usage() > self.disk_budget
+        return evicted
+
+    @contextmanager
+    def in_use(self, corpus_id):
+        """
+        Protect a corpus from eviction while it is being used, e.g. by a job.
+        """
+        with self._lock:
+            self._pins[corpus_id] = self._pins.get(corpus_id, 0) + 1
+        self.touch(corpus_id)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pins[corpus_id] -= 1
+                if not self._pins[corpus_id]:
+                    del self._pins[corpus_id]
+
+    def _describe(self, row, documents):
+        corpus_id = row[0]
+        collection = _collection_name(corpus_id)
+        return {
+            "id": corpus_id,
+            "owner": row[1],
+            "created_at": row[2],
+            "last_used": row[3],
+            "chunks": row[4],
+            "documents": documents,
+            "collection": collection,
+            "data_path": self._data_path(corpus_id),
+            "manifest_path": manifest_path_for(self.persist_directory, collection),
+        }
+
+    def _data_path(self, corpus_id):
+        return os.path.join(self.upload_root, corpus_id)
+
+    def _release_blob(self, conn, digest):
+        """Drop one reference to a blob and delete the file with its last reference."""
+        conn.execute("UPDATE blobs SET refcount = refcount - 1 WHERE digest = ?", (digest,))
+        row = conn.execute("SELECT refcount FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        if row is not None and row[0] <= 0:
+            conn.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+            blob_path = os.path.join(self.blob_dir, digest)
+            if os.path.exists(blob_path):
+                os.remove(blob_path)
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection to the registry, creating its tables on first use."""
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                if not self._initialized:
+                    conn.executescript(
+                        """CREATE TABLE IF NOT EXISTS corpora (
+                            id TEXT PRIMARY KEY,
+                            owner TEXT NOT NULL,
+                            created_at REAL NOT NULL,
+                            last_used REAL NOT NULL,
+                            chunks INTEGER NOT NULL DEFAULT 0
+                        );
+                        CREATE TABLE IF NOT EXISTS documents (
+                            corpus_id TEXT NOT NULL,
+                            name TEXT NOT NULL,
+                            digest TEXT NOT NULL,
+                            PRIMARY KEY (corpus_id, name)
+                        );
+                        CREATE TABLE IF NOT EXISTS blobs (
+                            digest TEXT PRIMARY KEY,
+                            size INTEGER NOT NULL,
+                            refcount INTEGER NOT NULL
+                        );
+                        CREATE INDEX IF NOT EXISTS corpora_owner ON corpora (owner, last_used);"""
+                    )
+                    self._initialized = True
+                yield conn
+        finally:
+            conn.close()
+
+
+def _collection_name(corpus_id):
+    return f"{COLLECTION_PREFIX}{corpus_id}"
+
+
+def _link_or_copy(source, target):
+    """Hard-link a file, falling back to a copy where links are not supported."""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
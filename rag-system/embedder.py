@@ -0,0 +1,138 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from summarizer import estimate_tokens
+
+# Embedding stage of ingestion. Chunks are embedded in fixed-size batches by a
+# bounded pool of concurrent requests; at most `max_pending` batches are in
+# flight, so a lazy source of chunks is only read as fast as the embedding
+# server keeps up. A batch that fails is retried on its own with backoff, and
+# the vectors are written to the store from the calling thread in order.
+
+BATCH_SIZE = 64
+MAX_WORKERS = 4
+MAX_RETRIES = 3
+RETRY_DELAY = 0.5
+
+
+class EmbeddingError(Exception):
+    """Raised when a batch still fails after all its retries."""
+
+
+class BatchEmbedder:
+    """
+    Embed documents in parallel batches and add them to a vector store.
+
+    Args:
+        batch_size (int): Chunks per embedding request.
+        max_workers (int): Concurrent embedding requests.
+        max_pending (int, optional): Batches in flight before reading more input. Defaults to 2 * max_workers.
+        max_retries (int): Extra attempts for a failed batch.
+        retry_delay (float): Seconds before the first retry; doubled on each further retry.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, max_workers=MAX_WORKERS, max_pending=None,
+                 max_retries=MAX_RETRIES, retry_delay=RETRY_DELAY):
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_pending = max_pending or 2 * max_workers
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+    def add_documents(self, db, documents, on_stored=None):
+        """
+        Embed documents and upsert them into the store under their metadata "id".
+
+        Args:
+            db (VectorStore): The vector store to add to.
+            documents (iterable): Documents with an "id" in their metadata; may be a generator.
+            on_stored (callable, optional): Called with each batch once it is in the store.
+
+        Returns:
+            dict: Counts of chunks, tokens, batches and retries, and the throughput.
+        """
+        metrics = new_metrics()
+        started = time.perf_counter()
+        pending = deque()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="embed") as executor:
+            try:
+                for batch in _batches(documents, self.batch_size):
+                    # Backpressure: wait for the oldest batch before reading further
+                    if len(pending) >= self.max_pending:
+                        self._store(db, *pending.popleft(), metrics, on_stored)
+                    pending.append((batch, executor.submit(self._embed, db.embeddings, batch)))
+                while pending:
+                    self._store(db, *pending.popleft(), metrics, on_stored)
+            finally:
+                for _, future in pending:
+                    future.cancel()
+
+        metrics["seconds"] = time.perf_counter() - started
+        return finish_metrics(metrics)
+
+    def _embed(self, embeddings, batch):
+        """Embed one batch, retrying it alone on failure."""
+        texts = [doc.page_content for doc in batch]
+        for attempt in range(self.max_retries + 1):
+            try:
+                return embeddings.embed_documents(texts), attempt
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise EmbeddingError(f"Embedding a batch of {len(batch)} chunks failed: {str(e)}") from e
+                print(f"Embedding batch failed (attempt {attempt + 1}), retrying: {str(e)}")
+                time.sleep(self.retry_delay * 2 ** attempt)
+
+    def _store(self, db, batch, future, metrics, on_stored=None):
+        """Write an embedded batch to the store and count it."""
+        vectors, retries = future.result()
+        db.upsert_embeddings(
+            ids=[doc.metadata["id"] for doc in batch],
+            embeddings=vectors,
+            documents=[doc.page_content for doc in batch],
+            metadatas=[doc.metadata for doc in batch],
+        )
+        if on_stored is not None:
+            on_stored(batch)
+        metrics["chunks"] += len(batch)
+        metrics["tokens"] += sum(estimate_tokens(doc.page_content) for doc in batch)
+        metrics["batches"] += 1
+        metrics["retries"] += retries
+
+
+def new_metrics():
+    """
+    Return empty embedding metrics.
+    """
+    return finish_metrics({"chunks": 0, "tokens": 0, "batches": 0, "retries": 0, "seconds": 0.0})
+
+
+def merge_metrics(total, metrics):
+    """
+    Add the counts and time of one embedding run to a running total.
+    """
+    for name in ("chunks", "tokens", "batches", "retries", "seconds"):
+        total[name] += metrics[name]
+    return finish_metrics(total)
+
+
+def finish_metrics(metrics):
+    """
+    Fill in the chunks-per-second and tokens-per-second throughput.
+    """
+    seconds = metrics["seconds"]
+    metrics["chunks_per_second"] = round(metrics["chunks"] / seconds, 1) if seconds else None
+    metrics["tokens_per_second"] = round(metrics["tokens"] / seconds, 1) if seconds else None
+    return metrics
+
+
+def _batches(documents, batch_size):
+    """Group an iterable of documents into lists of at most `batch_size`."""
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,230 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from contextlib import contextmanager
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Content-addressed cache of embedding vectors. Vectors are keyed by the
+# embedding model and the hash of the normalized text, so the same chunk is
+# embedded only once no matter which file it came from or how often the
+# vector store is reset. Each model has its own directory holding an
+# append-only float32 matrix (memory-mapped for reads) and the matching list
+# of text digests. Appends hold an exclusive lock on the digest file, so
+# several processes can share a cache: each one first indexes the rows the
+# others appended and then writes at the current end of the files.
+
+DIGEST_SIZE = 32
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """
+    Normalize text before hashing: Unicode NFC form and collapsed whitespace.
+    """
+    return WHITESPACE_PATTERN.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def text_digest(text):
+    """
+    Return the binary SHA-256 digest of the normalized text.
+    """
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).digest()
+
+
+@contextmanager
+def locked_file(path):
+    """
+    Open a file for appending and hold an exclusive lock on it across processes.
+    """
+    with open(path, "ab") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield f
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class EmbeddingCache:
+    """
+    On-disk, memory-mapped store of the embedding vectors of one model.
+
+    Args:
+        directory (str): Root directory of the cache; each model gets a subdirectory.
+        model (str): Name of the embedding model.
+    """
+
+    def __init__(self, directory, model):
+        self.model = model
+        self.directory = os.path.join(directory, re.sub(r"[^\w.-]", "_", model))
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._vectors_path = os.path.join(self.directory, "vectors.f32")
+        self._keys_path = os.path.join(self.directory, "keys.bin")
+        self._meta_path = os.path.join(self.directory, "meta.json")
+        self._dim = None
+        self._rows = {}
+        self._count = 0
+        self._matrix = None
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, locked_file(self._keys_path):
+            self._sync()
+
+    def get_many(self, texts):
+        """
+        Look up the vectors of several texts.
+
+        Returns:
+            list: A vector (list of floats) per text, or None where it is not cached.
+        """
+        digests = [text_digest(text) for text in texts]
+        with self._lock:
+            rows = [self._rows.get(digest) for digest in digests]
+            matrix = self._mapped() if any(row is not None for row in rows) else None
+            found = sum(row is not None for row in rows)
+            self.hits += found
+            self.misses += len(rows) - found
+        return [matrix[row].tolist() if row is not None else None for row in rows]
+
+    def put_many(self, texts, vectors):
+        """
+        Append the vectors of several texts; texts already cached, by this
+        process or another one, are skipped.
+        """
+        with self._lock, locked_file(self._keys_path):
+            self._sync()
+            new_digests, new_vectors, seen = [], [], set()
+            for text, vector in zip(texts, vectors):
+                digest = text_digest(text)
+                if digest in self._rows or digest in seen:
+                    continue
+                seen.add(digest)
+                new_digests.append(digest)
+                new_vectors.append(vector)
+            if not new_digests:
+                return
+
+            matrix = np.asarray(new_vectors, dtype=np.float32)
+            if self._dim is None:
+                self._dim = matrix.shape[1]
+                with open(self._meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"model": self.model, "dim": self._dim}, f)
+            elif matrix.shape[1] != self._dim:
+                raise ValueError(f"Expected {self._dim}-dimensional vectors, got {matrix.shape[1]}.")
+
+            # The files end at the last complete row after the sync. Vectors are
+            # written before their keys, so a crash in between leaves
+            # unreferenced rows that the next sync trims
+            start = os.path.getsize(self._keys_path) // DIGEST_SIZE
+            with open(self._vectors_path, "ab") as f:
+                f.write(matrix.tobytes())
+            with open(self._keys_path, "ab") as f:
+                f.write(b"".join(new_digests))
+
+            for offset, digest in enumerate(new_digests):
+                self._rows[digest] = start + offset
+            self._count = start + len(new_digests)
+            self._matrix = None
+
+    def stats(self):
+        """
+        Return hit and miss counters and the number of cached vectors.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else None,
+                "entries": len(self._rows),
+            }
+
+    def _sync(self):
+        """
+        Index the rows appended since the last sync, by any process, and trim
+        a partially written tail. Called with the digest file locked.
+        """
+        if self._dim is None:
+            if not os.path.exists(self._meta_path):
+                return
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                self._dim = json.load(f)["dim"]
+
+        row_size = self._dim * 4
+        key_bytes = os.path.getsize(self._keys_path)
+        vector_bytes = os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+        count = min(key_bytes // DIGEST_SIZE, vector_bytes // row_size)
+
+        if key_bytes != count * DIGEST_SIZE:
+            with open(self._keys_path, "r+b") as f:
+                f.truncate(count * DIGEST_SIZE)
+        if vector_bytes != count * row_size:
+            with open(self._vectors_path, "r+b") as f:
+                f.truncate(count * row_size)
+
+        if count > self._count:
+            with open(self._keys_path, "rb") as f:
+                f.seek(self._count * DIGEST_SIZE)
+                keys = f.read((count - self._count) * DIGEST_SIZE)
+            for i in range(count - self._count):
+                # A text appended by two processes at once keeps its first row
+                self._rows.setdefault(keys[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE], self._count + i)
+            self._count = count
+            self._matrix = None
+
+    def _mapped(self):
+        """Return the vector file memory-mapped as a matrix, remapping after appends."""
+        if self._matrix is None:
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r",
+                                     shape=(self._count, self._dim))
+        return self._matrix
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings client that serves vectors from an EmbeddingCache and only
+    sends uncached texts to the wrapped client, in a single call.
+
+    Args:
+        embeddings (Embeddings): The client that computes missing vectors.
+        cache (EmbeddingCache): The cache for the client's model.
+    """
+
+    def __init__(self, embeddings, cache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        vectors = self.cache.get_many(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = self.embeddings.embed_documents([texts[i] for i in missing])
+            self.cache.put_many([texts[i] for i in missing], computed)
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+        return vectors
+
+    def embed_query(self, text):
+        # Ollama embeds queries and documents the same way, so they share entries
+        return self.embed_documents([text])[0]
+
+    def __getattr__(self, name):
+        return getattr(self.embeddings, name)
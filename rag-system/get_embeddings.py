@@ -1,5 +1,7 @@
 from langchain_ollama import OllamaEmbeddings
 
-def get_embeddings_function():
-    embeddings = OllamaEmbeddings(model="nomic-embed-text")
-    return embeddings
\ No newline at end of file
+EMBEDDING_MODEL = "nomic-embed-text"
+
+def get_embeddings_function(model=EMBEDDING_MODEL, base_url=None):
+    embeddings = OllamaEmbeddings(model=model, base_url=base_url)
+    return embeddings
@@ -0,0 +1,303 @@
+import hashlib
+import json
+import os
+import threading
+from chunker import TokenChunker
+from embedder import BatchEmbedder, new_metrics, merge_metrics
+from loaders import LOADERS, load_documents
+
+# Incremental ingestion engine. A manifest next to the vector store records the
+# content hash of every ingested file and of every chunk it produced, so that an
+# unchanged file is skipped and a changed file only re-embeds the chunks whose
+# text actually changed. Files are streamed page by page from the loader through
+# the chunker into the embedder, so embedding starts before loading finishes.
+# Chunk IDs are derived from the chunk text, so they stay the same however the
+# chunks before them change; a file is re-chunked when the chunker settings change.
+# When the collection has a lexical (BM25) index, every chunk stored in the
+# vector store is indexed with it, and removed chunks leave both together.
+
+ID_DIGEST_LENGTH = 16
+LEXICAL_BATCH_SIZE = 256
+HASH_BLOCK_SIZE = 1024 * 1024
+
+_manifest_locks = {}
+_manifest_locks_guard = threading.Lock()
+
+
+def manifest_path_for(persist_directory, collection_name):
+    """
+    Return the path of the ingestion manifest of a collection.
+    """
+    return os.path.join(persist_directory, f"{collection_name}_manifest.json")
+
+
+def ingest_directory(db, data_path, manifest_path, embedder=None, chunker=None, lexical_index=None):
+    """
+    Bring the vector store in line with the files in a directory.
+
+    New and changed files are (re)ingested, unchanged files are skipped and
+    the chunks of deleted files are removed.
+
+    Args:
+        db (VectorStore): The vector store to update.
+        data_path (str): Directory with the source files.
+        manifest_path (str): Path of the ingestion manifest.
+        embedder (BatchEmbedder, optional): Embedding stage for new chunks. Defaults to BatchEmbedder().
+        chunker (TokenChunker, optional): Splits pages into chunks. Defaults to TokenChunker().
+        lexical_index (LexicalIndex, optional): BM25 index kept in line with the vector store.
+
+    Returns:
+        dict: Counts of added and removed chunks and of skipped files, and embedding metrics.
+    """
+    embedder = embedder or BatchEmbedder()
+    chunker = chunker or TokenChunker()
+    stats = {"files": 0, "skipped_files": 0, "added_chunks": 0, "removed_chunks": 0,
+             "embedding": new_metrics()}
+
+    with _manifest_lock(manifest_path):
+        manifest = load_manifest(manifest_path)
+        files = manifest["files"]
+
+        current_paths = set(list_source_files(data_path))
+        for file_path in sorted(current_paths):
+            stats["files"] += 1
+            try:
+                added, removed, metrics = _ingest_file(db, file_path, files, embedder, chunker, lexical_index)
+            except Exception as e:
+                print(f"Error ingesting '{file_path}': {str(e)}")
+                continue
+            if added is None:
+                stats["skipped_files"] += 1
+                continue
+            stats["added_chunks"] += added
+            stats["removed_chunks"] += removed
+            merge_metrics(stats["embedding"], metrics)
+
+        for file_path in sorted(set(files) - current_paths):
+            stale_ids = list(files.pop(file_path)["chunks"])
+            if stale_ids:
+                db.delete(ids=stale_ids)
+                if lexical_index is not None:
+                    lexical_index.delete(ids=stale_ids)
+            stats["removed_chunks"] += len(stale_ids)
+
+        save_manifest(manifest_path, manifest)
+        if lexical_index is not None:
+            lexical_index.build()
+
+    print(f"Ingestion finished: {stats}")
+    return stats
+
+
+def ingest_file(db, file_path, manifest_path, embedder=None, chunker=None, lexical_index=None):
+    """
+    Ingest a single file, re-embedding only the chunks that changed.
+
+    Args:
+        db (VectorStore): The vector store to update.
+        file_path (str): Path of the file to ingest.
+        manifest_path (str): Path of the ingestion manifest.
+        embedder (BatchEmbedder, optional): Embedding stage for new chunks. Defaults to BatchEmbedder().
+        chunker (TokenChunker, optional): Splits pages into chunks. Defaults to TokenChunker().
+        lexical_index (LexicalIndex, optional): BM25 index kept in line with the vector store.
+
+    Returns:
+        dict: Counts of added and removed chunks and embedding metrics, or a skipped flag if unchanged.
+    """
+    with _manifest_lock(manifest_path):
+        manifest = load_manifest(manifest_path)
+        added, removed, metrics = _ingest_file(
+            db, file_path, manifest["files"], embedder or BatchEmbedder(), chunker or TokenChunker(), lexical_index
+        )
+        save_manifest(manifest_path, manifest)
+        if lexical_index is not None:
+            lexical_index.build()
+
+    if added is None:
+        return {"skipped": True}
+    return {"added_chunks": added, "removed_chunks": removed, "embedding": metrics}
+
+
+def _ingest_file(db, file_path, files, embedder, chunker, lexical_index=None):
+    """
+    Diff one file against its manifest entry and apply the changes.
+
+    Returns:
+        tuple: (added, removed) chunk counts and embedding metrics, or (None, 0, None) if the file is unchanged.
+    """
+    stat = os.stat(file_path)
+    entry = files.get(file_path)
+    # Files chunked with other chunker settings, or not yet in the lexical index,
+    # are re-chunked even if unchanged
+    indexed = lexical_index is None or (entry is not None and entry.get("lexical", False))
+    current = entry is not None and entry.get("chunker") == chunker.signature and indexed
+    if current and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+        return None, 0, None
+
+    digest = file_hash(file_path)
+    if current and entry["hash"] == digest:
+        entry["mtime"] = stat.st_mtime
+        return None, 0, None
+
+    previous_chunks = entry["chunks"] if entry else {}
+    current_chunks = {}
+    unindexed = []
+
+    def changed_chunks():
+        for chunk in calculate_chunk_ids(split_documents(load_documents(file_path), chunker)):
+            content_hash = chunk_hash(chunk.page_content)
+            current_chunks[chunk.metadata["id"]] = content_hash
+            if previous_chunks.get(chunk.metadata["id"]) != content_hash:
+                yield chunk
+            elif not indexed:
+                # Already embedded, only missing from the lexical index
+                unindexed.append(chunk)
+                if len(unindexed) >= LEXICAL_BATCH_SIZE:
+                    lexical_index.add_documents(unindexed)
+                    unindexed.clear()
+
+    # Changed chunks are overwritten in place; only vanished ones are deleted
+    on_stored = lexical_index.add_documents if lexical_index is not None else None
+    metrics = embedder.add_documents(db, changed_chunks(), on_stored=on_stored)
+    if unindexed:
+        lexical_index.add_documents(unindexed)
+    stale_ids = [chunk_id for chunk_id in previous_chunks if chunk_id not in current_chunks]
+    if stale_ids:
+        db.delete(ids=stale_ids)
+        if lexical_index is not None:
+            lexical_index.delete(ids=stale_ids)
+
+    files[file_path] = {
+        "hash": digest,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "chunker": chunker.signature,
+        "lexical": lexical_index is not None,
+        "chunks": current_chunks,
+    }
+    print(f"Ingested '{file_path}': {metrics['chunks']} chunks added, {len(stale_ids)} removed "
+          f"({metrics['chunks_per_second']} chunks/s, {metrics['tokens_per_second']} tokens/s).")
+    return metrics["chunks"], len(stale_ids), metrics
+
+
+def list_source_files(data_path):
+    """
+    List the files in a directory that have a registered loader.
+    """
+    if not os.path.isdir(data_path):
+        return []
+    return [
+        os.path.join(data_path, name) for name in os.listdir(data_path)
+        if os.path.splitext(name)[1].lower() in LOADERS
+    ]
+
+
+def split_documents(documents, chunker=None):
+    """
+    Split documents into token-bounded chunks for embedding, one document at a time.
+
+    Args:
+        documents (iterable): Documents to split; may be a generator.
+        chunker (TokenChunker, optional): The chunker to use. Defaults to TokenChunker().
+
+    Yields:
+        Document: The chunks, in document order.
+    """
+    yield from (chunker or TokenChunker()).split_documents(documents)
+
+
+def calculate_chunk_ids(chunks):
+    """
+    Assign stable IDs to document chunks based on their source and text.
+
+    The ID does not depend on the chunk's position, so editing one page does
+    not change the IDs of the chunks after it. Repeated texts within a source
+    are numbered in order.
+
+    Args:
+        chunks (iterable): Chunks in document order; may be a generator.
+
+    Yields:
+        Document: Each chunk, with its "id" metadata set.
+    """
+    occurrences = {}
+
+    for chunk in chunks:
+        source = chunk.metadata.get("source", "unknown")
+        chunk_id = f"{source}:{chunk_hash(chunk.page_content)[:ID_DIGEST_LENGTH]}"
+
+        count = occurrences.get(chunk_id, 0)
+        occurrences[chunk_id] = count + 1
+        chunk.metadata["id"] = chunk_id if count == 0 else f"{chunk_id}:{count}"
+        yield chunk
+
+
+def corpus_fingerprint(manifest_path):
+    """
+    Fingerprint the ingested corpus by the content hashes of all its chunks.
+
+    The fingerprint changes whenever any chunk's text changes, but not when
+    the same content is re-uploaded under another file name.
+    """
+    manifest = load_manifest(manifest_path)
+    chunk_hashes = sorted(
+        content_hash
+        for entry in manifest["files"].values()
+        for content_hash in entry["chunks"].values()
+    )
+    return hashlib.sha256("\n".join(chunk_hashes).encode("utf-8")).hexdigest()
+
+
+def file_hash(file_path):
+    """
+    Compute the SHA-256 of a file without reading it into memory at once.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_hash(text):
+    """
+    Compute the SHA-256 of a chunk's text.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_manifest(manifest_path):
+    """
+    Read the ingestion manifest, or return an empty one.
+    """
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"files": {}}
+
+
+def save_manifest(manifest_path, manifest):
+    """
+    Atomically write the ingestion manifest.
+    """
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+
+def clear_manifest(manifest_path):
+    """
+    Forget every ingested file, e.g. after the collection has been reset.
+    """
+    with _manifest_lock(manifest_path):
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+
+
+def _manifest_lock(manifest_path):
+    """Return the lock serializing ingestion into one manifest."""
+    with _manifest_locks_guard:
+        return _manifest_locks.setdefault(os.path.abspath(manifest_path), threading.Lock())
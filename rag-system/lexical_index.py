@@ -0,0 +1,359 @@
+import glob
+import json
+import math
+import os
+import re
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+import numpy as np
+from langchain.schema.document import Document
+
+# BM25 inverted index of a collection, kept next to its vector store and
+# updated by ingestion with the same chunks. Every chunk's term counts, text
+# and metadata live in SQLite, whose write transactions serialize writers
+# across processes. Searches read a snapshot of the postings built from them:
+# for every term, the rows of the chunks containing it and their precomputed
+# BM25 impact, stored as .npy files that are memory-mapped read-only and
+# shared by worker processes. A query then costs one vectorized pass over the
+# postings of its most selective terms; terms found in a large share of the
+# chunks are skipped like stop words, so a query of generic words finds nothing
+# rather than noise. The snapshot is rebuilt after ingestion and, if a writer
+# changed the chunks since, on the next search.
+
+K1 = 1.2
+B = 0.75
+MAX_QUERY_TERMS = 16
+# Terms in more than this share of the chunks, and in more than COMMON_MIN_CHUNKS, are skipped
+COMMON_FRACTION = 0.1
+COMMON_MIN_CHUNKS = 20
+SNAPSHOT_PARTS = ("offsets", "rows", "impacts", "chunks")
+
+TERM_PATTERN = re.compile(r"[^\W_]+")
+STOP_WORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has have having
+he her here hers herself him himself his how i if in into is it its itself just me more most my myself no
+nor not now of off on once only or other our ours ourselves out over own same she should so some such than
+that the their theirs them themselves then there these they this those through to too under until up very
+was we were what when where which while who whom why will with would you your yours yourself yourselves
+""".split())
+
+
+def tokenize(text):
+    """
+    Split text into index terms: lowercase words and numbers without stop
+    words, with plural endings removed so that "enzymes" matches "enzyme".
+    """
+    return [_stem(word) for word in TERM_PATTERN.findall(text.lower()) if word not in STOP_WORDS]
+
+
+@lru_cache(maxsize=65536)
+def _stem(word):
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+class LexicalIndex:
+    """
+    BM25 index of the chunks of one collection.
+
+    Args:
+        collection_name (str): Name of the collection.
+        persist_directory (str): Directory holding the indexes, each in "lexical/<name>".
+        k1 (float): BM25 term-frequency saturation.
+        b (float): BM25 document-length normalization.
+        max_query_terms (int): Query terms scored, keeping those of highest IDF.
+        common_fraction (float): Share of the chunks from which a term is skipped as common.
+    """
+
+    def __init__(self, collection_name, persist_directory, k1=K1, b=B, max_query_terms=MAX_QUERY_TERMS,
+                 common_fraction=COMMON_FRACTION):
+        self.collection_name = collection_name
+        self.directory = os.path.join(persist_directory, "lexical", collection_name)
+        self.k1 = k1
+        self.b = b
+        self.max_query_terms = max_query_terms
+        self.common_fraction = common_fraction
+        self._db_path = os.path.join(self.directory, "index.sqlite")
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._snapshot_version = None
+        self._snapshot = None
+        self._initialized = False
+
+    def add_documents(self, documents):
+        """
+        Index chunks under their metadata "id", replacing chunks with the same id.
+        """
+        rows = []
+        for document in documents:
+            counts = {}
+            terms = tokenize(document.page_content)
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            rows.append((document.metadata["id"], len(terms), counts, document))
+        if not rows:
+            return
+
+        with self._write() as conn:
+            vocabulary = {term for _, _, counts, _ in rows for term in counts}
+            conn.executemany("INSERT OR IGNORE INTO terms (term) VALUES (?)", [(term,) for term in vocabulary])
+            term_ids = self._term_ids(conn, vocabulary)
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, length, terms, counts, document, metadata) VALUES (?, ?, ?, ?, ?, ?)",
+                [(chunk_id, length,
+                  np.array([term_ids[term] for term in counts], dtype=np.int32).tobytes(),
+                  np.array(list(counts.values()), dtype=np.int32).tobytes(),
+                  document.page_content, json.dumps(document.metadata))
+                 for chunk_id, length, counts, document in rows]
+            )
+            _bump_version(conn)
+
+    def delete(self, ids=None):
+        """
+        Remove chunks by id.
+        """
+        if not ids:
+            return
+        with self._write() as conn:
+            conn.executemany("DELETE FROM chunks WHERE id = ?", [(chunk_id,) for chunk_id in ids])
+            _bump_version(conn)
+
+    def build(self):
+        """
+        Build the postings snapshot if the chunks changed since the last one.
+        """
+        with self._write() as conn:
+            meta = _read_meta(conn)
+            if meta.get("version", 0) != meta.get("built"):
+                self._build(conn, meta)
+
+    def search(self, query, k=4):
+        """
+        Return the k chunks with the highest BM25 score for a query, with their scores.
+        """
+        snapshot = self._mapped()
+        if snapshot is None or k <= 0:
+            return []
+        offsets, rows, impacts, chunks = snapshot
+        total = len(chunks)
+
+        with self._connect() as conn:
+            term_ids = np.array(sorted(self._term_ids(conn, set(tokenize(query))).values()), dtype=np.int64)
+        # Terms added after the snapshot was built have no postings yet
+        term_ids = term_ids[term_ids < len(offsets) - 1]
+        frequencies = offsets[term_ids + 1] - offsets[term_ids]
+        informative = (frequencies > 0) & (frequencies <= self._max_frequency(total))
+        term_ids, frequencies = term_ids[informative], frequencies[informative]
+        if not len(term_ids):
+            return []
+        idf = np.log(1.0 + (total - frequencies + 0.5) / (frequencies + 0.5))
+        # Rare terms carry the ranking; common ones only cost time
+        selected = np.argsort(-idf)[:self.max_query_terms]
+
+        scores = np.zeros(total, dtype=np.float32)
+        for index in selected:
+            start, end = offsets[term_ids[index]], offsets[term_ids[index] + 1]
+            scores[rows[start:end]] += idf[index] * impacts[start:end]
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched])]
+        records = self._records(chunks[matched])
+        return [(records[int(chunk)], float(scores[row])) for row, chunk in zip(matched, chunks[matched])
+                if int(chunk) in records]
+
+    def idf(self, terms):
+        """
+        Return the IDF of each term that the index would score, leaving out unknown and common terms.
+        """
+        snapshot = self._mapped()
+        if snapshot is None:
+            return {}
+        offsets, _, _, chunks = snapshot
+        with self._connect() as conn:
+            term_ids = self._term_ids(conn, set(terms))
+        weights = {}
+        for term, term_id in term_ids.items():
+            if term_id < len(offsets) - 1:
+                frequency = int(offsets[term_id + 1] - offsets[term_id])
+                if 0 < frequency <= self._max_frequency(len(chunks)):
+                    weights[term] = math.log(1.0 + (len(chunks) - frequency + 0.5) / (frequency + 0.5))
+        return weights
+
+    def count(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def reset(self):
+        """
+        Remove every chunk; snapshot files still mapped by other processes stay valid until they remap.
+        """
+        with self._write() as conn:
+            conn.execute("DELETE FROM chunks")
+            _bump_version(conn)
+            self._build(conn, _read_meta(conn))
+
+    def delete_index(self):
+        """
+        Delete the index and its directory.
+        """
+        with self._lock:
+            self._snapshot = self._snapshot_version = None
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self._initialized = False
+
+    def _max_frequency(self, total):
+        """Number of chunks a term may occur in before it counts as common."""
+        return max(self.common_fraction * total, COMMON_MIN_CHUNKS)
+
+    def _build(self, conn, meta):
+        """Write the postings of every chunk, grouped by term, as a new snapshot."""
+        version = meta.get("version", 0)
+        records = conn.execute("SELECT rowid, length, terms, counts FROM chunks ORDER BY rowid").fetchall()
+        vocabulary_size = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM terms").fetchone()[0]
+
+        chunks = np.array([record[0] for record in records], dtype=np.int64)
+        lengths = np.array([record[1] for record in records], dtype=np.float32)
+        term_arrays = [np.frombuffer(record[2], dtype=np.int32) for record in records]
+        terms = np.concatenate(term_arrays) if records else np.zeros(0, dtype=np.int32)
+        counts = (np.concatenate([np.frombuffer(record[3], dtype=np.int32) for record in records]).astype(np.float32)
+                  if records else np.zeros(0, dtype=np.float32))
+        rows = np.repeat(np.arange(len(records), dtype=np.int32), [len(array) for array in term_arrays])
+
+        # BM25 without the IDF, which depends on the query term alone
+        average_length = max(float(lengths.mean()), 1.0) if records else 1.0
+        norms = self.k1 * (1.0 - self.b + self.b * lengths / average_length)
+        impacts = counts * (self.k1 + 1.0) / (counts + norms[rows])
+
+        order = np.argsort(terms, kind="stable")
+        offsets = np.zeros(vocabulary_size + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(terms, minlength=vocabulary_size))
+        prefix = self._snapshot_prefix(version)
+        for part, array in zip(SNAPSHOT_PARTS, (offsets, rows[order], impacts[order].astype(np.float32), chunks)):
+            tmp_path = f"{prefix}-{part}.tmp.npy"
+            np.save(tmp_path, array)
+            os.replace(tmp_path, f"{prefix}-{part}.npy")
+
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('built', ?)", (json.dumps(version),))
+        self._remove_snapshots(keep=version)
+        print(f"Built the lexical index of '{self.collection_name}': {len(records)} chunks, {len(terms)} postings.")
+
+    def _mapped(self):
+        """Return the memory-mapped snapshot, building it first if the chunks changed since."""
+        with self._connect() as conn:
+            meta = _read_meta(conn)
+        if meta.get("version", 0) != meta.get("built"):
+            self.build()
+            with self._connect() as conn:
+                meta = _read_meta(conn)
+        version = meta.get("built")
+        with self._lock:
+            if version != self._snapshot_version:
+                prefix = self._snapshot_prefix(version)
+                # Plain array views of the maps: no copy, and no memmap overhead on slicing
+                self._snapshot = tuple(np.load(f"{prefix}-{part}.npy", mmap_mode="r").view(np.ndarray)
+                                       for part in SNAPSHOT_PARTS)
+                self._snapshot_version = version
+            if not len(self._snapshot[3]):
+                return None
+            return self._snapshot
+
+    def _records(self, chunks):
+        """Fetch the chunks with the given rowids as Documents, keyed by rowid."""
+        records = {}
+        chunks = [int(chunk) for chunk in chunks]
+        with self._connect() as conn:
+            for start in range(0, len(chunks), 500):
+                batch = chunks[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for rowid, chunk_id, document, metadata in conn.execute(
+                        f"SELECT rowid, id, document, metadata FROM chunks WHERE rowid IN ({placeholders})", batch):
+                    records[rowid] = Document(page_content=document, metadata=json.loads(metadata), id=chunk_id)
+        return records
+
+    def _term_ids(self, conn, terms):
+        """Map the known terms among `terms` to their ids."""
+        term_ids = {}
+        terms = list(terms)
+        for start in range(0, len(terms), 500):
+            batch = terms[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            term_ids.update(conn.execute(f"SELECT term, id FROM terms WHERE term IN ({placeholders})", batch))
+        return term_ids
+
+    def _remove_snapshots(self, keep):
+        """Delete snapshot files other than those of version `keep`."""
+        current = {f"{self._snapshot_prefix(keep)}-{part}.npy" for part in SNAPSHOT_PARTS}
+        for path in glob.glob(os.path.join(self.directory, "postings-*.npy")):
+            if path not in current:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _snapshot_prefix(self, version):
+        return os.path.join(self.directory, f"postings-{version}")
+
+    @contextmanager
+    def _write(self):
+        """Hold the index's write lock, shared by all processes, inside one transaction."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    @contextmanager
+    def _connect(self):
+        """Use this thread's connection to the index, creating the tables on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(self.directory, exist_ok=True)
+            conn = self._local.conn = sqlite3.connect(self._db_path, timeout=30, isolation_level=None)
+        if not self._initialized:
+            conn.executescript(
+                """PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS terms (
+                    id INTEGER PRIMARY KEY,
+                    term TEXT NOT NULL UNIQUE
+                );
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id TEXT PRIMARY KEY,
+                    length INTEGER NOT NULL,
+                    terms BLOB NOT NULL,
+                    counts BLOB NOT NULL,
+                    document TEXT NOT NULL,
+                    metadata TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );"""
+            )
+            self._initialized = True
+        yield conn
+
+
+def _read_meta(conn):
+    return {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM meta")}
+
+
+def _bump_version(conn):
+    """Mark the chunks as changed since the last snapshot."""
+    conn.execute("INSERT INTO meta (key, value) VALUES ('version', '1') "
+                 "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1")
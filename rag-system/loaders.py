@@ -0,0 +1,150 @@
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from docx import Document as DocxDocument
+from pypdf import PdfReader
+from langchain.schema.document import Document
+from chunker import is_anchor
+from pdf_extraction import extract_pages
+from transcripts import TRANSCRIPT_EXTENSION, load_transcript
+
+# Streaming document loaders. Each loader is a generator that yields one
+# Document per page (PDF) or per block of paragraphs or captions (DOCX, TXT,
+# YouTube transcripts), so a file is
+# never held in memory as a whole and downstream splitting and embedding start
+# with the first page. Large PDFs have their pages extracted in a process pool,
+# with a bounded window of page ranges in flight. The pool's processes are
+# spawned rather than forked from the multithreaded server, and are started
+# once and reused, as a spawned process takes a while to start.
+
+PDF_WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1))
+PDF_PARALLEL_MIN_PAGES = 64
+PDF_PAGES_PER_TASK = 16
+BLOCK_SIZE = 4000
+BLOCK_ANCHOR_DIVISOR = 8
+
+_pool_lock = threading.Lock()
+_pool = {"executor": None}
+
+
+def load_pdf(file_path, workers=PDF_WORKERS):
+    """
+    Yield the pages of a PDF in order, extracting large files in parallel.
+
+    Args:
+        file_path (str): Path of the PDF.
+        workers (int): Extraction processes for PDFs of at least PDF_PARALLEL_MIN_PAGES pages.
+
+    Yields:
+        Document: One document per page, with "source" and 0-based "page" metadata.
+    """
+    reader = PdfReader(file_path)
+    page_count = len(reader.pages)
+
+    if workers > 1 and page_count >= PDF_PARALLEL_MIN_PAGES:
+        ranges = [(start, min(start + PDF_PAGES_PER_TASK, page_count))
+                  for start in range(0, page_count, PDF_PAGES_PER_TASK)]
+        texts = _extract_parallel(file_path, ranges, workers)
+    else:
+        texts = (page.extract_text() or "" for page in reader.pages)
+
+    for page, text in enumerate(texts):
+        yield Document(page_content=text, metadata={"source": file_path, "page": page})
+
+
+def load_docx(file_path, block_size=BLOCK_SIZE):
+    """
+    Yield the paragraphs of a Word document in blocks of about `block_size` characters.
+
+    Yields:
+        Document: One document per block, numbered in the "page" metadata.
+    """
+    paragraphs = (paragraph.text for paragraph in DocxDocument(file_path).paragraphs)
+    yield from _blocks(file_path, paragraphs, block_size)
+
+
+def load_text(file_path, block_size=BLOCK_SIZE):
+    """
+    Yield a UTF-8 text file in blocks of about `block_size` characters, split at line ends.
+
+    Yields:
+        Document: One document per block, numbered in the "page" metadata.
+    """
+    with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+        yield from _blocks(file_path, (line.rstrip("\n") for line in f), block_size)
+
+
+LOADERS = {
+    ".pdf": load_pdf,
+    ".docx": load_docx,
+    ".txt": load_text,
+    TRANSCRIPT_EXTENSION: load_transcript,
+}
+
+
+def load_documents(file_path):
+    """
+    Stream the documents of a file with the loader registered for its extension.
+    """
+    return LOADERS[os.path.splitext(file_path)[1].lower()](file_path)
+
+
+def close_pdf_workers():
+    """
+    Stop the PDF extraction processes, if they were started.
+    """
+    with _pool_lock:
+        executor = _pool["executor"]
+        _pool["executor"] = None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _extraction_pool(workers):
+    """Return the shared extraction pool, started with the spawn method on first use."""
+    with _pool_lock:
+        if _pool["executor"] is None:
+            _pool["executor"] = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool["executor"]
+
+
+def _extract_parallel(file_path, ranges, workers):
+    """Extract page ranges in the process pool, yielding page texts in order."""
+    executor = _extraction_pool(workers)
+    pending = deque()
+    remaining = iter(ranges)
+    try:
+        for start, stop in remaining:
+            pending.append(executor.submit(extract_pages, file_path, start, stop))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            texts = pending.popleft().result()
+            next_range = next(remaining, None)
+            if next_range is not None:
+                pending.append(executor.submit(extract_pages, file_path, *next_range))
+            yield from texts
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _blocks(file_path, lines, block_size):
+    """
+    Group lines into documents of about `block_size` characters.
+
+    Past half the block size, a block ends at a blank line or an anchor line
+    (at the latest at twice the size), so an edit only moves the block
+    boundaries next to it.
+    """
+    block, size, page = [], 0, 0
+    for line in lines:
+        block.append(line)
+        size += len(line) + 1
+        if size >= 2 * block_size or (size >= block_size // 2 and is_anchor(line.strip(), BLOCK_ANCHOR_DIVISOR)):
+            yield Document(page_content="\n".join(block), metadata={"source": file_path, "page": page})
+            block, size, page = [], 0, page + 1
+    if any(line.strip() for line in block):
+        yield Document(page_content="\n".join(block), metadata={"source": file_path, "page": page})
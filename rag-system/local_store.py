@@ -0,0 +1,464 @@
+import glob
+import json
+import math
+import os
+import shutil
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+import numpy as np
+from langchain.schema.document import Document
+from langchain_core.vectorstores import VectorStore
+from langchain_core.vectorstores.utils import maximal_marginal_relevance
+
+# Local vector store on memory-mapped files. Normalized embeddings are appended
+# to a float32 matrix, or to an int8 matrix with one scale per row; ids, texts
+# and metadata live in SQLite, whose write transactions also serialize writers
+# across processes. Vectors are only ever read through read-only memory maps,
+# so worker processes share one copy in the page cache and opening a
+# collection reads nothing but its metadata. Collections of IVF_MIN_ROWS or
+# more get an inverted-file (IVF) index: rows are grouped by their nearest
+# k-means centroid and a query scans only the lists of its `nprobe` nearest
+# centroids, plus the rows added since the index was built. Deleted rows stay
+# in the matrix until enough of them pile up to rewrite it.
+
+FLOAT32 = "float32"
+INT8 = "int8"
+IVF_MIN_ROWS = 20000
+IVF_REBUILD_FRACTION = 0.2
+DEFAULT_NPROBE = 12
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64
+COMPACT_MIN_DEAD = 1024
+COMPACT_FRACTION = 0.5
+SCAN_BLOCK_ROWS = 65536
+
+
+class LocalVectorStore(VectorStore):
+    """
+    Vector store of one collection in a directory of memory-mapped files.
+
+    Scores are cosine distances: 0 for identical directions, lower is closer.
+
+    Args:
+        collection_name (str): Name of the collection.
+        persist_directory (str): Directory holding the collections, each in "local/<name>".
+        embedding_function (Embeddings): Embeds texts and queries.
+        dtype (str): "float32", or "int8" for a quarter of the size at a small loss of precision.
+            Ignored for an existing collection, which keeps its type.
+        nlist (int, optional): IVF lists. Defaults to the square root of the number of rows.
+        nprobe (int): IVF lists scanned per query.
+        ivf_min_rows (int): Rows from which the collection is indexed; smaller ones are scanned in full.
+    """
+
+    def __init__(self, collection_name, persist_directory, embedding_function, dtype=FLOAT32,
+                 nlist=None, nprobe=DEFAULT_NPROBE, ivf_min_rows=IVF_MIN_ROWS):
+        if dtype not in (FLOAT32, INT8):
+            raise ValueError(f"Unsupported vector type '{dtype}'. Use '{FLOAT32}' or '{INT8}'.")
+        self.collection_name = collection_name
+        self.directory = os.path.join(persist_directory, "local", collection_name)
+        self.dtype = dtype
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.ivf_min_rows = ivf_min_rows
+        self._embedding_function = embedding_function
+        self._db_path = os.path.join(self.directory, "records.sqlite")
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._mapped_version = None
+        self._mapping = None
+        self._initialized = False
+
+    @property
+    def embeddings(self):
+        return self._embedding_function
+
+    @property
+    def name(self):
+        return self.collection_name
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, collection_name="langchain",
+                   persist_directory=".", **kwargs):
+        store = cls(collection_name, persist_directory, embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        """
+        Embed texts and store them.
+
+        Returns:
+            list: The ids of the stored texts.
+        """
+        texts = list(texts)
+        ids = list(ids) if ids else [uuid.uuid4().hex for _ in texts]
+        metadatas = list(metadatas) if metadatas else [{} for _ in texts]
+        self.upsert_embeddings(ids, self.embeddings.embed_documents(texts), texts, metadatas)
+        return ids
+
+    def upsert_embeddings(self, ids, embeddings, documents, metadatas):
+        """
+        Store precomputed embeddings, replacing entries with the same ids.
+        """
+        if not ids:
+            return
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+
+        with self._write() as conn:
+            meta = _read_meta(conn)
+            if "dim" not in meta:
+                meta.setdefault("generation", 0)
+                meta.update({"dim": vectors.shape[1], "dtype": self.dtype, "rows": 0})
+            elif vectors.shape[1] != meta["dim"]:
+                raise ValueError(f"Expected {meta['dim']}-dimensional vectors, got {vectors.shape[1]}.")
+
+            # Rows past the committed count were left by an interrupted write
+            start = meta["rows"]
+            self._append(meta, start, vectors)
+            conn.executemany(
+                "INSERT OR REPLACE INTO records (id, row, document, metadata) VALUES (?, ?, ?, ?)",
+                [(chunk_id, start + i, document, json.dumps(metadata))
+                 for i, (chunk_id, document, metadata) in enumerate(zip(ids, documents, metadatas))]
+            )
+            meta["rows"] = start + len(ids)
+
+            if meta["rows"] >= self.ivf_min_rows and (
+                    meta["rows"] - meta.get("indexed_rows", 0) > IVF_REBUILD_FRACTION * meta.get("indexed_rows", 0)):
+                self._build_index(meta)
+            _write_meta(conn, meta)
+
+    def delete(self, ids=None, **kwargs):
+        """
+        Delete entries by id, rewriting the matrix once most of its rows are deleted.
+        """
+        if not ids:
+            return
+        with self._write() as conn:
+            conn.executemany("DELETE FROM records WHERE id = ?", [(chunk_id,) for chunk_id in ids])
+            meta = _read_meta(conn)
+            dead = meta.get("rows", 0) - conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+            if dead >= COMPACT_MIN_DEAD and dead >= COMPACT_FRACTION * meta["rows"]:
+                self._compact(conn, meta)
+                _write_meta(conn, meta)
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [document for document, _ in self.similarity_search_with_score(query, k=k)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        """
+        Return the k entries closest to a query with their cosine distances.
+        """
+        query_vector = _normalize(np.asarray([self.embeddings.embed_query(query)], dtype=np.float32))[0]
+        return [(document, 1.0 - score) for document, score, _ in self._search(self._mapped(), query_vector, k)]
+
+    def max_marginal_relevance_search(self, query, k=4, fetch_k=20, lambda_mult=0.5, **kwargs):
+        """
+        Pick k relevant yet diverse entries among the fetch_k closest to a query.
+        """
+        query_vector = _normalize(np.asarray([self.embeddings.embed_query(query)], dtype=np.float32))[0]
+        mapping = self._mapped()
+        candidates = self._search(mapping, query_vector, fetch_k)
+        if not candidates:
+            return []
+        vectors = _dequantize(mapping, np.array([row for _, _, row in candidates]))
+        selected = maximal_marginal_relevance(query_vector, vectors, lambda_mult=lambda_mult, k=k)
+        return [candidates[index][0] for index in selected]
+
+    def get_documents(self):
+        """
+        Return the (id, text) pair of every entry.
+        """
+        with self._connect() as conn:
+            return conn.execute("SELECT id, document FROM records ORDER BY row").fetchall()
+
+    def get_vectors(self):
+        """
+        Return the ids, texts and normalized embeddings (one row per entry) of every entry.
+        """
+        with self._connect() as conn:
+            records = conn.execute("SELECT id, row, document FROM records ORDER BY row").fetchall()
+        mapping = self._mapped()
+        if mapping is None or not records:
+            return [], [], np.zeros((0, 0), dtype=np.float32)
+        # Rows written after the mapping was read are not in it yet
+        records = [record for record in records if record[1] < mapping["rows"]]
+        vectors = _dequantize(mapping, np.array([row for _, row, _ in records], dtype=np.int64))
+        return [chunk_id for chunk_id, _, _ in records], [document for _, _, document in records], vectors
+
+    def count(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def reset_collection(self):
+        """
+        Delete every entry; files still mapped by other processes stay valid until they remap.
+        """
+        with self._write() as conn:
+            meta = _read_meta(conn)
+            conn.execute("DELETE FROM records")
+            _write_meta(conn, {"generation": meta.get("generation", -1) + 1})
+            self._remove_files(keep_generation=None)
+
+    def delete_collection(self):
+        """
+        Delete the collection and its directory.
+        """
+        with self._lock:
+            self._mapping = self._mapped_version = None
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self._initialized = False
+
+    def _search(self, mapping, query_vector, k):
+        """Return (document, similarity, row) of the k entries of a mapping most similar to a query."""
+        if mapping is None or k <= 0:
+            return []
+
+        rows = self._candidate_rows(mapping, query_vector)
+        scores = _scores(mapping, rows, query_vector)
+        total = len(scores)
+
+        # Deleted rows are skipped, so look further until k live entries are found
+        wanted = min(total, max(2 * k, k + 16))
+        while True:
+            top = np.argpartition(-scores, wanted - 1)[:wanted] if wanted < total else np.arange(total)
+            top = top[np.argsort(-scores[top])]
+            top_rows = rows[top] if rows is not None else top
+            records = self._records(top_rows)
+            results = [(records[row], float(scores[index]), int(row))
+                       for index, row in zip(top, top_rows) if row in records]
+            if len(results) >= k or wanted >= total:
+                return results[:k]
+            wanted = min(total, wanted * 4)
+
+    def _candidate_rows(self, mapping, query_vector):
+        """Rows in the probed IVF lists and the unindexed tail, or None to scan every row."""
+        if mapping["ivf"] is None:
+            return None
+        centroids, offsets, lists = mapping["ivf"]
+        nprobe = min(self.nprobe, len(centroids))
+        probed = np.argpartition(-(centroids @ query_vector), nprobe - 1)[:nprobe]
+        parts = [lists[offsets[i]:offsets[i + 1]] for i in probed]
+        parts.append(np.arange(mapping["indexed_rows"], mapping["rows"], dtype=lists.dtype))
+        return np.sort(np.concatenate(parts))
+
+    def _records(self, rows):
+        """Fetch the live records of matrix rows as Documents, keyed by row."""
+        records = {}
+        rows = [int(row) for row in rows]
+        with self._connect() as conn:
+            for start in range(0, len(rows), 500):
+                batch = rows[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for row, chunk_id, document, metadata in conn.execute(
+                        f"SELECT row, id, document, metadata FROM records WHERE row IN ({placeholders})", batch):
+                    records[row] = Document(page_content=document, metadata=json.loads(metadata), id=chunk_id)
+        return records
+
+    def _mapped(self):
+        """Return the memory-mapped matrix and index, remapping after another writer changed them."""
+        with self._connect() as conn:
+            meta = _read_meta(conn)
+        version = (meta.get("generation"), meta.get("rows"), meta.get("index_version"))
+        with self._lock:
+            if version != self._mapped_version:
+                self._mapping = self._map(meta)
+                self._mapped_version = version
+            return self._mapping
+
+    def _map(self, meta, with_index=True):
+        if not meta.get("rows"):
+            return None
+        rows, dim, generation = meta["rows"], meta["dim"], meta["generation"]
+        dtype = np.int8 if meta["dtype"] == INT8 else np.float32
+        # Plain array views of the maps: no copy, and no memmap overhead on indexing
+        mapping = {
+            "rows": rows,
+            "vectors": np.memmap(self._vectors_path(generation, meta["dtype"]), dtype=dtype, mode="r",
+                                 shape=(rows, dim)).view(np.ndarray),
+            "scales": None,
+            "ivf": None,
+            "indexed_rows": meta.get("indexed_rows", 0),
+        }
+        if meta["dtype"] == INT8:
+            mapping["scales"] = np.memmap(self._scales_path(generation), dtype=np.float32, mode="r",
+                                          shape=(rows,)).view(np.ndarray)
+        if with_index and "index_version" in meta:
+            prefix = self._index_prefix(generation, meta["index_version"])
+            mapping["ivf"] = tuple(np.load(f"{prefix}-{part}.npy", mmap_mode="r").view(np.ndarray)
+                                   for part in ("centroids", "offsets", "lists"))
+        return mapping
+
+    def _append(self, meta, start, vectors):
+        """Write vectors at row `start`, cutting off rows of an interrupted write."""
+        generation = meta["generation"]
+        if meta["dtype"] == INT8:
+            scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127
+            _write_rows(self._scales_path(generation), start, scales.astype(np.float32))
+            vectors = np.round(vectors / scales[:, None]).astype(np.int8)
+        _write_rows(self._vectors_path(generation, meta["dtype"]), start, vectors)
+
+    def _build_index(self, meta):
+        """Cluster every row with spherical k-means and write the IVF lists."""
+        rows = meta["rows"]
+        mapping = self._map(meta, with_index=False)
+        nlist = self.nlist or max(1, int(math.sqrt(rows)))
+        rng = np.random.default_rng(0)
+
+        sample_rows = np.sort(rng.choice(rows, size=min(rows, nlist * KMEANS_SAMPLE_PER_LIST), replace=False))
+        sample = _dequantize(mapping, sample_rows)
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+        for _ in range(KMEANS_ITERATIONS):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            empty = np.bincount(labels, minlength=nlist) == 0
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            centroids = _normalize(sums)
+
+        labels = np.concatenate([
+            np.argmax(_dequantize(mapping, np.arange(start, min(start + SCAN_BLOCK_ROWS, rows))) @ centroids.T, axis=1)
+            for start in range(0, rows, SCAN_BLOCK_ROWS)
+        ])
+        lists = np.argsort(labels, kind="stable").astype(np.int64)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=nlist))]).astype(np.int64)
+
+        version = meta.get("index_version", -1) + 1
+        prefix = self._index_prefix(meta["generation"], version)
+        for part, array in (("centroids", centroids.astype(np.float32)), ("offsets", offsets), ("lists", lists)):
+            tmp_path = f"{prefix}-{part}.tmp.npy"
+            np.save(tmp_path, array)
+            os.replace(tmp_path, f"{prefix}-{part}.npy")
+        meta.update({"index_version": version, "indexed_rows": rows, "nlist": nlist})
+        self._remove_files(keep_generation=meta["generation"], keep_index=version)
+        print(f"Indexed {rows} vectors of '{self.collection_name}' in {nlist} lists.")
+
+    def _compact(self, conn, meta):
+        """Copy the live rows into a new generation of files and renumber them."""
+        old = self._map(meta, with_index=False)
+        live = [row for (row,) in conn.execute("SELECT row FROM records ORDER BY row")]
+        generation = meta["generation"] + 1
+        new_meta = {"dim": meta["dim"], "dtype": meta["dtype"], "generation": generation, "rows": 0}
+
+        for start in range(0, len(live), SCAN_BLOCK_ROWS):
+            block = np.array(live[start:start + SCAN_BLOCK_ROWS])
+            _write_rows(self._vectors_path(generation, meta["dtype"]), start, np.asarray(old["vectors"][block]))
+            if meta["dtype"] == INT8:
+                _write_rows(self._scales_path(generation), start, np.asarray(old["scales"][block]))
+        # Rows move down in order, so each new row number is already free
+        conn.executemany("UPDATE records SET row = ? WHERE row = ?", list(enumerate(live)))
+        new_meta["rows"] = len(live)
+        meta.clear()
+        meta.update(new_meta)
+        if meta["rows"] >= self.ivf_min_rows:
+            self._build_index(meta)
+        self._remove_files(keep_generation=generation, keep_index=meta.get("index_version"))
+        print(f"Compacted '{self.collection_name}' to {len(live)} rows.")
+
+    def _remove_files(self, keep_generation, keep_index=None):
+        """Delete matrix and index files that are no longer current."""
+        current = set()
+        if keep_generation is not None:
+            current = {self._vectors_path(keep_generation, dtype) for dtype in (FLOAT32, INT8)}
+            current.add(self._scales_path(keep_generation))
+            if keep_index is not None:
+                prefix = self._index_prefix(keep_generation, keep_index)
+                current.update(f"{prefix}-{part}.npy" for part in ("centroids", "offsets", "lists"))
+        for path in glob.glob(os.path.join(self.directory, "*.*")):
+            if path != self._db_path and not path.startswith(self._db_path) and path not in current:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _vectors_path(self, generation, dtype):
+        return os.path.join(self.directory, f"vectors-{generation}.{'i8' if dtype == INT8 else 'f32'}")
+
+    def _scales_path(self, generation):
+        return os.path.join(self.directory, f"scales-{generation}.f32")
+
+    def _index_prefix(self, generation, version):
+        return os.path.join(self.directory, f"ivf-{generation}-{version}")
+
+    @contextmanager
+    def _write(self):
+        """Hold the collection's write lock, shared by all processes, inside one transaction."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    @contextmanager
+    def _connect(self):
+        """Use this thread's connection to the collection's records, creating the tables on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(self.directory, exist_ok=True)
+            conn = self._local.conn = sqlite3.connect(self._db_path, timeout=30, isolation_level=None)
+        if not self._initialized:
+            conn.executescript(
+                """PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS records (
+                    id TEXT PRIMARY KEY,
+                    row INTEGER NOT NULL UNIQUE,
+                    document TEXT NOT NULL,
+                    metadata TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );"""
+            )
+            self._initialized = True
+        yield conn
+
+
+def _read_meta(conn):
+    return {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM meta")}
+
+
+def _write_meta(conn, meta):
+    conn.execute("DELETE FROM meta")
+    conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)",
+                     [(key, json.dumps(value)) for key, value in meta.items()])
+
+
+def _write_rows(path, start, array):
+    """Write rows at row `start` of a matrix file, truncating anything after it first."""
+    row_bytes = array.itemsize * (array.shape[1] if array.ndim > 1 else 1)
+    with open(path, "ab") as f:
+        f.truncate(start * row_bytes)
+        f.write(np.ascontiguousarray(array).tobytes())
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _dequantize(mapping, rows):
+    """Read rows of the matrix as float32 vectors."""
+    vectors = np.asarray(mapping["vectors"][rows], dtype=np.float32)
+    if mapping["scales"] is not None:
+        vectors *= np.asarray(mapping["scales"][rows])[:, None]
+    return vectors
+
+
+def _scores(mapping, rows, query_vector):
+    """Cosine similarity of the query to the given rows, or to every row if rows is None."""
+    if rows is not None:
+        return _dequantize(mapping, rows) @ query_vector
+    total = mapping["rows"]
+    return np.concatenate([
+        _dequantize(mapping, slice(start, min(start + SCAN_BLOCK_ROWS, total))) @ query_vector
+        for start in range(0, total, SCAN_BLOCK_ROWS)
+    ])
@@ -0,0 +1,186 @@
+import threading
+import time
+from collections import Counter
+
+# Model routing. Every LLM stage of quiz generation (the dynamic prompt, the
+# corpus summary, the questions) has its own route: an ordered chain of
+# model profiles, each a model name with its Ollama options (temperature,
+# num_ctx, num_predict, keep_alive). A call goes to the first profile of its
+# chain; when a call fails (the model is not pulled, the server errors), the
+# profile is skipped for a cool-down and the next one in the chain serves the
+# call. A speculative route starts question batches on its first, smallest
+# model and moves one profile down the chain for every retry, so only the
+# questions the small model got wrong (rejected by the validator) are
+# written by the larger one; a retry never falls back to a model before its
+# position. Difficulties listed as "large_only" leave out the first profile,
+# so difficult questions are always written by the large model, even while
+# it fails.
+
+STAGES = ("dynamic_prompt", "summary", "questions")
+PROFILE_OPTIONS = ("temperature", "num_ctx", "num_predict", "keep_alive")
+DEFAULT_COOLDOWN = 60
+
+
+class ModelProfile:
+    """A model and the Ollama options it is called with."""
+
+    def __init__(self, model, **options):
+        unknown = set(options) - set(PROFILE_OPTIONS)
+        if unknown:
+            raise ValueError(f"Unknown model options for '{model}': {', '.join(sorted(unknown))}")
+        self.model = model
+        self.options = {name: value for name, value in options.items() if value is not None}
+
+    def signature(self):
+        """Return a hashable description of the profile, for cache keys."""
+        return (self.model, tuple(sorted(self.options.items())))
+
+
+class ModelRouter:
+    """
+    Route the calls of each stage to a chain of model profiles.
+
+    Args:
+        routes (dict): Route of each stage: {"models": [{"model": ..., **options}, ...],
+            "speculative": bool, "large_only": [difficulty, ...]}.
+        get_llm (callable): Returns the shared client of a model, as get_llm(model, **options).
+        default (dict): Profile of stages without a route.
+        cooldown (float): Seconds a profile whose call failed is skipped.
+    """
+
+    def __init__(self, routes, get_llm, default, cooldown=DEFAULT_COOLDOWN):
+        self.get_llm = get_llm
+        self.cooldown = cooldown
+        self.routes = {}
+        for stage in set(STAGES) | set(routes):
+            route = routes.get(stage) or {"models": [default]}
+            profiles = [ModelProfile(**profile) for profile in route["models"]]
+            if not profiles:
+                raise ValueError(f"The route of stage '{stage}' has no models.")
+            self.routes[stage] = {
+                "profiles": profiles,
+                "speculative": bool(route.get("speculative")),
+                "large_only": set(route.get("large_only", ())),
+            }
+        self._down_until = {}
+        self._calls = Counter()
+        self._failures = Counter()
+        self._escalations = Counter()
+        self._lock = threading.Lock()
+
+    def llm(self, stage, difficulty=None, attempt=0):
+        """
+        Return a client for one call of a stage.
+
+        Args:
+            stage (str): The stage.
+            difficulty (str, optional): The difficulty of the questions asked for.
+            attempt (int): The retry number of a question batch, counted from 0;
+                a speculative route moves one profile down its chain per retry.
+
+        Returns:
+            RoutedLLM: A client with invoke and stream that falls back along the
+                rest of the chain; a speculative route never goes back to the
+                profiles before the one selected.
+        """
+        route = self.routes[stage]
+        profiles = route["profiles"]
+        if not route["speculative"]:
+            return RoutedLLM(self, stage, profiles)
+        base = 1 if difficulty in route["large_only"] and len(profiles) > 1 else 0
+        start = min(base + attempt, len(profiles) - 1)
+        if start > base:
+            with self._lock:
+                self._escalations[stage] += 1
+        return RoutedLLM(self, stage, profiles[start:])
+
+    def signature(self, stage):
+        """Return a hashable description of a stage's chain, for cache keys."""
+        return tuple(profile.signature() for profile in self.routes[stage]["profiles"])
+
+    def summary(self):
+        """Return a one-line report of the calls, failures and escalations of each stage."""
+        with self._lock:
+            parts = []
+            for stage in STAGES:
+                calls = [f"{model} {count} calls" for (call_stage, model), count in sorted(self._calls.items())
+                         if call_stage == stage]
+                if not calls:
+                    continue
+                text = f"{stage}: {', '.join(calls)}"
+                failures = sum(count for (call_stage, _), count in self._failures.items() if call_stage == stage)
+                if failures:
+                    text += f", {failures} failed"
+                if self._escalations[stage]:
+                    text += f", {self._escalations[stage]} escalated"
+                parts.append(text)
+            return "; ".join(parts) or "no calls"
+
+    def _available(self, profiles):
+        # Profiles in their cool-down go last, so a chain that is all down is still tried
+        now = time.monotonic()
+        with self._lock:
+            up = [profile for profile in profiles if self._down_until.get(profile.signature(), 0) <= now]
+        return up + [profile for profile in profiles if profile not in up]
+
+    def _record(self, stage, profile, error=None):
+        with self._lock:
+            self._calls[(stage, profile.model)] += 1
+            if error is not None:
+                self._failures[(stage, profile.model)] += 1
+                self._down_until[profile.signature()] = time.monotonic() + self.cooldown
+
+
+class RoutedLLM:
+    """
+    A client for one routed call; tries the profiles of its chain in order.
+
+    `model` is the first model of the chain, which cache keys name.
+    """
+
+    def __init__(self, router, stage, profiles):
+        self.router = router
+        self.stage = stage
+        self.profiles = profiles
+        self.model = profiles[0].model
+
+    def invoke(self, prompt, **kwargs):
+        error = None
+        for profile in self.router._available(self.profiles):
+            try:
+                result = self.router.get_llm(profile.model, **profile.options).invoke(prompt, **kwargs)
+            except Exception as e:
+                print(f"Model '{profile.model}' failed for {self.stage}: {str(e)}")
+                self.router._record(self.stage, profile, error=e)
+                error = e
+                continue
+            self.router._record(self.stage, profile)
+            return result
+        raise error
+
+    def stream(self, prompt, **kwargs):
+        """
+        Stream a response, falling back to the next profile if a call fails
+        before its first chunk; a failure later in the stream is raised.
+        """
+        error = None
+        for profile in self.router._available(self.profiles):
+            started = False
+            try:
+                for chunk in self.router.get_llm(profile.model, **profile.options).stream(prompt, **kwargs):
+                    if not started:
+                        # Counted at the first chunk, as callers may stop reading early
+                        started = True
+                        self.router._record(self.stage, profile)
+                    yield chunk
+            except Exception as e:
+                if started:
+                    raise
+                print(f"Model '{profile.model}' failed for {self.stage}: {str(e)}")
+                self.router._record(self.stage, profile, error=e)
+                error = e
+                continue
+            if not started:
+                self.router._record(self.stage, profile)
+            return
+        raise error
@@ -0,0 +1,25 @@
+import os
+from pypdf import PdfReader
+
+# Page extraction run in the PDF loader's worker processes. The workers are
+# spawned, not forked, so this module only imports pypdf: a worker loads it
+# without the app, its clients or their threads. Each worker keeps the reader
+# of the file it extracted last, reused across that file's page ranges and
+# opened again when the file changes.
+
+_reader = {"key": None, "reader": None}
+
+
+def extract_pages(file_path, start, stop):
+    """
+    Extract the text of pages [start, stop) of a PDF.
+
+    Returns:
+        list: The text of each page, empty for pages without text.
+    """
+    status = os.stat(file_path)
+    key = (file_path, status.st_mtime_ns, status.st_size)
+    if _reader["key"] != key:
+        _reader.update(key=key, reader=PdfReader(file_path))
+    reader = _reader["reader"]
+    return [reader.pages[index].extract_text() or "" for index in range(start, stop)]
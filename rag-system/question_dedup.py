@@ -0,0 +1,325 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+import numpy as np
+
+# Near-duplicate questions. Each generated question is embedded and compared
+# with the questions already accepted for the quiz and those issued for the
+# same corpus by earlier quizzes; one whose cosine similarity with any of them
+# reaches the threshold is rejected, so that only it is generated again.
+# Lookups are kept sub-linear with random-hyperplane LSH: the signs of a
+# vector's projections on fixed random hyperplanes form bands of bits, and
+# only questions sharing at least one band with the new one are compared, in
+# one vectorized product. Embeddings of one model share a common direction
+# that would put most questions in the same buckets, so vectors are hashed
+# relative to a center, the mean chunk embedding of the corpus, which is fixed
+# for the corpus by its first quiz. The issued questions of each corpus are
+# stored in SQLite with their band keys indexed, so the history is searched
+# the same way without being loaded.
+
+DUPLICATE_SIMILARITY = 0.9
+DUPLICATE_PROBLEM = "repeats an earlier question"
+LSH_BANDS = 40
+LSH_BITS = 12
+HISTORY_MAX_PER_CORPUS = 5000
+HISTORY_TTL = 180 * 24 * 60 * 60
+
+
+@lru_cache(maxsize=None)
+def _hyperplanes(dim, bands, bits):
+    # A fixed seed, so that the keys stored in the history stay comparable
+    return np.random.default_rng(0).standard_normal((dim, bands * bits)).astype(np.float32)
+
+
+def lsh_keys(vectors, center=None, bands=LSH_BANDS, bits=LSH_BITS):
+    """
+    Compute the band keys of unit vectors.
+
+    Args:
+        vectors (np.ndarray): One vector per row.
+        center (np.ndarray, optional): Point the vectors are hashed relative to.
+        bands (int): Bands per vector; two vectors are compared if any band matches.
+        bits (int): Hyperplanes per band.
+
+    Returns:
+        np.ndarray: The key of each band, one row per vector, encoded with the band number so that keys are unique.
+    """
+    vectors = np.atleast_2d(vectors)
+    if center is not None:
+        vectors = vectors - center
+    signs = (vectors @ _hyperplanes(vectors.shape[1], bands, bits)) > 0
+    keys = signs.reshape(len(vectors), bands, bits).astype(np.int64) @ (1 << np.arange(bits, dtype=np.int64))
+    return keys + (np.arange(bands, dtype=np.int64) << bits)
+
+
+class DuplicateIndex:
+    """
+    In-memory near-duplicate index of unit vectors with their texts.
+
+    Args:
+        threshold (float): Minimum cosine similarity of a duplicate.
+    """
+
+    def __init__(self, threshold=DUPLICATE_SIMILARITY):
+        self.threshold = threshold
+        self.texts = []
+        self._vectors = None
+        self._buckets = {}
+
+    def find(self, vector, keys):
+        """
+        Return the text of the most similar indexed vector at or above the threshold, or None.
+        """
+        candidates = sorted({row for key in keys.tolist() for row in self._buckets.get(key, ())})
+        if not candidates:
+            return None
+        similarities = self._vectors[candidates] @ vector
+        best = int(np.argmax(similarities))
+        return self.texts[candidates[best]] if similarities[best] >= self.threshold else None
+
+    @property
+    def vectors(self):
+        return self._vectors[:len(self.texts)] if self._vectors is not None else np.zeros((0, 0), dtype=np.float32)
+
+    def add(self, vector, keys, text):
+        row = len(self.texts)
+        if self._vectors is None:
+            self._vectors = np.empty((16, len(vector)), dtype=np.float32)
+        elif row == len(self._vectors):
+            self._vectors = np.concatenate([self._vectors, np.empty_like(self._vectors)])
+        self._vectors[row] = vector
+        self.texts.append(text)
+        for key in keys.tolist():
+            self._buckets.setdefault(key, []).append(row)
+
+
+class QuestionHistory:
+    """
+    Questions issued for each corpus, with their embeddings and LSH band keys.
+
+    Entries older than `ttl` are dropped, and beyond `max_per_corpus` questions
+    of a corpus the oldest go first.
+
+    Args:
+        path (str): Path of the SQLite file.
+        threshold (float): Minimum cosine similarity of a duplicate.
+        max_per_corpus (int): Questions kept per corpus and embedding model.
+        ttl (float): Seconds after which an issued question is forgotten.
+    """
+
+    def __init__(self, path, threshold=DUPLICATE_SIMILARITY, max_per_corpus=HISTORY_MAX_PER_CORPUS, ttl=HISTORY_TTL):
+        self.path = path
+        self.threshold = threshold
+        self.max_per_corpus = max_per_corpus
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS issued (
+                    id INTEGER PRIMARY KEY,
+                    corpus TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    created_at REAL NOT NULL
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS issued_keys (
+                    corpus TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    key INTEGER NOT NULL,
+                    issued_id INTEGER NOT NULL
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS centers (
+                    corpus TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    PRIMARY KEY (corpus, model)
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS issued_corpus ON issued (corpus, model, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS issued_keys_lookup ON issued_keys (corpus, model, key)")
+            conn.execute("CREATE INDEX IF NOT EXISTS issued_keys_entry ON issued_keys (issued_id)")
+
+    def center(self, corpus, model, proposed):
+        """
+        Return the LSH center of a corpus, storing `proposed` if it has none yet.
+
+        The center is kept until the corpus is cleared, so that all stored keys stay comparable.
+        """
+        proposed = np.asarray(proposed, dtype=np.float32)
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO centers (corpus, model, vector) VALUES (?, ?, ?)",
+                (corpus, model, proposed.tobytes())
+            )
+            row = conn.execute("SELECT vector FROM centers WHERE corpus = ? AND model = ?", (corpus, model)).fetchone()
+        center = np.frombuffer(row[0], dtype=np.float32)
+        return center if len(center) == len(proposed) else proposed
+
+    def find(self, corpus, model, vector, keys):
+        """
+        Return the most similar issued question of a corpus at or above the threshold, or None.
+
+        Args:
+            corpus (str): The corpus the questions were issued for.
+            model (str): The embedding model of the vectors.
+            vector (np.ndarray): Unit embedding of the new question.
+            keys (np.ndarray): Its band keys.
+        """
+        keys = keys.tolist()
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                f"""SELECT text, vector FROM issued WHERE created_at >= ? AND id IN (
+                    SELECT issued_id FROM issued_keys
+                    WHERE corpus = ? AND model = ? AND key IN ({', '.join('?' * len(keys))})
+                )""",
+                (time.time() - self.ttl, corpus, model, *keys)
+            ).fetchall()
+        if not rows:
+            return None
+        similarities = np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows]) @ vector
+        best = int(np.argmax(similarities))
+        return rows[best][0] if similarities[best] >= self.threshold else None
+
+    def add_many(self, corpus, model, texts, vectors, center=None):
+        """
+        Record questions as issued for a corpus.
+
+        Args:
+            corpus (str): The corpus the questions were issued for.
+            model (str): The embedding model of the vectors.
+            texts (list): The question texts.
+            vectors (np.ndarray): Their unit embeddings.
+            center (np.ndarray, optional): The corpus' LSH center, as returned by `center`.
+        """
+        if not texts:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        all_keys = lsh_keys(vectors, center)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            for text, vector, keys in zip(texts, vectors, all_keys):
+                issued_id = conn.execute(
+                    "INSERT INTO issued (corpus, model, text, vector, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (corpus, model, text, vector.tobytes(), now)
+                ).lastrowid
+                conn.executemany(
+                    "INSERT INTO issued_keys (corpus, model, key, issued_id) VALUES (?, ?, ?, ?)",
+                    [(corpus, model, key, issued_id) for key in keys.tolist()]
+                )
+            self._evict(conn, corpus, model, now)
+
+    def clear(self, corpus):
+        """
+        Forget the questions issued for a corpus.
+        """
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM issued_keys WHERE corpus = ?", (corpus,))
+            conn.execute("DELETE FROM issued WHERE corpus = ?", (corpus,))
+            conn.execute("DELETE FROM centers WHERE corpus = ?", (corpus,))
+
+    def count(self, corpus=None):
+        with self._lock, self._connect() as conn:
+            if corpus is None:
+                return conn.execute("SELECT COUNT(*) FROM issued").fetchone()[0]
+            return conn.execute("SELECT COUNT(*) FROM issued WHERE corpus = ?", (corpus,)).fetchone()[0]
+
+    def _evict(self, conn, corpus, model, now):
+        """Drop expired questions and the oldest ones of a corpus beyond the size limit."""
+        stale = [issued_id for (issued_id,) in conn.execute(
+            """SELECT id FROM issued WHERE created_at < ?
+            UNION SELECT id FROM (
+                SELECT id FROM issued WHERE corpus = ? AND model = ?
+                ORDER BY created_at DESC, id DESC LIMIT -1 OFFSET ?
+            )""",
+            (now - self.ttl, corpus, model, self.max_per_corpus)
+        )]
+        if stale:
+            conn.executemany("DELETE FROM issued_keys WHERE issued_id = ?", [(issued_id,) for issued_id in stale])
+            conn.executemany("DELETE FROM issued WHERE id = ?", [(issued_id,) for issued_id in stale])
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+
+class QuizDeduplicator:
+    """
+    Thread-safe near-duplicate check of one quiz's questions, against each
+    other and against the questions issued for the corpus before.
+
+    Args:
+        embeddings (Embeddings): Client that embeds the question texts.
+        history (QuestionHistory, optional): Questions issued by earlier quizzes; none if None.
+        corpus (str): The corpus the quiz is generated from.
+        model (str): Name of the embedding model, to keep the history of different models apart.
+        threshold (float): Minimum cosine similarity of a duplicate.
+        center (np.ndarray, optional): Mean chunk embedding of the corpus, the LSH center if the
+            corpus has none yet.
+    """
+
+    def __init__(self, embeddings, history=None, corpus=None, model=None, threshold=DUPLICATE_SIMILARITY, center=None):
+        self.embeddings = embeddings
+        self.history = history
+        self.corpus = corpus
+        self.model = model
+        self.index = DuplicateIndex(threshold)
+        self.duplicates = 0
+        self._proposed_center = center
+        self._center = None
+        self._lock = threading.Lock()
+
+    def admit(self, text):
+        """
+        Accept a question unless it repeats one of the quiz or of the corpus history.
+
+        Returns:
+            bool: True if the question was accepted.
+        """
+        vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+        vector /= max(float(np.linalg.norm(vector)), 1e-12)
+        keys = lsh_keys(vector, self._resolve_center(len(vector)))[0]
+        if self.history is not None and self.history.find(self.corpus, self.model, vector, keys) is not None:
+            with self._lock:
+                self.duplicates += 1
+            return False
+        with self._lock:
+            if self.index.find(vector, keys) is not None:
+                self.duplicates += 1
+                return False
+            self.index.add(vector, keys, text)
+            return True
+
+    def commit(self):
+        """
+        Record the accepted questions as issued for the corpus.
+        """
+        if self.history is None:
+            return
+        with self._lock:
+            texts, vectors = list(self.index.texts), self.index.vectors.copy()
+        if texts:
+            self.history.add_many(self.corpus, self.model, texts, vectors, self._resolve_center(vectors.shape[1]))
+
+    def _resolve_center(self, dim):
+        with self._lock:
+            if self._center is None:
+                proposed = self._proposed_center
+                if proposed is None or len(proposed) != dim:
+                    proposed = np.zeros(dim, dtype=np.float32)
+                self._center = (self.history.center(self.corpus, self.model, proposed)
+                                if self.history is not None else np.asarray(proposed, dtype=np.float32))
+            return self._center
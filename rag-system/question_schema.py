@@ -0,0 +1,343 @@
+import json
+import re
+import threading
+import time
+from collections import Counter
+
+# Structured questions. Every question type has a schema: a question and an
+# answer, plus the options "A" to "E" for multiple choice, with the answers of
+# true/false and multiple-choice questions restricted to their allowed values.
+# The schema of a batch is passed to Ollama as its output format, so the model
+# can only write well-formed JSON, and the questions are read from the stream
+# one object at a time. Each question is then normalized (answer casing, an
+# option letter written as "B)") and checked by a validator that looks for what
+# the schema cannot express: left-over template placeholders, repeated
+# options, a fill-in-the-blank question without a blank. The problems of the
+# rejected questions are fed back into the prompt that asks for them again.
+# Questions written in the numbered text format are parsed into the same
+# fields, so they are validated the same way.
+
+OPTION_LETTERS = ("A", "B", "C", "D", "E")
+MULTIPLE_CHOICE = "Multiple Choice"
+TRUE_FALSE = "True/False"
+FILL_IN_THE_BLANK = "Fill-in-the-Blank"
+MAX_FEEDBACK_PROBLEMS = 4
+
+PLACEHOLDER_PATTERN = re.compile(
+    r"\[(?:question|option|answer|correct|write|provide|problem|sentence|concept|cause|position|explanation)[^\]]*\]",
+    re.IGNORECASE
+)
+BLANK_PATTERN = re.compile(r"_{3,}")
+QUESTION_LABEL_PATTERN = re.compile(r"^[\s\-*]*question\s*:\s*", re.IGNORECASE | re.MULTILINE)
+ANSWER_LABEL_PATTERN = re.compile(r"^[\s\-*]*answer\s*:\s*", re.IGNORECASE | re.MULTILINE)
+OPTIONS_LABEL_PATTERN = re.compile(r"^[\s\-*]*options\s*:\s*$", re.IGNORECASE | re.MULTILINE)
+OPTION_LINE_PATTERN = re.compile(r"^[\s\-*]*\(?([A-E])[).:]\s+(.*\S)\s*$", re.MULTILINE)
+ANSWER_LETTER_PATTERN = re.compile(r"^(?:option\s+)?\(?([A-E])(?:[).:\s]|$)", re.IGNORECASE)
+
+
+def item_schema(question_type):
+    """
+    Return the JSON schema of one question of a type.
+    """
+    properties = {"question": {"type": "string"}}
+    if question_type == MULTIPLE_CHOICE:
+        properties["options"] = {
+            "type": "object",
+            "properties": {letter: {"type": "string"} for letter in OPTION_LETTERS},
+            "required": list(OPTION_LETTERS),
+        }
+        properties["answer"] = {"type": "string", "enum": list(OPTION_LETTERS)}
+    elif question_type == TRUE_FALSE:
+        properties["answer"] = {"type": "string", "enum": ["True", "False"]}
+    else:
+        properties["answer"] = {"type": "string"}
+    return {"type": "object", "properties": properties, "required": list(properties)}
+
+
+def batch_schema(question_type, count):
+    """
+    Return the JSON schema of a response holding `count` questions of a type.
+    """
+    return {
+        "type": "object",
+        "properties": {
+            "questions": {"type": "array", "items": item_schema(question_type), "minItems": count, "maxItems": count}
+        },
+        "required": ["questions"],
+    }
+
+
+def describe_fields(question_type):
+    """
+    Describe the fields of a question of a type for the prompt.
+    """
+    if question_type == MULTIPLE_CHOICE:
+        return ('"question" (the question text), "options" (an object with the five options "A" to "E") '
+                'and "answer" (the letter of the correct option)')
+    if question_type == TRUE_FALSE:
+        return '"question" (the statement) and "answer" ("True" or "False")'
+    if question_type == FILL_IN_THE_BLANK:
+        return '"question" (the sentence, with ______ in place of the missing words) and "answer" (the missing words)'
+    return '"question" (the question text) and "answer" (the answer)'
+
+
+def normalize_question(question_type, item):
+    """
+    Fix harmless deviations of a generated question before it is validated.
+
+    Strings are stripped, a true/false answer gets its canonical casing, a list
+    of options is lettered, and a multiple-choice answer written as "b",
+    "B) text", "Option B" or the text of an option becomes its letter.
+
+    Returns:
+        The normalized question, or `item` itself if it is not an object.
+    """
+    if not isinstance(item, dict):
+        return item
+    item = {key: value.strip() if isinstance(value, str) else value for key, value in item.items()}
+    answer = item.get("answer")
+
+    if question_type == TRUE_FALSE and isinstance(answer, str):
+        word = answer.rstrip(".!").lower()
+        if word in ("true", "false"):
+            item["answer"] = word.capitalize()
+
+    elif question_type == MULTIPLE_CHOICE:
+        options = item.get("options")
+        if isinstance(options, list):
+            options = dict(zip(OPTION_LETTERS, options))
+        if isinstance(options, dict):
+            options = {str(letter).strip().upper(): str(text).strip() for letter, text in options.items()}
+            item["options"] = options
+        if isinstance(answer, str):
+            match = ANSWER_LETTER_PATTERN.match(answer)
+            if match:
+                item["answer"] = match.group(1).upper()
+            elif isinstance(options, dict):
+                by_text = {text.lower(): letter for letter, text in options.items()}
+                item["answer"] = by_text.get(answer.lower(), answer)
+    return item
+
+
+def validate_question(question_type, item):
+    """
+    Check a generated question against the schema of its type.
+
+    Args:
+        question_type (str): The question type.
+        item: The question as parsed from the model output.
+
+    Returns:
+        list: Short descriptions of the problems found; empty if the question is valid.
+    """
+    if not isinstance(item, dict):
+        return ["not a complete JSON object"]
+    problems = []
+    question, answer = item.get("question"), item.get("answer")
+    if not isinstance(question, str) or not question:
+        problems.append("missing question text")
+    if not isinstance(answer, str) or not answer:
+        problems.append("missing answer")
+    if problems:
+        return problems
+
+    texts = [question, answer]
+    if question_type == MULTIPLE_CHOICE:
+        options = item.get("options")
+        if not isinstance(options, dict):
+            return ["missing options"]
+        missing = [letter for letter in OPTION_LETTERS if not options.get(letter)]
+        if missing:
+            problems.append(f"missing option {', '.join(missing)}")
+        filled = [options[letter].lower() for letter in OPTION_LETTERS if options.get(letter)]
+        if len(set(filled)) < len(filled):
+            problems.append("repeated options")
+        if answer not in OPTION_LETTERS:
+            problems.append("answer is not one of the option letters A to E")
+        texts.extend(filled)
+    elif question_type == TRUE_FALSE:
+        if answer not in ("True", "False"):
+            problems.append("answer is not True or False")
+    elif question_type == FILL_IN_THE_BLANK:
+        if not BLANK_PATTERN.search(question):
+            problems.append("no ______ blank in the sentence")
+
+    if any(PLACEHOLDER_PATTERN.search(text) for text in texts):
+        problems.append("template placeholder left in the text")
+    return problems
+
+
+def format_question(question_type, item):
+    """
+    Write a valid question in the text format of the quiz documents.
+    """
+    lines = [f"- Question: {item['question']}"]
+    if question_type == MULTIPLE_CHOICE:
+        lines.append("    Options:")
+        lines.extend(f"        {letter}) {item['options'][letter]}" for letter in OPTION_LETTERS)
+        lines.append(f"- Answer: {item['answer']}) {item['options'][item['answer']]}")
+    else:
+        lines.append(f"- Answer: {item['answer']}")
+    return "\n".join(lines)
+
+
+def parse_text_question(question_type, text):
+    """
+    Read the fields of a question written in the numbered text format.
+
+    Returns:
+        dict: The question, answer and (for multiple choice) options found; missing parts are left out.
+    """
+    answers = list(ANSWER_LABEL_PATTERN.finditer(text))
+    head = text[:answers[-1].start()] if answers else text
+    item = {}
+    if answers:
+        item["answer"] = text[answers[-1].end():].strip()
+
+    label = QUESTION_LABEL_PATTERN.search(head)
+    if label:
+        head = head[label.end():]
+    if question_type == MULTIPLE_CHOICE:
+        options = list(OPTION_LINE_PATTERN.finditer(head))
+        if options:
+            item["options"] = {match.group(1).upper(): match.group(2) for match in options}
+            head = head[:options[0].start()]
+        head = OPTIONS_LABEL_PATTERN.split(head)[0]
+    item["question"] = " ".join(head.split())
+    return item
+
+
+def stream_json_items(chunks):
+    """
+    Read the question objects of a streamed JSON response as soon as each is complete.
+
+    Objects directly inside an array are items, whatever the array is called,
+    so both {"questions": [...]} and a bare array are read. A single object
+    without an array is read once the stream ends.
+
+    Args:
+        chunks (iterable): Text pieces of the response.
+
+    Yields:
+        The parsed question objects, or the raw text of an object that is not valid JSON.
+    """
+    text = ""
+    position = 0
+    containers = []
+    in_string = escaped = False
+    start = start_depth = None
+    emitted = False
+    for chunk in chunks:
+        text += chunk
+        while position < len(text):
+            char = text[position]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char in "{[":
+                if char == "{" and start is None and containers and containers[-1] == "[":
+                    start, start_depth = position, len(containers)
+                containers.append(char)
+            elif char in "}]":
+                if containers:
+                    containers.pop()
+                if start is not None and len(containers) == start_depth:
+                    yield _load_object(text[start:position + 1])
+                    emitted = True
+                    start = None
+            position += 1
+
+    if start is not None:
+        # The stream ended inside an item
+        yield text[start:]
+    elif not emitted and text.strip():
+        item = _load_object(text.strip())
+        if isinstance(item, dict) and "question" in item:
+            yield item
+
+
+def _load_object(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def retry_feedback(problems):
+    """
+    Describe the most common problems of the rejected questions for the next prompt.
+
+    Args:
+        problems (list): The problem lists of the rejected questions.
+
+    Returns:
+        str: A sentence for the prompt, or an empty string if nothing was rejected.
+    """
+    counts = Counter(problem for item_problems in problems for problem in item_problems)
+    if not counts:
+        return ""
+    listed = "; ".join(problem for problem, _ in counts.most_common(MAX_FEEDBACK_PROBLEMS))
+    return f"Earlier questions for this request were rejected for these problems: {listed}. Avoid them."
+
+
+class GenerationStats:
+    """
+    Thread-safe counts of one quiz's generation: LLM calls, questions read,
+    valid questions and the problems of the rejected ones. Throughput is
+    measured in valid questions per minute since the counts were started.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.calls = 0
+        self.items = 0
+        self.valid = 0
+        self.fallbacks = 0
+        self.missing = 0
+        self.problems = Counter()
+        self._lock = threading.Lock()
+
+    def record_call(self):
+        with self._lock:
+            self.calls += 1
+
+    def record_item(self, problems):
+        with self._lock:
+            self.items += 1
+            if problems:
+                self.problems.update(problems)
+            else:
+                self.valid += 1
+
+    def record_fallback(self):
+        with self._lock:
+            self.fallbacks += 1
+
+    def record_missing(self, count):
+        with self._lock:
+            self.missing += count
+
+    def valid_per_minute(self):
+        elapsed = time.perf_counter() - self.started
+        return 60.0 * self.valid / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        """Return a one-line report of the counts."""
+        with self._lock:
+            rejected = self.items - self.valid
+            text = (f"{self.valid} valid questions of {self.items} read from {self.calls} LLM calls "
+                    f"({self.valid_per_minute():.1f} valid questions/min)")
+            if rejected:
+                reasons = ", ".join(f"{problem}: {count}" for problem, count in self.problems.most_common())
+                text += f"; {rejected} rejected ({reasons})"
+            if self.fallbacks:
+                text += f"; {self.fallbacks} single-question calls"
+            if self.missing:
+                text += f"; {self.missing} could not be generated"
+            return text
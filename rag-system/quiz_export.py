@@ -0,0 +1,584 @@
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+from datetime import datetime
+from xml.sax.saxutils import escape
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfgen import canvas
+from cache import make_key
+from question_schema import (
+    FILL_IN_THE_BLANK,
+    MULTIPLE_CHOICE,
+    OPTION_LETTERS,
+    TRUE_FALSE,
+    BLANK_PATTERN,
+    normalize_question,
+    parse_text_question
+)
+
+# Quiz exports. A generated quiz is saved once as a structured quiz file: its
+# title and, for each question, the type, difficulty, question text, options
+# and answer. Every download is rendered from that file, never from the LLM,
+# to DOCX, PDF, Moodle XML, GIFT or JSON, as the student version (questions
+# only) or the answer key (questions with their answers); the Moodle formats
+# always carry the answers, since Moodle grades with them. Renderers write
+# question by question into a file: the DOCX document is a WordprocessingML
+# part streamed into the zip package, the text formats are written as they
+# are produced, and the PDF is laid out page by page. Rendered files are kept
+# in a cache directory under the hash of the quiz content, format and version,
+# so a quiz is rendered once per format; the least recently downloaded files
+# are evicted beyond a size budget and after a maximum age.
+
+QUIZ_FILE_VERSION = 1
+# Part of every cache key: raise it when a renderer's output changes
+RENDERER_VERSION = 1
+DEFAULT_TITLE = "Generated Questions"
+STUDENT = "student"
+ANSWER_KEY = "key"
+EXPORT_VERSIONS = (STUDENT, ANSWER_KEY)
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_MAX_AGE = 7 * 24 * 60 * 60
+
+# Characters XML 1.0 does not allow, which model output occasionally contains
+INVALID_XML_PATTERN = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+GIFT_SPECIAL_PATTERN = re.compile(r"([~=#{}:\\])")
+
+
+def build_quiz(questions, title=DEFAULT_TITLE):
+    """
+    Build the structured quiz model from generated questions.
+
+    Args:
+        questions (list): (question type, difficulty, text) tuples, the text in the numbered text format.
+        title (str): The quiz title.
+
+    Returns:
+        dict: The quiz, with one entry per question holding its number, type,
+            difficulty, question, answer and (for multiple choice) options, and
+            the hash of its content.
+    """
+    entries = []
+    for number, (question_type, difficulty, text) in enumerate(questions, 1):
+        item = normalize_question(question_type, parse_text_question(question_type, text))
+        entry = {
+            "number": number,
+            "type": question_type,
+            "difficulty": difficulty,
+            "question": item.get("question") or " ".join(text.split()),
+            "answer": item.get("answer", ""),
+        }
+        if isinstance(item.get("options"), dict):
+            entry["options"] = item["options"]
+        entries.append(entry)
+    quiz = {
+        "version": QUIZ_FILE_VERSION,
+        "title": title,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "questions": entries,
+    }
+    quiz["digest"] = quiz_digest(quiz)
+    return quiz
+
+
+def write_quiz(quiz, path):
+    """
+    Save a quiz file atomically.
+    """
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(quiz, f, ensure_ascii=False, indent=1)
+    os.replace(temp_path, path)
+
+
+def read_quiz(path):
+    """
+    Load a quiz file.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def quiz_digest(quiz):
+    """
+    Hash the content of a quiz; quizzes with the same questions share their rendered files.
+
+    The hash is stored in the quiz file when it is built, so a download of an
+    already rendered file does not hash the whole quiz again.
+    """
+    if quiz.get("digest"):
+        return quiz["digest"]
+    return make_key(quiz.get("title"), quiz["questions"])
+
+
+def answer_text(entry):
+    """
+    Return the answer of a question as shown to a reader: "B) text" for multiple choice.
+    """
+    options = entry.get("options") or {}
+    answer = entry.get("answer", "")
+    if answer in options:
+        return f"{answer}) {options[answer]}"
+    return answer
+
+
+def question_label(entry):
+    """
+    Return the "(type difficulty)" label of a question.
+    """
+    return f"({entry['type']} {entry['difficulty'].capitalize()})"
+
+
+def _kind(entry):
+    # The Moodle question kind a question can be imported as
+    options = entry.get("options") or {}
+    answer = entry.get("answer", "")
+    if entry["type"] == MULTIPLE_CHOICE and len(options) >= 2 and answer in options:
+        return "multichoice"
+    if entry["type"] == TRUE_FALSE and answer in ("True", "False"):
+        return "truefalse"
+    if entry["type"] == FILL_IN_THE_BLANK and answer:
+        return "shortanswer"
+    return "essay"
+
+
+def _xml(text):
+    return escape(INVALID_XML_PATTERN.sub("", str(text)))
+
+
+def _sorted_options(entry):
+    options = entry.get("options") or {}
+    return sorted(options.items(), key=lambda option: (option[0] not in OPTION_LETTERS, option[0]))
+
+
+#--------------------------------------------------------------------------------------------#
+# DOCX
+
+W_NAMESPACE = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+    '</Types>'
+)
+DOCX_PACKAGE_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>'
+)
+DOCX_DOCUMENT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+DOCX_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    f'<w:styles xmlns:w="{W_NAMESPACE}">'
+    '<w:docDefaults><w:rPrDefault><w:rPr><w:rFonts w:ascii="Calibri" w:hAnsi="Calibri" w:cs="Calibri"/>'
+    '<w:sz w:val="22"/></w:rPr></w:rPrDefault>'
+    '<w:pPrDefault><w:pPr><w:spacing w:after="80"/></w:pPr></w:pPrDefault></w:docDefaults>'
+    '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/><w:qFormat/></w:style>'
+    '<w:style w:type="paragraph" w:styleId="Heading2"><w:name w:val="heading 2"/><w:basedOn w:val="Normal"/>'
+    '<w:next w:val="Normal"/><w:qFormat/><w:pPr><w:keepNext/><w:spacing w:before="240" w:after="120"/>'
+    '<w:outlineLvl w:val="1"/></w:pPr><w:rPr><w:b/><w:color w:val="2F5496"/><w:sz w:val="28"/></w:rPr></w:style>'
+    '</w:styles>'
+)
+# US Letter with one-inch margins, like the PDF
+DOCX_SECTION = (
+    '<w:sectPr><w:pgSz w:w="12240" w:h="15840"/>'
+    '<w:pgMar w:top="1440" w:right="1440" w:bottom="1440" w:left="1440" w:header="720" w:footer="720" w:gutter="0"/>'
+    '</w:sectPr>'
+)
+
+
+def _docx_paragraph(runs, style=None, indent=None, keep_next=False):
+    properties = ""
+    if style:
+        properties += f'<w:pStyle w:val="{style}"/>'
+    if keep_next:
+        properties += "<w:keepNext/>"
+    if indent:
+        properties += f'<w:ind w:left="{indent}"/>'
+    body = "".join(
+        f'<w:r>{"<w:rPr>" + formatting + "</w:rPr>" if formatting else ""}'
+        f'<w:t xml:space="preserve">{_xml(text)}</w:t></w:r>'
+        for text, formatting in runs
+    )
+    return f'<w:p>{"<w:pPr>" + properties + "</w:pPr>" if properties else ""}{body}</w:p>'
+
+
+def render_docx(quiz, version, out):
+    """
+    Write a quiz as a .docx package; the document part is streamed question by question.
+    """
+    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as package:
+        package.writestr("[Content_Types].xml", DOCX_CONTENT_TYPES)
+        package.writestr("_rels/.rels", DOCX_PACKAGE_RELS)
+        package.writestr("word/_rels/document.xml.rels", DOCX_DOCUMENT_RELS)
+        package.writestr("word/styles.xml", DOCX_STYLES)
+        with package.open("word/document.xml", "w") as part:
+            part.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                f'<w:document xmlns:w="{W_NAMESPACE}"><w:body>'
+            ).encode("utf-8"))
+            title = quiz.get("title") or DEFAULT_TITLE
+            if version == ANSWER_KEY:
+                title += " (Answer Key)"
+            part.write(_docx_paragraph([(title, "")], style="Heading2").encode("utf-8"))
+
+            for entry in quiz["questions"]:
+                options = _sorted_options(entry)
+                answer = version == ANSWER_KEY and entry.get("answer")
+                paragraphs = [_docx_paragraph(
+                    [(f"{entry['number']}) ", "<w:b/>"), (f"{question_label(entry)} ", '<w:i/>'),
+                     (entry["question"], "")],
+                    keep_next=bool(options or answer)
+                )]
+                for position, (option_letter, text) in enumerate(options, 1):
+                    paragraphs.append(_docx_paragraph(
+                        [(f"{option_letter}) {text}", "")], indent=720, keep_next=bool(position < len(options) or answer)
+                    ))
+                if answer:
+                    paragraphs.append(_docx_paragraph(
+                        [("Answer: ", "<w:b/>"), (answer_text(entry), "")], indent=360
+                    ))
+                part.write("".join(paragraphs).encode("utf-8"))
+
+            part.write(f"{DOCX_SECTION}</w:body></w:document>".encode("utf-8"))
+
+
+#--------------------------------------------------------------------------------------------#
+# PDF
+
+PDF_MARGIN = 72
+PDF_FONT = "Helvetica"
+PDF_BOLD_FONT = "Helvetica-Bold"
+PDF_FONT_SIZE = 11
+PDF_LINE_HEIGHT = 14
+PDF_QUESTION_GAP = 8
+
+
+class _PdfWriter:
+    """Lays out wrapped lines top to bottom, starting a numbered page when one is full."""
+
+    def __init__(self, out, title):
+        self.canvas = canvas.Canvas(out, pagesize=letter, pageCompression=1)
+        self.canvas.setTitle(title)
+        self.width, self.height = letter
+        self.text_width = self.width - 2 * PDF_MARGIN
+        self.title = title
+        self.page = 0
+        self._new_page()
+
+    def _new_page(self):
+        if self.page:
+            self.canvas.showPage()
+        self.page += 1
+        self.canvas.setFont(PDF_FONT, 8)
+        self.canvas.drawString(PDF_MARGIN, self.height - PDF_MARGIN / 2, self.title)
+        self.canvas.drawRightString(self.width - PDF_MARGIN, PDF_MARGIN / 2, f"Page {self.page}")
+        self.y = self.height - PDF_MARGIN
+
+    def block(self, lines):
+        """
+        Draw (text, font, size, indent) lines, keeping them on one page when they fit on one.
+        """
+        wrapped = []
+        for text, font, size, indent in lines:
+            for line in simpleSplit(text, font, size, self.text_width - indent) or [""]:
+                wrapped.append((line, font, size, indent))
+        needed = len(wrapped) * PDF_LINE_HEIGHT
+        if needed > self.y - PDF_MARGIN and needed <= self.height - 2 * PDF_MARGIN:
+            self._new_page()
+        for line, font, size, indent in wrapped:
+            if self.y - PDF_LINE_HEIGHT < PDF_MARGIN:
+                self._new_page()
+            self.canvas.setFont(font, size)
+            self.canvas.drawString(PDF_MARGIN + indent, self.y - size, line)
+            self.y -= PDF_LINE_HEIGHT
+        self.y -= PDF_QUESTION_GAP
+
+    def save(self):
+        self.canvas.save()
+
+
+def render_pdf(quiz, version, out):
+    """
+    Write a quiz as a paginated PDF with a title header and page numbers.
+    """
+    title = quiz.get("title") or DEFAULT_TITLE
+    if version == ANSWER_KEY:
+        title += " (Answer Key)"
+    writer = _PdfWriter(out, title)
+    writer.block([(title, PDF_BOLD_FONT, 16, 0)])
+    for entry in quiz["questions"]:
+        lines = [(f"{entry['number']}) {question_label(entry)} {entry['question']}", PDF_FONT, PDF_FONT_SIZE, 0)]
+        lines.extend((f"{option_letter}) {text}", PDF_FONT, PDF_FONT_SIZE, 24) for option_letter, text in _sorted_options(entry))
+        if version == ANSWER_KEY and entry.get("answer"):
+            lines.append((f"Answer: {answer_text(entry)}", PDF_BOLD_FONT, PDF_FONT_SIZE, 12))
+        writer.block(lines)
+    writer.save()
+
+
+#--------------------------------------------------------------------------------------------#
+# Moodle XML and GIFT
+
+def render_moodle_xml(quiz, version, out):
+    """
+    Write a quiz in Moodle XML; essay questions carry their answer as grader information.
+    """
+    out.write(b'<?xml version="1.0" encoding="UTF-8"?>\n<quiz>\n')
+    for entry in quiz["questions"]:
+        kind = _kind(entry)
+        name = f"Q{entry['number']} {entry['type']}"
+        parts = [
+            f'<question type="{kind}">',
+            f'<name><text>{_xml(name)}</text></name>',
+            f'<questiontext format="plain_text"><text>{_xml(entry["question"])}</text></questiontext>',
+            f'<tags><tag><text>{_xml(entry["difficulty"])}</text></tag></tags>',
+        ]
+        if kind == "multichoice":
+            parts.append("<single>true</single><shuffleanswers>true</shuffleanswers><answernumbering>ABCD</answernumbering>")
+            for option_letter, text in _sorted_options(entry):
+                fraction = 100 if option_letter == entry["answer"] else 0
+                parts.append(f'<answer fraction="{fraction}" format="plain_text"><text>{_xml(text)}</text></answer>')
+        elif kind == "truefalse":
+            correct = entry["answer"] == "True"
+            parts.append(f'<answer fraction="{100 if correct else 0}"><text>true</text></answer>')
+            parts.append(f'<answer fraction="{0 if correct else 100}"><text>false</text></answer>')
+        elif kind == "shortanswer":
+            parts.append(f'<answer fraction="100" format="plain_text"><text>{_xml(entry["answer"])}</text></answer>')
+        else:
+            parts.append("<responseformat>editor</responseformat>")
+            if entry.get("answer"):
+                parts.append(f'<graderinfo format="plain_text"><text>{_xml(entry["answer"])}</text></graderinfo>')
+        parts.append("</question>\n")
+        out.write("".join(parts).encode("utf-8"))
+    out.write(b"</quiz>\n")
+
+
+def _gift(text):
+    return GIFT_SPECIAL_PATTERN.sub(r"\\\1", " ".join(str(text).split()))
+
+
+def render_gift(quiz, version, out):
+    """
+    Write a quiz in Moodle's GIFT text format.
+    """
+    out.write(f"// {_gift(quiz.get('title') or DEFAULT_TITLE)}\n\n".encode("utf-8"))
+    for entry in quiz["questions"]:
+        kind = _kind(entry)
+        name = f"::Q{entry['number']} {_gift(entry['type'])}::"
+        question = entry["question"]
+        if kind == "multichoice":
+            choices = "".join(
+                f"\n\t{'=' if option_letter == entry['answer'] else '~'}{_gift(text)}" for option_letter, text in _sorted_options(entry)
+            )
+            text = f"{name} {_gift(question)} {{{choices}\n}}"
+        elif kind == "truefalse":
+            text = f"{name} {_gift(question)} {{{entry['answer'].upper()}}}"
+        elif kind == "shortanswer":
+            answer = f"{{={_gift(entry['answer'])}}}"
+            blank = BLANK_PATTERN.search(question)
+            if blank:
+                text = f"{name} {_gift(question[:blank.start()])} {answer} {_gift(question[blank.end():])}".rstrip()
+            else:
+                text = f"{name} {_gift(question)} {answer}"
+        else:
+            feedback = f"####{_gift(entry['answer'])}" if entry.get("answer") else ""
+            text = f"{name} {_gift(question)} {{{feedback}}}"
+        out.write(f"{text}\n\n".encode("utf-8"))
+
+
+#--------------------------------------------------------------------------------------------#
+# JSON
+
+def render_json(quiz, version, out):
+    """
+    Write a quiz as JSON, one question at a time; the student version leaves out the answers.
+    """
+    header = {"title": quiz.get("title") or DEFAULT_TITLE, "version": version}
+    out.write(json.dumps(header, ensure_ascii=False)[:-1].encode("utf-8"))
+    out.write(b', "questions": [')
+    for index, entry in enumerate(quiz["questions"]):
+        if version == STUDENT:
+            entry = {key: value for key, value in entry.items() if key != "answer"}
+        prefix = ",\n" if index else "\n"
+        out.write((prefix + json.dumps(entry, ensure_ascii=False)).encode("utf-8"))
+    out.write(b"\n]}\n")
+
+
+class ExportFormat:
+    """A download format: its file extension, MIME type and renderer."""
+
+    def __init__(self, extension, mimetype, render, versions=EXPORT_VERSIONS):
+        self.extension = extension
+        self.mimetype = mimetype
+        self.render = render
+        self.versions = versions
+
+
+EXPORT_FORMATS = {
+    "docx": ExportFormat(
+        ".docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document", render_docx
+    ),
+    "pdf": ExportFormat(".pdf", "application/pdf", render_pdf),
+    "moodle": ExportFormat(".xml", "application/xml", render_moodle_xml, versions=(ANSWER_KEY,)),
+    "gift": ExportFormat(".gift.txt", "text/plain; charset=utf-8", render_gift, versions=(ANSWER_KEY,)),
+    "json": ExportFormat(".json", "application/json", render_json),
+}
+
+
+class ExportCache:
+    """
+    Rendered quiz files, kept under the hash of what they were rendered from.
+
+    A file is rendered into a temporary name and moved into place, so readers
+    never see a partial file and concurrent renders of the same export are
+    harmless. Each download refreshes the file's modification time, which
+    orders the eviction of the least recently downloaded files.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, quiz, export_format, version):
+        """
+        Return the path of a rendered export, rendering it if it is not cached.
+
+        Args:
+            quiz (dict): The quiz.
+            export_format (str): A key of EXPORT_FORMATS.
+            version (str): STUDENT or ANSWER_KEY; formats with a single version ignore it.
+
+        Returns:
+            str: The path of the rendered file.
+        """
+        spec = EXPORT_FORMATS[export_format]
+        if version not in spec.versions:
+            version = spec.versions[0]
+        key = make_key(RENDERER_VERSION, quiz_digest(quiz), export_format, version)
+        path = os.path.join(self.directory, f"{key}{spec.extension}")
+        try:
+            os.utime(path)
+            with self._lock:
+                self.hits += 1
+            return path
+        except FileNotFoundError:
+            pass
+
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temp_path, "wb") as out:
+                spec.render(quiz, version, out)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        with self._lock:
+            self.misses += 1
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        """
+        Remove files older than the maximum age, then the least recently
+        downloaded ones until the cache fits its size budget.
+
+        Args:
+            keep (str, optional): A path that is never removed, such as the file about to be sent.
+        """
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.is_file()]
+        except FileNotFoundError:
+            return
+        now = time.time()
+        files = []
+        for entry in entries:
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for modified, size, path in files:
+            if path == keep:
+                continue
+            if now - modified <= self.max_age and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        """Return the hit and miss counts and the size of the cache."""
+        try:
+            files = [entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file()]
+        except FileNotFoundError:
+            files = []
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "files": len(files), "bytes": sum(files)}
+
+
+def evict_quiz_folders(directory, max_bytes, max_age, keep=None, exclude=()):
+    """
+    Remove the quiz folders in `directory` that have not been used for
+    `max_age` seconds, then the least recently used ones until the folders
+    fit `max_bytes`. A folder was last used when its newest file was written
+    or downloaded.
+
+    Args:
+        directory (str): The folder holding one folder per quiz.
+        max_bytes (int): Total size the quiz folders may take.
+        max_age (float): Seconds after its last use a folder is removed.
+        keep (str, optional): A folder that is never removed, such as the one just written.
+        exclude (tuple): Folders in `directory` that are not quiz folders, such as the export cache.
+    """
+    excluded = {os.path.abspath(path) for path in exclude}
+    try:
+        entries = [entry for entry in os.scandir(directory)
+                   if entry.is_dir() and os.path.abspath(entry.path) not in excluded]
+    except FileNotFoundError:
+        return
+    folders = []
+    for entry in entries:
+        try:
+            stats = [item.stat() for item in os.scandir(entry.path) if item.is_file()]
+        except FileNotFoundError:
+            continue
+        used = max((stat.st_mtime for stat in stats), default=0.0)
+        folders.append((used, sum(stat.st_size for stat in stats), entry.path))
+    folders.sort()
+    now = time.time()
+    total = sum(size for _, size, _ in folders)
+    for used, size, path in folders:
+        if keep and os.path.abspath(path) == os.path.abspath(keep):
+            continue
+        if now - used <= max_age and total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
@@ -0,0 +1,154 @@
+from lexical_index import tokenize
+
+# Hybrid retrieval. The dense results of the vector store and the BM25 results
+# of the collection's lexical index are fused by reciprocal rank fusion (RRF),
+# which only looks at ranks and so needs no calibration between cosine
+# distances and BM25 scores. Exact terms such as names, numbers and jargon are
+# found by BM25 even when the embedding blurs them, and paraphrases by the
+# dense search. A reranker may then reorder the fused candidates: "overlap"
+# scores them by the rare query terms and phrases they contain, on the CPU in
+# a few milliseconds; a cross-encoder model name uses the
+# `sentence-transformers` package if installed.
+
+RRF_K = 60
+FETCH_K = 20
+OVERLAP_WEIGHT = 0.3
+PHRASE_WEIGHT = 0.25
+
+
+def hybrid_search(db, lexical_index, query, k=4, fetch_k=FETCH_K, rrf_k=RRF_K, reranker=None):
+    """
+    Retrieve chunks for a query by fusing dense and BM25 rankings.
+
+    Args:
+        db (VectorStore): The vector store of the collection.
+        lexical_index (LexicalIndex, optional): Its BM25 index; dense search alone if None.
+        query (str): The query text.
+        k (int): Chunks to return.
+        fetch_k (int): Candidates taken from each ranking.
+        rrf_k (int): RRF constant; larger values flatten the weight of the top ranks.
+        reranker (optional): Reorders the fused candidates, e.g. from `load_reranker`.
+
+    Returns:
+        list: (Document, fused score) pairs, best first.
+    """
+    fetch_k = max(fetch_k, k)
+    rankings = [[document for document, _ in db.similarity_search_with_score(query, k=fetch_k)]]
+    if lexical_index is not None:
+        rankings.append([document for document, _ in lexical_index.search(query, k=fetch_k)])
+    fused = reciprocal_rank_fusion(rankings, rrf_k=rrf_k)
+    if reranker is not None and fused:
+        fused = reranker.rerank(query, fused, lexical_index=lexical_index)
+    return fused[:k]
+
+
+def reciprocal_rank_fusion(rankings, rrf_k=RRF_K):
+    """
+    Fuse ranked lists of documents by the sum of 1 / (rrf_k + rank) over the lists.
+
+    Documents are matched by id, falling back to their text.
+
+    Returns:
+        list: (Document, fused score) pairs, best first.
+    """
+    scores, documents = {}, {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking, start=1):
+            key = document_key(document)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            documents.setdefault(key, document)
+    return sorted(((documents[key], score) for key, score in scores.items()), key=lambda item: -item[1])
+
+
+def document_key(document):
+    return getattr(document, "id", None) or document.metadata.get("id") or document.page_content
+
+
+class OverlapReranker:
+    """
+    Rerank candidates by the IDF-weighted share of query terms they contain
+    and the share of the query's adjacent term pairs they contain as phrases,
+    blended with their fused score. Only terms the lexical index scores count,
+    so a query made of common words leaves the fused order as it is.
+
+    Args:
+        lexical_index (LexicalIndex, optional): Source of term IDF; terms weigh the same if None.
+        weight (float): Weight of the overlap score against the normalized fused score.
+        phrase_weight (float): Weight of the phrase share within the overlap score.
+    """
+
+    def __init__(self, lexical_index=None, weight=OVERLAP_WEIGHT, phrase_weight=PHRASE_WEIGHT):
+        self.lexical_index = lexical_index
+        self.weight = weight
+        self.phrase_weight = phrase_weight
+
+    def rerank(self, query, candidates, lexical_index=None):
+        query_terms = tokenize(query)
+        if not query_terms:
+            return candidates
+        index = lexical_index or self.lexical_index
+        if index is not None:
+            # Terms found in no chunk, or in many, cannot tell the candidates apart
+            weights = index.idf(query_terms)
+        else:
+            weights = dict.fromkeys(query_terms, 1.0)
+        if not weights:
+            return candidates
+        total_weight = sum(weights.values())
+        query_pairs = {pair for pair in zip(query_terms, query_terms[1:]) if pair[0] in weights or pair[1] in weights}
+        top_score, low_score = candidates[0][1], candidates[-1][1]
+        spread = (top_score - low_score) or 1.0
+
+        phrases = [f" {first} {second} " for first, second in query_pairs]
+
+        reranked = []
+        for document, score in candidates:
+            terms = tokenize(document.page_content)
+            present = set(terms)
+            overlap = sum(weight for term, weight in weights.items() if term in present) / total_weight
+            if phrases:
+                text = f" {' '.join(terms)} "
+                found = sum(phrase in text for phrase in phrases) / len(phrases)
+                overlap = (1 - self.phrase_weight) * overlap + self.phrase_weight * found
+            reranked.append((document, (1 - self.weight) * (score - low_score) / spread + self.weight * overlap))
+        return sorted(reranked, key=lambda item: -item[1])
+
+
+class CrossEncoderReranker:
+    """
+    Rerank candidates with a cross-encoder model scoring each (query, text) pair.
+
+    Args:
+        model_name (str): A `sentence-transformers` cross-encoder, e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2".
+    """
+
+    def __init__(self, model_name):
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name, device="cpu")
+
+    def rerank(self, query, candidates, lexical_index=None):
+        scores = self.model.predict([(query, document.page_content) for document, _ in candidates])
+        return sorted(((document, float(score)) for (document, _), score in zip(candidates, scores)),
+                      key=lambda item: -item[1])
+
+
+def load_reranker(name):
+    """
+    Return the reranker configured by name.
+
+    Args:
+        name (str, optional): None for no reranking, "overlap", or a cross-encoder model name.
+            A cross-encoder needs the `sentence-transformers` package; without it, "overlap" is used.
+
+    Returns:
+        The reranker, or None.
+    """
+    if not name:
+        return None
+    if name == "overlap":
+        return OverlapReranker()
+    try:
+        return CrossEncoderReranker(name)
+    except ImportError:
+        print("The 'sentence-transformers' package is not installed; reranking by term overlap instead.")
+        return OverlapReranker()
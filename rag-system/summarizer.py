@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Hierarchical map-reduce summarizer. Chunks are packed into groups that fit a
+# token budget, each group is summarized in parallel (map), and the partial
+# summaries are reduced level by level until one prompt fits the budget.
+# Every LLM call is cached by the hash of its input, so re-running on an
+# unchanged corpus makes no LLM calls at all.
+
+TOKEN_BUDGET = 3000
+MAX_WORKERS = 4
+MAX_CACHE_ENTRIES = 5000
+CHARS_PER_TOKEN = 4
+
+MAP_PROMPT = "Summarize the following content in 3 sentences, keeping the key facts and terms:\n\n{content}"
+REDUCE_PROMPT = "Summarize the following content in 5 sentences:\n\n{content}"
+SEPARATOR = "\n\n---\n\n"
+
+
+class SummaryCache:
+    """
+    Thread-safe, size-bounded summary cache persisted as a JSON file.
+
+    Entries are kept in least-recently-used order; the oldest ones are
+    dropped once the cache holds more than `max_entries` summaries.
+    """
+
+    def __init__(self, path, max_entries=MAX_CACHE_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = self._load()
+        self._dirty = False
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.pop(key, None)
+            if value is not None:
+                self._entries[key] = value
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+
+def summarize_documents(llm, documents, cache, token_budget=TOKEN_BUDGET, max_workers=MAX_WORKERS):
+    """
+    Summarize documents of any size into a 5-sentence summary.
+
+    Args:
+        llm (OllamaLLM): The model used for every map and reduce call.
+        documents (list): Chunk texts, in a stable order.
+        cache (SummaryCache): Cache of partial and final summaries.
+        token_budget (int): Maximum estimated tokens of content per LLM call.
+        max_workers (int): Number of map calls run in parallel.
+
+    Returns:
+        str: The final summary.
+    """
+    model_name = getattr(llm, "model", "")
+    texts = [text for text in documents if text and text.strip()]
+    if not texts:
+        return ""
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            previous_count = None
+            while True:
+                groups = group_by_budget(texts, token_budget)
+                if previous_count is not None and len(groups) >= previous_count:
+                    # Partial summaries too long to combine; halve them so that pairs fit
+                    half = token_budget * CHARS_PER_TOKEN // 2 - CHARS_PER_TOKEN
+                    groups = group_by_budget([text[:half] for text in texts], token_budget)
+                if len(groups) == 1:
+                    return _cached_invoke(llm, model_name, cache, REDUCE_PROMPT, groups[0])
+                previous_count = len(groups)
+
+                # Map: summarize each group in parallel, then reduce the partials
+                texts = list(executor.map(
+                    lambda group: _cached_invoke(llm, model_name, cache, MAP_PROMPT, group),
+                    groups
+                ))
+    finally:
+        cache.save()
+
+
+def group_by_budget(texts, token_budget):
+    """
+    Pack consecutive texts into groups whose estimated size fits the budget.
+
+    A single text larger than the budget is truncated to fit on its own.
+    """
+    max_chars = token_budget * CHARS_PER_TOKEN
+    groups = []
+    current = []
+    current_tokens = 0
+
+    for text in texts:
+        if estimate_tokens(text) > token_budget:
+            text = text[:max_chars]
+        tokens = estimate_tokens(text)
+        if current and current_tokens + tokens > token_budget:
+            groups.append(current)
+            current = []
+            current_tokens = 0
+        current.append(text)
+        current_tokens += tokens
+
+    if current:
+        groups.append(current)
+    return groups
+
+
+def estimate_tokens(text):
+    """
+    Cheaply estimate the number of model tokens in a text.
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def natural_sort_key(chunk_id):
+    """
+    Sort key that orders 'file.pdf:10:0' after 'file.pdf:9:3'.
+    """
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", chunk_id or "")]
+
+
+def _cached_invoke(llm, model_name, cache, prompt_template, group):
+    """Summarize one group of texts, reusing a cached summary of identical input."""
+    key_source = "\0".join([model_name, prompt_template] + [_text_hash(text) for text in group])
+    key = _text_hash(key_source)
+
+    summary = cache.get(key)
+    if summary is None:
+        prompt = prompt_template.format(content=SEPARATOR.join(group))
+        summary = llm.invoke(prompt).strip()
+        cache.put(key, summary)
+    return summary
+
+
+def _text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
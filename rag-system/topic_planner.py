@@ -0,0 +1,229 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Topic-coverage planner for quizzes. The chunk embeddings of a corpus are
+# clustered once into topics with spherical k-means, and each topic is
+# weighted by its share of the corpus text. The questions of a quiz are
+# apportioned to the topics in proportion to their weight, in an order that
+# interleaves them, so the questions of one bucket (a question type and
+# difficulty) land on different topics. The context of each question then
+# comes from its own topic: the chunk of that topic most relevant to the
+# bucket's query that no other question of the quiz has used yet.
+
+MAX_TOPICS = 32
+MIN_CHUNKS_PER_TOPIC = 3
+KMEANS_ITERATIONS = 25
+KMEANS_SAMPLE_SIZE = 20000
+MAX_CACHED_PLANS = 8
+
+
+def spherical_kmeans(vectors, n_clusters, iterations=KMEANS_ITERATIONS, seed=0, sample_size=KMEANS_SAMPLE_SIZE):
+    """
+    Cluster unit vectors by cosine similarity.
+
+    Centroids are seeded with k-means++ and refined until no vector changes
+    cluster or `iterations` rounds have run. Past `sample_size` vectors, the
+    centroids are fitted on a random sample and every vector is then assigned
+    to its nearest one.
+
+    Args:
+        vectors (np.ndarray): Unit vectors, one per row.
+        n_clusters (int): Number of clusters; at most the number of vectors.
+        iterations (int): Maximum refinement rounds.
+        seed (int): Seed of the random seeding, so that a corpus always gets the same clusters.
+        sample_size (int): Maximum vectors the centroids are fitted on.
+
+    Returns:
+        tuple: The cluster of every vector and the unit centroids.
+    """
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample_size:
+        sample = vectors[np.sort(rng.choice(len(vectors), size=sample_size, replace=False))]
+        _, centroids = spherical_kmeans(sample, n_clusters, iterations, seed, sample_size)
+        return np.argmax(vectors @ centroids.T, axis=1), centroids
+
+    count = len(vectors)
+    centroids = np.empty((n_clusters, vectors.shape[1]), dtype=np.float32)
+    centroids[0] = vectors[rng.integers(count)]
+    # Cosine distance of every vector to its nearest centroid so far
+    distances = 1.0 - vectors @ centroids[0]
+    for index in range(1, n_clusters):
+        weights = np.maximum(distances, 0.0) ** 2
+        total = weights.sum()
+        choice = rng.choice(count, p=weights / total) if total > 0 else rng.integers(count)
+        centroids[index] = vectors[choice]
+        distances = np.minimum(distances, 1.0 - vectors @ centroids[index])
+
+    labels = None
+    for _ in range(iterations):
+        new_labels = np.argmax(vectors @ centroids.T, axis=1)
+        if labels is not None and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        # Sum of each cluster's vectors as one matrix product with the one-hot labels
+        sums = (np.arange(n_clusters)[:, None] == labels).astype(np.float32) @ vectors
+        # An emptied cluster restarts at the vector farthest from its centroid
+        empty = np.flatnonzero(np.bincount(labels, minlength=n_clusters) == 0)
+        if len(empty):
+            similarity = np.einsum("ij,ij->i", vectors, centroids[labels])
+            sums[empty] = vectors[np.argsort(similarity)[:len(empty)]]
+        centroids = _normalize(sums)
+    return labels, centroids
+
+
+def apportion(weights, seats):
+    """
+    Divide seats among parties in proportion to their weights (Sainte-Laguë).
+
+    Seats are handed out one at a time to the party with the highest
+    weight / (2 * seats won + 1), so every prefix of the result is itself
+    close to proportional and small parties come up between large ones.
+
+    Returns:
+        list: The party of each seat, in the order they were handed out.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    won = np.zeros(len(weights))
+    order = []
+    for _ in range(seats):
+        party = int(np.argmax(weights / (2 * won + 1)))
+        order.append(party)
+        won[party] += 1
+    return order
+
+
+class TopicPlan:
+    """
+    Topics of one corpus: the cluster of every chunk and the weight of every cluster.
+
+    Args:
+        texts (list): The chunk texts.
+        vectors (np.ndarray): Their unit embeddings, one per row.
+        labels (np.ndarray): The topic of each chunk.
+        n_topics (int): Number of topics.
+    """
+
+    def __init__(self, texts, vectors, labels, n_topics):
+        self.texts = texts
+        self.vectors = vectors
+        self.labels = labels
+        self.n_topics = n_topics
+        lengths = np.array([len(text) for text in texts], dtype=np.float64)
+        self.weights = np.bincount(labels, weights=lengths, minlength=n_topics) / max(lengths.sum(), 1.0)
+        self.members = [np.flatnonzero(labels == topic) for topic in range(n_topics)]
+        # Mean chunk embedding, the direction all embeddings of the corpus share
+        self.center = vectors.mean(axis=0)
+
+    def start_quiz(self, total_questions):
+        """
+        Apportion the questions of a quiz to topics.
+
+        Returns:
+            QuizCoverage: The topic of each question and the chunks used so far.
+        """
+        return QuizCoverage(self, apportion(self.weights, total_questions))
+
+
+class QuizCoverage:
+    """
+    Thread-safe topic assignment of the questions of one quiz.
+    """
+
+    def __init__(self, plan, topics):
+        self.plan = plan
+        self.question_topics = topics
+        self._used = set()
+        self._lock = threading.Lock()
+
+    def topics(self, offset, count):
+        """Return the topics of questions offset to offset + count - 1."""
+        return self.question_topics[offset:offset + count]
+
+    def contexts(self, query_vector, topics):
+        """
+        Pick one chunk per topic: the one most similar to the query that the quiz has not used yet.
+
+        A topic whose chunks are all used gives its most similar chunk again.
+
+        Args:
+            query_vector (list): Embedding of the query the questions are written for.
+            topics (list): Topics to pick from, in order.
+
+        Returns:
+            list: The text of the chunk picked for each topic.
+        """
+        plan = self.plan
+        query_vector = _normalize(np.asarray([query_vector], dtype=np.float32))[0]
+        texts = []
+        with self._lock:
+            for topic in topics:
+                members = plan.members[topic]
+                ranked = members[np.argsort(-(plan.vectors[members] @ query_vector))]
+                chunk = next((int(row) for row in ranked if int(row) not in self._used), int(ranked[0]))
+                self._used.add(chunk)
+                texts.append(plan.texts[chunk])
+        return texts
+
+
+class TopicPlanner:
+    """
+    Build and cache the topic plan of each corpus.
+
+    Args:
+        max_topics (int): Maximum number of topics of a corpus.
+        min_chunks_per_topic (int): Average chunks per topic below which fewer topics are made.
+        max_plans (int): Plans kept in memory, least recently used first out.
+    """
+
+    def __init__(self, max_topics=MAX_TOPICS, min_chunks_per_topic=MIN_CHUNKS_PER_TOPIC, max_plans=MAX_CACHED_PLANS):
+        self.max_topics = max_topics
+        self.min_chunks_per_topic = min_chunks_per_topic
+        self.max_plans = max_plans
+        self._lock = threading.Lock()
+        self._plans = OrderedDict()
+
+    def plan(self, db, fingerprint):
+        """
+        Return the topic plan of a collection, clustering its chunks on first use.
+
+        Args:
+            db (VectorStore): The vector store of the corpus.
+            fingerprint (str): Content fingerprint of the corpus; a changed corpus is clustered again.
+
+        Returns:
+            TopicPlan: The plan, or None if the collection is empty.
+        """
+        key = (db.name, fingerprint)
+        with self._lock:
+            if key in self._plans:
+                self._plans.move_to_end(key)
+                return self._plans[key]
+
+            _, texts, vectors = db.get_vectors()
+            plan = None
+            if len(texts):
+                vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+                n_topics = max(1, min(self.max_topics, len(texts) // self.min_chunks_per_topic))
+                labels, _ = spherical_kmeans(vectors, n_topics)
+                plan = TopicPlan(texts, vectors, labels, n_topics)
+                print(f"Planned {n_topics} topics over {len(texts)} chunks of '{db.name}'.")
+
+            self._plans[key] = plan
+            while len(self._plans) > self.max_plans:
+                self._plans.popitem(last=False)
+            return plan
+
+    def clear(self, collection=None):
+        """Drop the cached plans of one collection, or of all collections."""
+        with self._lock:
+            if collection is None:
+                self._plans.clear()
+            else:
+                for key in [key for key in self._plans if key[0] == collection]:
+                    del self._plans[key]
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
@@ -0,0 +1,109 @@
+import html
+import re
+
+# Linear-time normalization of caption text. Caption segments are cleaned one
+# at a time as they stream in, sentences are joined by collecting their parts
+# in a list, and wrapping keeps a running line length, so the cost grows with
+# the transcript length even when auto-generated captions have no punctuation.
+
+SOUND_TAG_PATTERN = re.compile(r"\[[^\]]{0,40}\]")
+SENTENCE_ENDINGS = ".!?"
+
+
+def normalize_text(text):
+    """
+    Normalize one caption: decode HTML entities, drop sound tags such as
+    "[Music]" and collapse whitespace.
+    """
+    if "&" in text:
+        text = html.unescape(text)
+    if "[" in text:
+        text = SOUND_TAG_PATTERN.sub(" ", text)
+    return " ".join(text.split())
+
+
+def normalize_segments(segments):
+    """
+    Normalize caption segments as they are read, skipping empty ones.
+
+    Args:
+        segments (iterable): Dicts with "text", "start" and "duration".
+
+    Yields:
+        dict: The segments with normalized, non-empty text.
+    """
+    for segment in segments:
+        text = normalize_text(segment["text"])
+        if text:
+            yield {**segment, "text": text}
+
+
+def join_sentences(lines):
+    """
+    Join caption lines into sentences, ending one at every line that ends with ".", "!" or "?".
+
+    Args:
+        lines (iterable): Caption lines.
+
+    Yields:
+        str: The sentences; trailing text without end punctuation is yielded last.
+    """
+    parts = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        parts.append(line)
+        if line[-1] in SENTENCE_ENDINGS:
+            yield " ".join(parts)
+            parts = []
+    if parts:
+        yield " ".join(parts)
+
+
+def wrap_line(sentence, max_length):
+    """
+    Wrap a single sentence into multiple lines without splitting words.
+
+    Args:
+        sentence (str): The sentence to wrap.
+        max_length (int): The maximum number of characters per line.
+
+    Returns:
+        list: A list of lines, each with a maximum length of `max_length`.
+    """
+    lines = []
+    current_line = []
+    current_length = 0
+
+    for word in sentence.split():
+        # Length of the line with the word and a separating space
+        if current_line and current_length + 1 + len(word) > max_length:
+            lines.append(" ".join(current_line))
+            current_line, current_length = [word], len(word)
+        else:
+            current_length += len(word) + (1 if current_line else 0)
+            current_line.append(word)
+
+    if current_line:
+        lines.append(" ".join(current_line))
+
+    return lines
+
+
+def clean_transcript(transcript, max_line_length=80):
+    """
+    Clean the YouTube transcript by removing unnecessary newlines
+    and formatting sentences to avoid line overflow.
+
+    Args:
+        transcript (str): The raw transcript text.
+        max_line_length (int): The maximum number of characters per line.
+
+    Returns:
+        str: A cleaned transcript with properly formatted lines.
+    """
+    cleaned_lines = []
+    for sentence in join_sentences(transcript.splitlines()):
+        cleaned_lines.extend(wrap_line(sentence, max_line_length))
+    return "\n".join(cleaned_lines)
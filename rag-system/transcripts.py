@@ -0,0 +1,132 @@
+import json
+import os
+import re
+from langchain.schema.document import Document
+from transcript_normalizer import normalize_segments
+
+# YouTube transcripts as ingestion sources. A transcript is stored as JSON
+# caption segments (text, start, duration) in a ".transcript" file that the
+# ingestion engine loads like any other upload, turning runs of segments into
+# text documents that keep their start and end timestamps. Fetched transcripts
+# are also cached per video and language so that a re-submitted URL is served
+# from disk.
+
+TRANSCRIPT_EXTENSION = ".transcript"
+BLOCK_SIZE = 1200
+VIDEO_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{11}$")
+
+
+class TranscriptCache:
+    """
+    On-disk cache of fetched transcripts, one JSON file per video and language.
+
+    Args:
+        directory (str): Directory of the cache files.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def get(self, video_id, language):
+        """
+        Return the cached caption segments of a video, or None.
+        """
+        path = self._path(video_id, language)
+        if not os.path.exists(path):
+            return None
+        return read_transcript(path)["segments"]
+
+    def put(self, video_id, language, segments):
+        """
+        Store the caption segments of a video.
+        """
+        write_transcript(self._path(video_id, language), video_id, segments, language)
+
+    def _path(self, video_id, language):
+        return os.path.join(self.directory, f"{video_id}.{language}.json")
+
+
+def is_video_id(video_id):
+    """
+    Check that a string has the shape of a YouTube video ID.
+    """
+    return bool(VIDEO_ID_PATTERN.match(video_id or ""))
+
+
+def write_transcript(path, video_id, segments, language=None):
+    """
+    Atomically write caption segments as a transcript file.
+
+    Args:
+        path (str): Destination path.
+        video_id (str): The YouTube video ID.
+        segments (list): Dicts with "text", "start" and "duration".
+        language (str, optional): Language code of the captions.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"video_id": video_id, "language": language, "segments": segments}, f)
+    os.replace(tmp_path, path)
+
+
+def read_transcript(path):
+    """
+    Read a transcript file.
+
+    Returns:
+        dict: The "video_id", "language" and caption "segments".
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_transcript(file_path, block_size=BLOCK_SIZE):
+    """
+    Yield a transcript file as text documents of about `block_size` characters.
+
+    Each document joins consecutive caption segments and records the video ID
+    and the start and end of its segments in seconds, which the splitter copies
+    onto every chunk.
+
+    Yields:
+        Document: One document per block, numbered in the "page" metadata.
+    """
+    transcript = read_transcript(file_path)
+    texts, size, page, start, end = [], 0, 0, None, None
+
+    for segment in normalize_segments(transcript["segments"]):
+        text = segment["text"]
+        if start is None:
+            start = segment["start"]
+        end = segment["start"] + segment.get("duration", 0)
+        texts.append(text)
+        size += len(text) + 1
+        if size >= block_size:
+            yield _block(file_path, transcript["video_id"], texts, page, start, end)
+            texts, size, page, start = [], 0, page + 1, None
+
+    if texts:
+        yield _block(file_path, transcript["video_id"], texts, page, start, end)
+
+
+def format_timestamp(seconds):
+    """
+    Format seconds as H:MM:SS.
+    """
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def _block(file_path, video_id, texts, page, start, end):
+    return Document(
+        page_content=" ".join(texts),
+        metadata={
+            "source": file_path,
+            "page": page,
+            "video_id": video_id,
+            "start": round(start, 2),
+            "end": round(end, 2),
+            "timestamp": format_timestamp(start),
+        },
+    )
@@ -0,0 +1,76 @@
+import numpy as np
+from langchain_chroma import Chroma
+from local_store import LocalVectorStore
+
+# Vector-store backends. The RAG code uses a store through the LangChain
+# VectorStore API (similarity_search_with_score, max_marginal_relevance_search,
+# delete and embeddings) plus the methods below, so any class providing them
+# can be registered in BACKENDS and selected by name:
+#   name                 the collection name
+#   upsert_embeddings    store precomputed vectors with their ids, texts and metadata
+#   get_documents        the (id, text) pair of every entry
+#   get_vectors          the ids, texts and embedding matrix of every entry
+#   reset_collection     delete every entry
+#   delete_collection    delete the collection itself
+
+
+class ChromaStore(Chroma):
+    """
+    Chroma collection with the methods of the backend interface.
+    """
+
+    @property
+    def name(self):
+        return self._collection.name
+
+    def upsert_embeddings(self, ids, embeddings, documents, metadatas):
+        """
+        Store precomputed embeddings, replacing entries with the same ids.
+        """
+        self._collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def get_documents(self):
+        """
+        Return the (id, text) pair of every entry.
+        """
+        result = self.get(include=["documents"])
+        return list(zip(result["ids"], result["documents"]))
+
+    def get_vectors(self):
+        """
+        Return the ids, texts and embeddings (one row per entry) of every entry.
+        """
+        result = self._collection.get(include=["documents", "embeddings"])
+        if not result["ids"]:
+            return [], [], np.zeros((0, 0), dtype=np.float32)
+        return result["ids"], result["documents"], np.asarray(result["embeddings"], dtype=np.float32)
+
+
+BACKENDS = {
+    "chroma": ChromaStore,
+    "local": LocalVectorStore,
+}
+
+
+def open_vector_store(backend, collection_name, persist_directory, embeddings, **options):
+    """
+    Open a collection with a registered backend.
+
+    Args:
+        backend (str): Name of the backend in BACKENDS.
+        collection_name (str): Name of the collection.
+        persist_directory (str): Directory of the backend's data.
+        embeddings (Embeddings): Embeds texts and queries.
+        **options: Backend-specific parameters.
+
+    Returns:
+        VectorStore: The opened store.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown vector store backend '{backend}'. Available: {', '.join(BACKENDS)}.")
+    return BACKENDS[backend](
+        collection_name=collection_name,
+        persist_directory=persist_directory,
+        embedding_function=embeddings,
+        **options
+    )
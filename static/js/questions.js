@@ -6,7 +6,6 @@ document.addEventListener('DOMContentLoaded', function () {
     const questionTable = document.getElementById('questionTable');
     const processingMessage = document.getElementById('processingMessage');
     const form = document.getElementById('questionForm');
-    let progressInterval;
 
     // Reset form inputs and state
     function resetFormState() {
@@ -37,17 +36,6 @@ document.addEventListener('DOMContentLoaded', function () {
     // Attach event listeners to question inputs for validation
     questionInputs.forEach(input => input.addEventListener('input', validateTotals));
 
-    // Fetch progress updates during form processing
-    async function fetchProgress() {
-        try {
-            const response = await fetch('/progress');
-            const data = await response.json();
-            processingMessage.textContent = data.status;
-        } catch (error) {
-            console.error('Error fetching progress:', error);
-        }
-    }
-
     // Handle form submission
     form.addEventListener('submit', async (e) => {
         e.preventDefault();
@@ -61,21 +49,18 @@ document.addEventListener('DOMContentLoaded', function () {
         processingMessage.textContent = 'Generating questions...';
     
         const formData = new FormData(form);
-        progressInterval = setInterval(fetchProgress, 500);
     
         try {
             const response = await fetch(form.action, { method: 'POST', body: formData });
             const result = await response.json();
     
             if (result.success && result.redirect_url) {
-                clearInterval(progressInterval);
-                processingMessage.textContent = 'Questions generated successfully!';
-                setTimeout(() => window.location.href = result.redirect_url, 500);
+                processingMessage.textContent = 'Quiz generation started!';
+                window.location.href = result.redirect_url;
             } else {
                 throw new Error(result.error || 'An unknown error occurred.');
             }
         } catch (err) {
-            clearInterval(progressInterval);
             processingMessage.textContent = 'An error occurred. Please try again.';
             totalWarning.style.visibility = 'visible';
             totalWarning.textContent = err.message;
@@ -0,0 +1,110 @@
+document.addEventListener('DOMContentLoaded', function () {
+    const container = document.getElementById('resultsContainer');
+    const processingSection = document.getElementById('processingSection');
+    const processingMessage = document.getElementById('processingMessage');
+    const downloadSection = document.getElementById('downloadSection');
+    const failureMessage = document.getElementById('failureMessage');
+    const cancelButton = document.getElementById('cancelButton');
+    const questionList = document.getElementById('questionList');
+    const finalStatuses = ['completed', 'failed', 'cancelled'];
+    let progressSource;
+
+    function showFailure(message) {
+        processingSection.style.display = 'none';
+        failureMessage.textContent = message;
+        failureMessage.style.display = 'block';
+    }
+
+    // Show the section that matches the job status
+    function renderStatus(job) {
+        if (job.status === 'completed') {
+            processingSection.style.display = 'none';
+            downloadSection.style.display = 'block';
+        } else if (job.status === 'failed') {
+            showFailure(`Quiz generation failed: ${job.error || 'unknown error'}`);
+        } else if (job.status === 'cancelled') {
+            showFailure('Quiz generation was cancelled.');
+        } else {
+            processingSection.style.display = 'block';
+        }
+    }
+
+    // Format a progress snapshot as a status line with counts and ETA
+    function formatProgress(data) {
+        let message = data.status;
+        if (data.eta !== null) {
+            message += ` (about ${Math.ceil(data.eta)}s left)`;
+        }
+        return message;
+    }
+
+    // Fetch the job status, retrying until the job has been marked final
+    async function fetchStatus(retries = 0) {
+        try {
+            const response = await fetch(container.dataset.statusUrl);
+            const job = await response.json();
+            if (!response.ok) {
+                throw new Error(job.error || 'Job not found.');
+            }
+            renderStatus(job);
+            if (retries > 0 && !finalStatuses.includes(job.status)) {
+                setTimeout(() => fetchStatus(retries - 1), 500);
+            }
+            return job;
+        } catch (error) {
+            console.error('Error fetching job status:', error);
+            showFailure(error.message);
+        }
+    }
+
+    // Insert a generated question at its final position in the quiz
+    function addQuestion(question) {
+        const item = document.createElement('li');
+        item.dataset.number = question.number;
+
+        const label = document.createElement('span');
+        label.className = 'question-label';
+        label.textContent = `${question.number}) ${question.question_type}`;
+        item.appendChild(label);
+        item.appendChild(document.createTextNode(question.text));
+
+        const next = Array.from(questionList.children)
+            .find(existing => Number(existing.dataset.number) > question.number);
+        questionList.insertBefore(item, next || null);
+    }
+
+    // Listen for progress updates and generated questions pushed by the server
+    function listenForProgress() {
+        progressSource = new EventSource(container.dataset.progressUrl);
+        progressSource.addEventListener('question', (event) => addQuestion(JSON.parse(event.data)));
+        progressSource.onmessage = (event) => {
+            const data = JSON.parse(event.data);
+            processingMessage.textContent = formatProgress(data);
+            if (['done', 'error', 'cancelled'].includes(data.phase)) {
+                progressSource.close();
+                fetchStatus(10);
+            }
+        };
+        progressSource.onerror = (err) => console.error('Error receiving progress:', err);
+    }
+
+    cancelButton.addEventListener('click', async () => {
+        cancelButton.disabled = true;
+        try {
+            await fetch(container.dataset.cancelUrl, { method: 'POST' });
+            if (progressSource) {
+                progressSource.close();
+            }
+            await fetchStatus(10);
+        } catch (error) {
+            console.error('Error cancelling job:', error);
+            cancelButton.disabled = false;
+        }
+    });
+
+    fetchStatus().then(job => {
+        if (job && !finalStatuses.includes(job.status)) {
+            listenForProgress();
+        }
+    });
+});
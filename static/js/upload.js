@@ -57,13 +57,17 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     }
 
-    function fetchStatus() {
-        fetch('/progress')
-            .then(response => response.json())
-            .then(data => {
+    // Listen for progress updates pushed by the server
+    function listenForProgress() {
+        const source = new EventSource(form.dataset.progressUrl);
+        source.onmessage = (event) => {
+            const data = JSON.parse(event.data);
+            if (data.phase !== 'idle') {
                 processingMessage.textContent = data.status;
-            })
-            .catch(err => console.error('Error fetching progress:', err));
+            }
+        };
+        source.onerror = (err) => console.error('Error receiving progress:', err);
+        return source;
     }
 
     fileInput.addEventListener('change', () => {
@@ -89,28 +93,36 @@ document.addEventListener('DOMContentLoaded', function () {
     form.addEventListener('submit', async (e) => {
         e.preventDefault();
 
+        // Files over the upload limit would be refused by the server anyway
+        const maxBytes = Number(form.dataset.maxBytes);
+        if (fileRadio.checked && fileInput.files.length && fileInput.files[0].size > maxBytes) {
+            errorMessage.textContent = `Files are limited to ${Math.floor(maxBytes / (1024 * 1024))} MB.`;
+            errorModal.style.display = 'block';
+            return;
+        }
+
         const formData = new FormData(form);
 
         form.style.display = 'none';
         processingSection.style.display = 'block';
         processingMessage.textContent = 'Processing...';
 
-        const intervalId = setInterval(fetchStatus, 500);
+        const progressSource = listenForProgress();
 
         try {
             const response = await fetch(form.action, { method: 'POST', body: formData });
             const result = await response.json();
 
-            clearInterval(intervalId);
+            progressSource.close();
 
             if (response.ok && result.success) {
-                processingMessage.textContent = 'Processing completed successfully!';
-                setTimeout(() => window.location.href = result.redirect_url, 500);
+                processingMessage.textContent = result.processing_message || 'Processing completed successfully!';
+                setTimeout(() => window.location.href = result.redirect_url, 2000);
             } else {
                 throw new Error(result.error || 'An unknown error occurred.');
             }
         } catch (err) {
-            clearInterval(intervalId);
+            progressSource.close();
             form.style.display = 'block';
             processingSection.style.display = 'none';
             errorMessage.textContent = err.message;